@@ -0,0 +1,227 @@
+"""
+Asyncio based EDSM client.
+
+AsyncEDSMQueries runs its own event loop in a background thread and shares the
+cache, rate limiter and result delivery of an `EDSMQueries` instance. Replies
+are handed to the Tk main loop through the same `EDSM_CALLBACK_SEQUENCE` event,
+so plugins using the callback functions receive them as usual. Coroutines can
+also await the reply directly.
+
+aiohttp is used when it is installed. Without it, requests are performed with
+the `EDSMQueries` session in the loop's default executor.
+"""
+import asyncio
+import functools
+from threading import Thread
+
+from requests import RequestException
+
+from logs import get_logger
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncEDSMQueries(object):
+    """Perform EDSM queries on an asyncio event loop."""
+
+    MAX_IN_FLIGHT = 32
+
+    def __init__(self, queries):
+        """Initialize `AsyncEDSMQueries`.
+
+        :param queries: the `EDSMQueries` instance to share settings, cache, rate limiter and results with.
+        """
+
+        self.queries = queries
+        self.loop = None
+        self.thread = None
+        self._session = None
+        self._semaphore = None
+        self.logger = get_logger('async')
+
+    def start(self):
+        """Start the event loop thread."""
+
+        if self.thread is not None and self.thread.is_alive():
+            self.logger.debug("Event loop already started.")
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._run, name='edsmquery event loop')
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info("Started event loop.")
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._semaphore = asyncio.Semaphore(self.MAX_IN_FLIGHT)
+        self.loop.run_forever()
+
+    def stop(self):
+        """Stop the event loop thread. Pending requests are cancelled."""
+
+        if self.thread is None or not self.thread.is_alive():
+            return
+
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+        self.logger.info("Stopped event loop.")
+
+    async def _shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request_get(self, api, endpoint, **request_params):
+        """Perform a GET request and return the reply.
+
+        The reply is also delivered to the Tk main loop like any other reply.
+        Must be awaited on this client's event loop, see #submit_get() for other threads.
+        """
+
+        return await self._request(api, endpoint, 'GET', request_params)
+
+    async def request_post(self, api, endpoint, **data):
+        """Perform a POST request and return the reply.
+
+        See #request_get().
+        """
+
+        return await self._request(api, endpoint, 'POST', data)
+
+    def submit_get(self, api, endpoint, **request_params):
+        """Schedule a GET request from any thread.
+
+        :return: a `concurrent.futures.Future` resolving to the reply.
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.request_get(api, endpoint, **request_params), self.loop)
+
+    def submit_post(self, api, endpoint, **data):
+        """Schedule a POST request from any thread.
+
+        :return: a `concurrent.futures.Future` resolving to the reply.
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.request_post(api, endpoint, **data), self.loop)
+
+    async def _request(self, api, endpoint, method, request_params):
+        request = (api, endpoint, method, request_params)
+        cache = self.queries.cache
+        key = cache.key(*request)
+        loop = asyncio.get_running_loop()
+        # The on-disk part of the cache is only used from the default executor, never on the loop.
+        reply = cache.get(key, disk=False)
+        if reply is None:
+            reply = await loop.run_in_executor(None, cache.get, key)
+        if reply is not None:
+            self.logger.debug("Cache hit for %s/%s", api, endpoint)
+            self.queries._deliver(request, reply)
+            return reply
+
+        breaker = self.queries.breaker()
+        if not breaker.allow():
+            reply = await loop.run_in_executor(None, functools.partial(cache.get, key, stale=True, count=False))
+            self.logger.debug("EDSM is unavailable, %s %s/%s.",
+                              "serving a stale reply for" if reply else "failing", api, endpoint)
+            if reply:
+                self.queries._deliver(request, reply)
+            return reply
+
+        async with self._semaphore:
+            reply = await self._perform(api, endpoint, method, request_params)
+
+        if reply:
+            await loop.run_in_executor(None, cache.put, key, reply)
+            self.queries._deliver(request, reply)
+        else:
+            self.logger.error("Unable to perform request %s/%s", api, endpoint)
+        return reply
+
+    async def _perform(self, api, endpoint, method, request_params):
+        """Perform a request, retrying according to the retry policy of the `EDSMQueries` instance.
+
+        :return: the parsed reply or None if the request failed.
+        """
+
+        errors = (RequestException, ValueError, asyncio.TimeoutError)
+        if aiohttp is not None:
+            errors += (aiohttp.ClientError,)
+
+        attempt = 0
+        while True:
+            delay = self.queries.rateLimiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                reply = await self._http_request(api, endpoint, method, request_params)
+            except errors as err:
+                breaker = self.queries.breaker()
+                self.queries._report(breaker, err)
+                attempt += 1
+                delay = self.queries.retryPolicy.next_delay(attempt, err)
+                if delay is None:
+                    self.logger.error("HTTP error occurred: %s", err)
+                    return None
+                if breaker.state == breaker.OPEN:
+                    self.logger.error("HTTP error occurred: %s, EDSM is unavailable.", err)
+                    return None
+                self.logger.warning("HTTP error occurred: %s, retrying in %.1f seconds.", err, delay)
+                await asyncio.sleep(delay)
+            else:
+                self.queries.breaker().record_success()
+                return reply
+
+    async def _http_request(self, api, endpoint, method, request_params):
+        if aiohttp is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(self.queries._http_request, api, endpoint, method, request_params),
+            )
+
+        url = "{base}/{api}/{endpoint}".format(base=self.queries.API_BASE_URL, api=api, endpoint=endpoint)
+        self.logger.debug("request %s '%s'", method, url)
+        params = self._flatten(request_params)
+        if method == 'GET':
+            kwargs = {'params': params}
+        elif method == 'POST':
+            kwargs = {'data': params}
+        else:
+            return None
+
+        session = self._get_session()
+        timeout = aiohttp.ClientTimeout(total=self.queries.API_TIMEOUT)
+        async with session.request(method, url, timeout=timeout, **kwargs) as response:
+            self.queries.rateLimiter.update(response.headers)
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={'User-Agent': self.queries.session.headers['User-Agent']},
+            )
+        return self._session
+
+    @staticmethod
+    def _flatten(request_params):
+        """Turn request parameters into (name, value) pairs, expanding lists into repeated names."""
+
+        params = []
+        for name, value in request_params.items():
+            if isinstance(value, (list, tuple)):
+                params.extend((name, str(item)) for item in value)
+            else:
+                params.append((name, str(value)))
+        return params
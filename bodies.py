@@ -0,0 +1,216 @@
+"""
+Body bookkeeping for the scan progress of a star system.
+
+Bodies scanned in the journal and bodies known to EDSM are tracked separately
+and merged into one insertion ordered set, so membership tests stay O(1) even
+for systems with hundreds of bodies.
+
+The state of recently visited systems is kept in a size bounded LRU keyed by
+system address and, optionally, in a local `LRUStore` so it survives a
+restart of EDMarketConnector.
+"""
+from collections import OrderedDict
+
+from store import LRUStore
+
+
+class SystemBodies(object):
+    """Known bodies and the total body count of one star system."""
+
+    BELT_CLUSTER = 'belt cluster'
+
+    def __init__(self, name=None, address=None):
+        """Initialize the (empty) state of a system.
+
+        :param name: the system name.
+        :param address: the system address (`SystemAddress` in the journal, `id64` on EDSM).
+        """
+
+        self.name = name
+        self.address = address
+        self.bodyCount = 0
+        # dicts are used as insertion ordered sets.
+        self.journalBodies = dict()
+        self.edsmBodies = dict()
+        self._known = dict()
+        self._progress = None
+        self.dirty = False
+
+    def __len__(self):
+        """Return the number of known bodies."""
+
+        return len(self._known)
+
+    def __contains__(self, body_name):
+        """Return whether a body is known, either from the journal or EDSM."""
+
+        return body_name in self._known
+
+    @property
+    def bodies(self):
+        """Return the names of all known bodies, in the order they became known."""
+
+        return list(self._known)
+
+    @property
+    def progress(self):
+        """Return the percentage of known bodies, or None if the body count is unknown."""
+
+        if self._progress is None and self.bodyCount:
+            self._progress = len(self._known) * 100 / self.bodyCount
+        return self._progress
+
+    def set_body_count(self, body_count):
+        """Set the total number of bodies in the system.
+
+        :return: True if the count changed.
+        """
+
+        if body_count is None or body_count == self.bodyCount:
+            return False
+
+        self.bodyCount = body_count
+        self._progress = None
+        self.dirty = True
+        return True
+
+    def add_journal_body(self, body_name):
+        """Add a body scanned in the journal. Belt clusters are not counted as bodies.
+
+        :return: True if the body was not known yet.
+        """
+
+        if self.BELT_CLUSTER in body_name.lower():
+            return False
+        return self._add(self.journalBodies, body_name)
+
+    def add_edsm_body(self, body_name):
+        """Add a body known to EDSM.
+
+        :return: True if the body was not known yet.
+        """
+
+        return self._add(self.edsmBodies, body_name)
+
+    def _add(self, source, body_name):
+        if body_name not in source:
+            source[body_name] = None
+            self.dirty = True
+        if body_name in self._known:
+            return False
+
+        self._known[body_name] = None
+        self._progress = None
+        return True
+
+
+class SystemBodiesCache(object):
+    """Keep the `SystemBodies` of recently visited systems, keyed by system address.
+
+    Lookups hit the in-memory LRU first and fall back to the on-disk store (if one
+    has been opened). Changed systems are queued for the store when they are
+    evicted from memory, when `save()` is called and when the store is closed.
+    """
+
+    MAX_SYSTEMS = 64
+    MAX_DISK_SYSTEMS = 4096
+
+    def __init__(self, max_systems=MAX_SYSTEMS, max_disk_systems=MAX_DISK_SYSTEMS):
+        """Initialize the cache.
+
+        :param max_systems: number of systems kept in memory.
+        :param max_disk_systems: number of systems kept in the on-disk store.
+        """
+
+        self.maxSystems = max_systems
+        self._systems = OrderedDict()
+        self._addresses = dict()
+        self._store = LRUStore('systems', max_disk_systems, ('name',))
+
+    def __len__(self):
+        """Return the number of systems kept in memory."""
+
+        return len(self._systems)
+
+    def open(self, path):
+        """Open (or create) the on-disk store at `path`."""
+
+        self.close()
+        self._store.open(path)
+
+    def close(self):
+        """Save all changed systems and close the on-disk store, if any."""
+
+        self.save()
+        self._store.close()
+
+    def get(self, address, name=None):
+        """Return the state of a system, creating an empty one if it is unknown.
+
+        :param address: the system address. If None, the system is looked up by name.
+        :param name: the system name.
+        """
+
+        if address is None:
+            address = self._addresses.get(name)
+        if address is None and name is not None:
+            address = self._store.find('name', name)
+        if address is None:
+            # Nothing to key on, this state is not remembered.
+            return SystemBodies(name)
+
+        system_bodies = self._systems.get(address)
+        if system_bodies is None:
+            system_bodies = self._disk_get(address)
+        if system_bodies is None:
+            system_bodies = SystemBodies(name, address)
+        if name is not None and system_bodies.name != name:
+            system_bodies.name = name
+            system_bodies.dirty = True
+
+        self._remember(system_bodies)
+        return system_bodies
+
+    def save(self):
+        """Queue all changed systems for the on-disk store."""
+
+        for system_bodies in self._systems.values():
+            self._disk_put(system_bodies)
+
+    def _remember(self, system_bodies):
+        self._systems[system_bodies.address] = system_bodies
+        self._systems.move_to_end(system_bodies.address)
+        if system_bodies.name is not None:
+            self._addresses[system_bodies.name] = system_bodies.address
+
+        while len(self._systems) > self.maxSystems:
+            (_address, evicted_bodies) = self._systems.popitem(last=False)
+            self._addresses.pop(evicted_bodies.name, None)
+            self._disk_put(evicted_bodies)
+
+    def _disk_get(self, address):
+        row = self._store.get(address)
+        if row is None:
+            return None
+
+        (state, _expires) = row
+        system_bodies = SystemBodies(state['name'], address)
+        system_bodies.set_body_count(state['bodyCount'])
+        for body_name in state['journalBodies']:
+            system_bodies.add_journal_body(body_name)
+        for body_name in state['edsmBodies']:
+            system_bodies.add_edsm_body(body_name)
+        system_bodies.dirty = False
+        return system_bodies
+
+    def _disk_put(self, system_bodies):
+        if not self._store.is_open or not system_bodies.dirty:
+            return
+
+        self._store.put(system_bodies.address, {
+            'name': system_bodies.name,
+            'bodyCount': system_bodies.bodyCount,
+            'journalBodies': list(system_bodies.journalBodies),
+            'edsmBodies': list(system_bodies.edsmBodies),
+        }, name=system_bodies.name)
+        system_bodies.dirty = False
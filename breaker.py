@@ -0,0 +1,118 @@
+"""
+Circuit breaker for EDSM outages.
+
+After a number of consecutive failed requests the breaker opens and requests
+fail right away (or are answered with a stale reply from the cache) instead of
+each waiting for its timeout. After a while a single probe request is let
+through: if it succeeds the breaker closes again, otherwise it stays open.
+"""
+import time
+from threading import Lock
+
+from retry import RetryPolicy
+
+
+class CircuitBreaker(object):
+    """Track the health of an API and decide whether requests may be sent to it."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    FAILURE_THRESHOLD = 5
+    RESET_TIMEOUT = 30
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 clock=time.monotonic):
+        """Initialize a closed breaker.
+
+        :param name: what the breaker protects, i.e. the API base url.
+        :param failure_threshold: number of consecutive failures that opens the breaker.
+        :param reset_timeout: seconds the breaker stays open before a probe request is let through.
+        :param clock: monotonic clock, replaceable for testing.
+        """
+
+        self.name = name
+        self.failureThreshold = failure_threshold
+        self.resetTimeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.listeners = []
+        self._clock = clock
+        self._openedAt = None
+        self._probeAt = None
+        self._lock = Lock()
+
+    @staticmethod
+    def is_outage(error):
+        """Return whether an error means the API is unavailable, as opposed to a bad request."""
+
+        status = RetryPolicy.status(error)
+        if status is not None:
+            return status >= 500
+        return isinstance(error, RetryPolicy.RETRYABLE_ERRORS)
+
+    def allow(self):
+        """Return whether a request may be sent now.
+
+        While open, this returns False until the reset timeout has passed. The breaker then
+        goes half-open and lets one probe request through.
+        """
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            now = self._clock()
+            if self.state == self.OPEN:
+                if now - self._openedAt < self.resetTimeout:
+                    return False
+                self._probeAt = now
+                change = self._change(self.HALF_OPEN)
+            elif self._probeAt is not None and now - self._probeAt < self.resetTimeout:
+                # A probe is on its way.
+                return False
+            else:
+                # The probe never reported back, send another one.
+                self._probeAt = now
+                change = None
+
+        self._notify(change)
+        return True
+
+    def record_success(self):
+        """Report a request that reached the API."""
+
+        with self._lock:
+            self.failures = 0
+            self._probeAt = None
+            change = self._change(self.CLOSED)
+        self._notify(change)
+
+    def record_failure(self):
+        """Report a request that failed because the API is unavailable."""
+
+        with self._lock:
+            self.failures += 1
+            change = None
+            if self.state == self.HALF_OPEN or self.failures >= self.failureThreshold:
+                self._openedAt = self._clock()
+                self._probeAt = None
+                change = self._change(self.OPEN)
+        self._notify(change)
+
+    def _change(self, state):
+        """Switch state, returning `(previous, state)` if it changed or None."""
+
+        if self.state == state:
+            return None
+        previous = self.state
+        self.state = state
+        return previous, state
+
+    def _notify(self, change):
+        if change is None:
+            return
+        (previous, state) = change
+        for listener in list(self.listeners):
+            listener(self, previous, state)
@@ -0,0 +1,234 @@
+"""
+Response cache for EDSM queries.
+
+Replies are kept in a size bounded in-memory LRU and, optionally, in a
+local SQLite store so they survive a restart of EDMarketConnector. In memory
+they are kept as compact JSON text rather than parsed dicts, several times
+smaller; consumers decoding into `models` then hold no parsed copy at all.
+
+Memory lookups (i.e. on the Tk main loop) never wait for disk I/O of the
+workers, and stored replies are written by the store in the background, see
+`LRUStore`. Requests carrying an `apiKey` are only cached in memory.
+"""
+import json
+import time
+from collections import OrderedDict
+from threading import RLock
+
+from store import LRUStore
+
+
+class ResponseCache(object):
+    """Cache EDSM replies keyed on (api, endpoint, method, request_params).
+
+    Lookups hit the in-memory LRU first and fall back to the SQLite store
+    (if one has been opened). Each api or api/endpoint combination can have
+    its own time to live. A TTL of 0 disables caching for that combination.
+    """
+
+    DEFAULT_TTL = 600
+    MAX_ENTRIES = 256
+    MAX_DISK_ENTRIES = 4096
+    # Seconds expired replies are kept on disk, to be served while EDSM is unavailable.
+    MAX_STALE = 7 * 24 * 3600
+    # Request parameters that must not end up on disk, see persistable().
+    PRIVATE_PARAMS = ('apiKey',)
+
+    def __init__(self, max_entries=MAX_ENTRIES, default_ttl=DEFAULT_TTL, ttls=None,
+                 max_disk_entries=MAX_DISK_ENTRIES):
+        """Initialize the cache.
+
+        :param max_entries: number of replies kept in memory.
+        :param default_ttl: seconds a reply stays valid when no specific ttl is known.
+        :param ttls: dict mapping `api` or `(api, endpoint)` to a ttl in seconds.
+        :param max_disk_entries: number of replies kept in the SQLite store.
+        """
+
+        self.maxEntries = max_entries
+        self.defaultTtl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self.diskHits = 0
+        self.staleHits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        self._store = LRUStore('responses', max_disk_entries)
+
+    @staticmethod
+    def key(api, endpoint, method, request_params):
+        """Return a hashable, normalized key for a request.
+
+        Parameter order does not matter and values are compared as strings,
+        so `systemName='Sol'` queued twice always maps to the same key.
+        """
+
+        params = []
+        for name in sorted(request_params or {}):
+            value = request_params[name]
+            if isinstance(value, (list, tuple)):
+                value = tuple(str(item) for item in value)
+            else:
+                value = str(value)
+            params.append((name, value))
+
+        return api, endpoint, method.upper(), tuple(params)
+
+    def ttl(self, api, endpoint):
+        """Return the time to live for an api/endpoint combination."""
+
+        if (api, endpoint) in self.ttls:
+            return self.ttls[(api, endpoint)]
+        return self.ttls.get(api, self.defaultTtl)
+
+    def cacheable(self, key):
+        """Return whether a request can be served from (and stored in) the cache."""
+
+        (api, endpoint, method, _params) = key
+        return method == 'GET' and self.ttl(api, endpoint) > 0
+
+    def persistable(self, key):
+        """Return whether a request may be kept in the on-disk store: it carries no secrets like an api key."""
+
+        (_api, _endpoint, _method, params) = key
+        return not any(name in self.PRIVATE_PARAMS for (name, _value) in params)
+
+    def open(self, path):
+        """Open (or create) the on-disk store at `path`."""
+
+        self._store.open(path)
+        self._store.purge(time.time() - self.MAX_STALE)
+
+    def close(self):
+        """Write queued replies and close the on-disk store, if any."""
+
+        self._store.close()
+
+    def get(self, key, stale=False, disk=True, count=True):
+        """Return the cached reply for `key` or None.
+
+        :param stale: also return expired replies that have not been dropped yet, i.e. while EDSM is unavailable.
+        :param disk: also look in the on-disk store. Pass False on the Tk main loop. A miss is then not
+            counted, as the caller is expected to go on with a lookup on disk.
+        :param count: count the lookup in the hit and miss counters. Pass False when looking up a request
+            again, i.e. on a retry, so each request is counted once.
+        """
+
+        if not self.cacheable(key):
+            return None
+
+        now = time.time()
+        text = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] >= now or stale):
+                (expires, text) = entry
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                if expires < now:
+                    self.staleHits += 1
+            elif not disk:
+                return None
+            elif entry is not None:
+                # Expired replies are kept around (until evicted) for stale lookups.
+                if count:
+                    self.misses += 1
+                return None
+        if text is not None:
+            # Each hit gets a reply of its own, parsed from the compact text.
+            return json.loads(text)
+
+        entry = self._disk_get(key, now, stale)
+        if entry is None:
+            if count:
+                with self._lock:
+                    self.misses += 1
+            return None
+
+        (expires, reply) = entry
+        text = self._compact(reply)
+        with self._lock:
+            if count:
+                self.hits += 1
+            self.diskHits += 1
+            if expires < now:
+                self.staleHits += 1
+            self._remember(key, expires, text)
+        return reply
+
+    def put(self, key, reply):
+        """Store a reply."""
+
+        if reply is None or not self.cacheable(key):
+            return
+
+        (api, endpoint, _method, _params) = key
+        expires = time.time() + self.ttl(api, endpoint)
+        text = self._compact(reply)
+        with self._lock:
+            self._remember(key, expires, text)
+        self._disk_put(key, expires, reply)
+
+    def invalidate(self, key):
+        """Drop a single entry."""
+
+        with self._lock:
+            self._entries.pop(key, None)
+        self._store.delete(self._disk_key(key))
+
+    def clear(self):
+        """Drop everything from memory and disk."""
+
+        with self._lock:
+            self._entries.clear()
+        self._store.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.diskHits,
+                'stale_hits': self.staleHits,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+            }
+
+    @staticmethod
+    def _compact(reply):
+        """Return a reply as compact JSON text, a fraction of the memory of the parsed reply."""
+
+        return json.dumps(reply, separators=(',', ':'))
+
+    def _remember(self, key, expires, text):
+        self._entries[key] = (expires, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _disk_key(key):
+        return json.dumps(key, separators=(',', ':'))
+
+    def _disk_get(self, key, now, stale=False):
+        """Return `(expires, reply)` from the store, or None."""
+
+        if not self._store.is_open or not self.persistable(key):
+            return None
+
+        row = self._store.get(self._disk_key(key))
+        if row is None:
+            return None
+        (reply, expires) = row
+        if expires < now and not stale:
+            return None
+        return expires, reply
+
+    def _disk_put(self, key, expires, reply):
+        if self.persistable(key):
+            self._store.put(self._disk_key(key), reply, expires)
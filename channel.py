@@ -0,0 +1,155 @@
+"""
+Bounded result channel between the workers and the Tk main loop.
+
+Workers put replies in, the main loop drains them. When the consumer falls
+behind, the configured backpressure policy decides what happens to new
+replies: the producer blocks (worker threads only), the oldest reply is dropped, or replies are
+spilled to a temporary file and read back in order.
+
+Producers only need to wake up the consumer when `put()` says so: once the
+consumer has been signalled, further results are picked up by the same
+drain until the consumer takes something from the channel again.
+"""
+import pickle
+import tempfile
+from collections import deque
+from threading import Condition
+
+
+class ResultChannel(object):
+    """Thread-safe, bounded FIFO of results."""
+
+    POLICY_BLOCK = 'block'
+    POLICY_DROP_OLDEST = 'drop-oldest'
+    POLICY_SPILL = 'spill'
+
+    MAX_SIZE = 256
+
+    def __init__(self, maxsize=MAX_SIZE, policy=POLICY_DROP_OLDEST, interrupt_event=None):
+        """Initialize the channel.
+
+        :param maxsize: number of results kept in memory.
+        :param policy: what to do when the channel is full, one of the `POLICY_*` constants.
+        :param interrupt_event: Event that releases producers blocked by `POLICY_BLOCK`.
+        """
+
+        if policy not in (self.POLICY_BLOCK, self.POLICY_DROP_OLDEST, self.POLICY_SPILL):
+            raise ValueError("Unknown backpressure policy: {policy}".format(policy=policy))
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.spilled = 0
+        self._items = deque()
+        self._interrupt = interrupt_event
+        self._condition = Condition()
+        self._spillFile = None
+        self._spillCount = 0
+        self._spillReadOffset = 0
+        self._signalled = False
+
+    def __len__(self):
+        """Return the number of queued results, including spilled ones."""
+
+        with self._condition:
+            return len(self._items) + self._spillCount
+
+    def put(self, item, block=True):
+        """Add a result, applying the backpressure policy if the channel is full.
+
+        :param block: whether `POLICY_BLOCK` may wait for the consumer. Pass False on the consumer's own
+            thread (or any thread it waits for): the oldest result is dropped instead of deadlocking.
+        :return: True if the consumer has to be signalled. False if a signal is already
+            pending or the result was not queued (a blocked put got interrupted).
+        """
+
+        with self._condition:
+            if self.policy == self.POLICY_BLOCK and block:
+                while len(self._items) >= self.maxsize:
+                    if self._interrupt is not None and self._interrupt.is_set():
+                        return False
+                    self._condition.wait(0.1)
+            elif self.policy == self.POLICY_SPILL:
+                if self._spillCount or len(self._items) >= self.maxsize:
+                    self._spill(item)
+                    return self._signal()
+            elif len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+
+            self._items.append(item)
+            return self._signal()
+
+    def _signal(self):
+        signal = not self._signalled
+        self._signalled = True
+        return signal
+
+    def get(self):
+        """Return the oldest result or None."""
+
+        with self._condition:
+            self._signalled = False
+            if not self._items:
+                self._unspill(1)
+            if not self._items:
+                return None
+
+            item = self._items.popleft()
+            self._condition.notify()
+            return item
+
+    def drain(self, limit=None):
+        """Remove and return all queued results (or at most `limit`), oldest first."""
+
+        with self._condition:
+            self._signalled = False
+            items = []
+            while limit is None or len(items) < limit:
+                if not self._items:
+                    self._unspill(self.maxsize)
+                    if not self._items:
+                        break
+                items.append(self._items.popleft())
+            if items:
+                self._condition.notify_all()
+            return items
+
+    def clear(self):
+        """Drop all queued results."""
+
+        with self._condition:
+            self._signalled = False
+            self._items.clear()
+            self._close_spill()
+            self._condition.notify_all()
+
+    def _spill(self, item):
+        if self._spillFile is None:
+            self._spillFile = tempfile.TemporaryFile(prefix='edsmquery-')
+            self._spillReadOffset = 0
+        self._spillFile.seek(0, 2)
+        pickle.dump(item, self._spillFile, pickle.HIGHEST_PROTOCOL)
+        self._spillCount += 1
+        self.spilled += 1
+
+    def _unspill(self, count):
+        if not self._spillCount:
+            return
+
+        self._spillFile.seek(self._spillReadOffset)
+        while count > 0 and self._spillCount:
+            self._items.append(pickle.load(self._spillFile))
+            self._spillCount -= 1
+            count -= 1
+        self._spillReadOffset = self._spillFile.tell()
+
+        if not self._spillCount:
+            self._close_spill()
+
+    def _close_spill(self):
+        if self._spillFile is not None:
+            self._spillFile.close()
+            self._spillFile = None
+        self._spillCount = 0
+        self._spillReadOffset = 0
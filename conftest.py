@@ -0,0 +1,9 @@
+"""Pytest configuration: the plugin modules import each other as top level modules."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Interactive Tk application (Python 2), not a test suite.
+collect_ignore = ['test_edsmquery_ui.py']
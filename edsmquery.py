@@ -1,17 +1,35 @@
 """
 Threaded worker to manage edsm queries.
 
-The EDSMQueries helper will run in its own thread and perform
-a callback when an item on the queue is processed.
+The EDSMQueries helper runs a small pool of worker threads and performs
+a callback when an item on the queue is processed. All workers share a
+single token bucket, driven by EDSM's rate limit headers, so the pool as
+a whole stays within EDSM's rate limits.
 
 Note: By putting this in a module, EDMC will load us sooner than other plugins.
 """
+from collections import OrderedDict, deque
 from queue import Queue, Empty
 
-from threading import Thread, Event
-from requests import Session, HTTPError, ConnectionError
+import sqlite3
+import time
+import zlib
+from threading import Thread, Event, Lock, Timer, current_thread
+from requests import RequestException
 
-from fields import LOG_INFO, LOG_OUTPUT, LOG_DEBUG, LOG_ERROR, EDSM_CALLBACK_SEQUENCE
+from breaker import CircuitBreaker
+from cache import ResponseCache
+from channel import ResultChannel
+from ratelimit import TokenBucket
+from retry import RetryPolicy
+from stream import CHUNK_SIZE, iter_records, project
+from subscriptions import Subscription, SubscriptionRegistry
+from transport import Transport
+from futures import EDSMFuture, RequestError
+from galaxy import GalaxyIndex
+from fields import EDSM_CALLBACK_SEQUENCE, EDSM_RESPONSE_FIELD_NAME
+from logs import get_logger, to_logging_level, from_logging_level
+from models import decode, decode_records
 from version import VERSION as PLUGIN_VERSION
 
 
@@ -22,6 +40,14 @@ class EDSMQueries(object):
     """Handles queries to EDSM in a queued way."""
 
     THROTTLE = 5
+    THROTTLE_BURST = 3
+    WORKERS = 2
+    MAX_WORKERS = 4
+
+    # Single api-v1/system lookups queued within BATCH_WINDOW seconds are merged into one api-v1/systems request.
+    BATCH_WINDOW = 0.25
+    BATCH_SIZE = 50
+    BATCH_FLAGS = ('showId', 'showCoordinates', 'showPermit', 'showInformation', 'showPrimaryStar')
     API_TIMEOUT = 10
     API_BASE_URL = 'https://www.edsm.net'
     API_COMMANDER_V1 = 'api-commander-v1'
@@ -31,49 +57,176 @@ class EDSMQueries(object):
     API_SYSTEM_V1__BODIES = 'bodies'
 
     API_SYSTEMS_V1 = 'api-systems-v1'
+    API_V1 = 'api-v1'
+    API_V1__SYSTEM = 'system'
+    API_V1__SYSTEMS = 'systems'
     API_STATUS_V1 = 'api-status-v1'
 
+    # Queue lanes, from most to least urgent, with their share of the workers' attention.
+    PRIORITY_INTERACTIVE = 'interactive'
+    PRIORITY_BACKGROUND = 'background'
+    PRIORITY_BULK = 'bulk'
+    PRIORITY_WEIGHTS = (
+        (PRIORITY_INTERACTIVE, 4),
+        (PRIORITY_BACKGROUND, 2),
+        (PRIORITY_BULK, 1),
+    )
+    DEFAULT_PRIORITY = PRIORITY_INTERACTIVE
+
+    # Replies waiting for the Tk main loop, and what to do when it falls behind (see ResultChannel).
+    RESULT_QUEUE_SIZE = ResultChannel.MAX_SIZE
+    RESULT_QUEUE_POLICY = ResultChannel.POLICY_DROP_OLDEST
+    # Minimal number of seconds between two EDSM_CALLBACK_SEQUENCE events. Use 0 to signal right away.
+    SIGNAL_INTERVAL = 0
+
+    # Array holding the records of streamed replies (see request_stream()). Unlisted replies are the array itself.
+    STREAM_PATHS = {
+        (API_SYSTEM_V1, API_SYSTEM_V1__BODIES): 'bodies',
+        (API_SYSTEM_V1, 'stations'): 'stations',
+        (API_SYSTEM_V1, 'factions'): 'factions',
+    }
+    # Maximal number of streamed records passed to the Tk main loop at once.
+    STREAM_BATCH_SIZE = 50
+
+    # Seconds a reply may be served from the cache. Unlisted apis use ResponseCache.DEFAULT_TTL.
+    CACHE_TTLS = {
+        API_STATUS_V1: 60,
+        API_COMMANDER_V1: 300,
+        API_LOGS_V1: 0,
+        API_JOURNAL_V1: 0,
+        (API_SYSTEM_V1, API_SYSTEM_V1__BODIES): 900,
+    }
+
     def __init__(self):
         """Initialize `EDSMQueries`."""
 
-        self.queue = ClearableQueue()
-        self.resultQueue = []
+        self.queue = LaneQueue(self.PRIORITY_WEIGHTS)
+        self.cache = ResponseCache(ttls=self.CACHE_TTLS)
         self.callbackWidget = None
-        self.thread = None
-        self.session = Session()
-        self.session.headers['User-Agent'] = "EDMC-Plugin-{plugin_name}/{version}".format(
+        self.subscriptions = SubscriptionRegistry()
+        self.threads = []
+        self.workers = self.WORKERS
+        # Until EDSM reports its budget, allow a small burst and one request per THROTTLE seconds.
+        self.rateLimiter = TokenBucket(1.0 / self.THROTTLE, self.THROTTLE_BURST)
+        # Keep one connection alive per worker.
+        user_agent = "EDMC-Plugin-{plugin_name}/{version}".format(
             plugin_name='edsmquery',
             version=PLUGIN_VERSION,
         )
+        self.transport = Transport(self.API_BASE_URL, self.workers, user_agent=user_agent)
+        self.session = self.transport.session
         self.interruptEvent = Event()
-        self.logLevel = LOG_INFO
-        self.logPrefix = "edsmquery > "
+        self.resultQueue = ResultChannel(self.RESULT_QUEUE_SIZE, self.RESULT_QUEUE_POLICY, self.interruptEvent)
+        self.signalLock = Lock()
+        self.signalTimer = None
+        self.lastSignal = 0
+        # Futures whose done callbacks still have to run on the Tk main loop.
+        self.completedFutures = deque()
+        self.completedSignalled = False
+        # Other calls waiting for the Tk main loop, as (callback, args).
+        self.pendingCalls = deque()
+        # Pending or running GET requests (QueuedRequest) by cache key.
+        self.inFlight = dict()
+        self.inFlightLock = Lock()
+        self.coalesced = 0
+        # Queued requests by supersession key.
+        self.superseded = dict()
+        self.supersedeLock = Lock()
+        # Failed requests waiting to be queued again (QueuedRequest -> Timer).
+        self.retryPolicy = RetryPolicy()
+        self.retries = dict()
+        self.retryLock = Lock()
+        # Circuit breakers by API base url, and the callbacks interested in their state.
+        self.breakers = dict()
+        self.breakersLock = Lock()
+        self.breakerListeners = []
+        # Local index of the EDSM dumps answering some lookups offline, see GalaxyIndex.
+        self.galaxy = GalaxyIndex()
+        self.galaxyThread = None
+        self.logger = get_logger('queries')
+
+    @property
+    def logLevel(self):
+        """Return the log level (one of the `LOG_*` constants) of the queries logger."""
+
+        return from_logging_level(self.logger.getEffectiveLevel())
+
+    @logLevel.setter
+    def logLevel(self, level):
+        """Set the log level of the queries logger, using one of the `LOG_*` constants."""
 
-    def _log(self, level, message):
-        self.log(self.logLevel, level, self.logPrefix, message)
+        self.logger.setLevel(to_logging_level(level))
 
     @staticmethod
     def log(max_level, level, prefix, message):
-        """Print a log message.
+        """Log a message through the plugin logger.
 
-        :param max_level: max level we want to print
+        Kept for plugins that used it to print messages. `max_level` is ignored: use the
+        level of the logger instead.
+        :param max_level: unused
         :param level: level of the log message
         :param prefix: prefix to add
-        :param message: the message to print
+        :param message: the message to log
+        """
+
+        get_logger().log(to_logging_level(level), "%s%s", prefix, message)
+
+    def _init_threads(self):
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        while len(self.threads) < self.workers:
+            thread = Thread(
+                target=self.worker,
+                name='edsmquery worker {index}'.format(index=len(self.threads) + 1),
+            )
+            thread.daemon = True
+            self.threads.append(thread)
+        return self.threads
+
+    def is_running(self):
+        """Return whether any worker thread is alive."""
+
+        return any(thread.is_alive() for thread in self.threads)
+
+    def set_workers(self, workers):
+        """Change the number of worker threads.
+
+        The value is capped to `MAX_WORKERS`. Running pools are grown or
+        shrunk on the fly; surplus workers exit after their current request.
+        :param workers: the number of requests that may run in parallel.
+        """
+
+        workers = max(1, min(int(workers), self.MAX_WORKERS))
+        running = self.is_running()
+        alive = len([thread for thread in self.threads if thread.is_alive()])
+        self.workers = workers
+        if workers != self.transport.poolSize:
+            self.transport.resize(workers)
+        if not running:
+            return
+
+        if workers > alive:
+            for thread in self._init_threads():
+                if not thread.is_alive():
+                    thread.start()
+        else:
+            for _ in range(alive - workers):
+                # Retire markers skip the lanes so idle workers pick them up right away.
+                self.queue.put(None)
+
+    def apply_settings(self, settings):
+        """Apply the query related preferences of a `settings.Settings` snapshot.
+
+        Called at startup and whenever the preferences change, so settings like the
+        number of workers can be changed at runtime.
         """
-        print_level = LOG_OUTPUT.get(level, 'UNKNOWN')
-        if level <= max_level:
-            print("{prefix}{level}: {message}".format(prefix=prefix, level=print_level, message=message))
 
-    def _init_thread(self):
-        if self.thread is None:
-            self.thread = Thread(target=self.worker, name='edsmquery worker')
-            self.thread.daemon = True
-        return self.thread
+        workers = getattr(settings, 'workers', None)
+        if workers and workers != self.workers:
+            self.set_workers(workers)
 
     def start(self, callback_widget=None):
         """
-        Start the thread.
+        Start the worker threads.
 
         Parameters
         ----------
@@ -81,77 +234,499 @@ class EDSMQueries(object):
         so further processing can be done on the gui mainloop.
         """
 
-        self._log(LOG_DEBUG, "Starting thread....")
+        self.logger.debug("Starting workers....")
         if callback_widget:
             self.callbackWidget = callback_widget
 
         if self.callbackWidget is None:
-            self._log(LOG_ERROR, "Callback widget must be set before starting the thread!")
+            self.logger.error("Callback widget must be set before starting the thread!")
             return False
 
         # Reset our interrupt state
         self.interruptEvent.clear()
 
-        # Configure the thread if it does not exist yet.
-        if self.thread is None:
-            self._init_thread()
+        # Configure the threads if they do not exist yet.
+        started = 0
+        for thread in self._init_threads():
+            if not thread.is_alive():
+                thread.start()
+                started += 1
 
-        if self.thread.isAlive():
-            self._log(LOG_DEBUG, "Thread already started.")
+        if started:
+            self.logger.info("Started %s worker(s).", started)
         else:
-            self.thread.start()
-            self._log(LOG_INFO, "Started thread.")
+            self.logger.debug("Workers already started.")
+        self.signal_pending()
 
     def stop(self):
-        """Clear queue and stop the thread."""
-        if self.thread and self.thread.isAlive():
-            self._log(LOG_DEBUG, "Stopping the worker.")
-            self._log(LOG_DEBUG, "* Clearing the queue.")
-            self.queue.clear()
-            self._log(LOG_DEBUG, "* Adding the shutdown marker (None).")
-            self.queue.put(None)
-            self._log(LOG_DEBUG, "Waiting for worker to exit.")
+        """Clear queue and stop the worker threads."""
+        alive = [thread for thread in self.threads if thread.is_alive()]
+        if alive:
+            self.logger.debug("Stopping the workers.")
+            self.logger.debug("* Clearing the queue.")
+            for job in self.queue.take(lambda queued: True, self.queue.qsize()):
+                self.queue.task_done()
+                for future in job.futures:
+                    future.cancel()
+            with self.inFlightLock:
+                self.inFlight.clear()
+            with self.supersedeLock:
+                self.superseded.clear()
+            with self.retryLock:
+                retries = list(self.retries.items())
+                self.retries.clear()
+            for (job, timer) in retries:
+                timer.cancel()
+                for future in job.futures:
+                    future.cancel()
+            self.logger.debug("* Adding the shutdown markers (None).")
+            for _ in alive:
+                self.queue.put(None)
+            self.logger.debug("Waiting for workers to exit.")
             # Send an interrupt if we have any THROTTLE waits in place.
             self.interruptEvent.set()
-            self.thread.join()
-            self._log(LOG_INFO, "Stopped edsmquery.")
+            for thread in alive:
+                thread.join()
+            self.transport.close()
+            self.logger.info("Stopped edsmquery.")
 
-        self.thread = None
+        if self.galaxyThread is not None and self.galaxyThread.is_alive():
+            self.logger.debug("Interrupting the galaxy index update.")
+            self.interruptEvent.set()
+            self.galaxyThread.join()
+        self.galaxyThread = None
+        self.threads = []
 
     def get_response(self):
         """Return the first queued response."""
 
-        if not self.resultQueue:
-            return None
+        return self.resultQueue.get()
+
+    def get_responses(self, limit=None):
+        """Return all queued responses (or at most `limit`), oldest first."""
+
+        return self.resultQueue.drain(limit)
+
+    def subscribe(self, api, endpoint, callback, request_filter=None, models=False):
+        """Subscribe a callback to replies of an api/endpoint.
+
+        Callbacks are called on the Tk main loop with `(request, reply)`, before the
+        `edsm_querier_response_*` functions of plugins.
+        :param api: api to subscribe to, None for all apis.
+        :param endpoint: endpoint to subscribe to, None for all endpoints of the api.
+        :param callback: the function to call.
+        :param request_filter: only pass replies whose request parameters match. Either a dict,
+            i.e. `{'systemName': 'Sol'}`, or a callable receiving the request parameters.
+        :param models: pass replies decoded into `models` (i.e. `models.System`) instead of raw dicts.
+        :return: the subscription, to pass to #unsubscribe().
+        """
+
+        return self.subscriptions.add(Subscription(api, endpoint, callback, request_filter, models))
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription made with #subscribe()."""
+
+        return self.subscriptions.remove(subscription)
 
-        return self.resultQueue.pop(0)
+    def dispatch(self, request, reply):
+        """Pass a reply to all matching subscriptions.
 
-    def request_get(self, api, endpoint, **request_params):
+        :return: the number of subscriptions that have been called.
+        """
+
+        subscriptions = self.subscriptions.matching(request)
+        decoded = None
+        for subscription in subscriptions:
+            # One failing subscriber must not keep the reply from the others.
+            try:
+                if subscription.models:
+                    if decoded is None:
+                        decoded = decode(request, reply)
+                    subscription.callback(request, decoded)
+                else:
+                    subscription.callback(request, reply)
+            except Exception as err:  # pylint: disable=broad-except
+                self.logger.error("Subscription callback %s failed: %s", subscription.callback, err)
+        return len(subscriptions)
+
+    def stats(self):
+        """Return queue, result and cache metrics."""
+
+        return {
+            'queue': self.queue_depths(),
+            'results': len(self.resultQueue),
+            'results_dropped': self.resultQueue.dropped,
+            'results_spilled': self.resultQueue.spilled,
+            'coalesced': self.coalesced,
+            'cache': self.cache.stats(),
+            'transport': self.transport.stats(),
+            'breakers': self.breaker_states(),
+            'galaxy': self.galaxy.stats(),
+        }
+
+    def update_galaxy(self, kinds=(GalaxyIndex.SYSTEMS,)):
+        """Download the EDSM dumps that are due into the galaxy index, on a background thread.
+
+        :param kinds: the kinds of records to update, see `GalaxyIndex.update()`.
+        :return: False if the index is not open, up to date or an update is already running.
+        """
+
+        if not self.galaxy.is_open or (self.galaxyThread is not None and self.galaxyThread.is_alive()):
+            return False
+        if not any(self.galaxy.needs_update(kind) for kind in kinds):
+            return False
+
+        def update():
+            try:
+                self.galaxy.update(self.session, kinds, self.interruptEvent)
+            except (RequestException, ValueError, sqlite3.Error, zlib.error) as err:
+                self.logger.error("Unable to update the galaxy index: %s", err)
+
+        self.galaxyThread = Thread(target=update, name='EDSM-galaxy', daemon=True)
+        self.galaxyThread.start()
+        return True
+
+    def breaker(self, base_url=None):
+        """Return the circuit breaker of an API base url (`API_BASE_URL` by default), creating it on first use."""
+
+        if base_url is None:
+            base_url = self.API_BASE_URL
+        with self.breakersLock:
+            breaker = self.breakers.get(base_url)
+            if breaker is None:
+                breaker = CircuitBreaker(base_url)
+                breaker.listeners.append(self._breaker_changed)
+                self.breakers[base_url] = breaker
+            return breaker
+
+    def breaker_states(self):
+        """Return the state of the circuit breaker of each API base url that has been used, see `CircuitBreaker`."""
+
+        with self.breakersLock:
+            return dict((base_url, breaker.state) for (base_url, breaker) in self.breakers.items())
+
+    def add_breaker_listener(self, callback):
+        """Call `callback(base_url, state)` on the Tk main loop whenever a circuit breaker changes state.
+
+        A breaker opens when EDSM is unavailable: requests then fail right away (or get a stale
+        reply from the cache) until a probe request succeeds.
+        """
+
+        self.breakerListeners.append(callback)
+
+    def remove_breaker_listener(self, callback):
+        """Stop calling a callback added with `add_breaker_listener()`."""
+
+        if callback in self.breakerListeners:
+            self.breakerListeners.remove(callback)
+
+    def _breaker_changed(self, breaker, previous, state):
+        if state == CircuitBreaker.OPEN:
+            self.logger.warning("EDSM (%s) is unavailable, failing requests fast for %s seconds.",
+                                breaker.name, breaker.resetTimeout)
+        else:
+            self.logger.info("EDSM (%s) circuit breaker: %s -> %s", breaker.name, previous, state)
+        for listener in list(self.breakerListeners):
+            self._call_soon(listener, breaker.name, state)
+
+    def queue_depths(self):
+        """Return the number of queued requests per priority lane."""
+
+        return self.queue.depths()
+
+    def request_get(self, api, endpoint, *, priority=None, supersede=None, broadcast=True, models=False,
+                    **request_params):
         """Queues a GET request.
 
         See #_request() for information on parameters.
+        :return: an `EDSMFuture` for the reply.
+        """
+
+        return self._request(api, endpoint, 'GET', priority, supersede, broadcast, models=models, **request_params)
+
+    def request_stream(self, api, endpoint, callback, *, fields=None, priority=None, supersede=None, models=False,
+                       **request_params):
+        """Queue a GET request whose records are passed on while the reply is being downloaded.
+
+        The records of the array listed in `STREAM_PATHS` (i.e. the bodies of `api-system-v1/bodies`), or of
+        the reply itself when it is an array (i.e. `api-v1/sphere-systems`), are parsed one by one and passed
+        to `callback(request, records)` on the Tk main loop, at most `STREAM_BATCH_SIZE` at a time. Streamed
+        replies are not coalesced, cached or broadcast. Cancelling the future stops the download.
+        :param callback: called with the request and a list of records.
+        :param fields: names of the record fields to keep, None keeps everything.
+        :param models: pass records decoded into `models` (i.e. `models.Body`) instead of raw dicts.
+        See #_request() for information on the other parameters.
+        :return: an `EDSMFuture` resolving to the other top level values of the reply (i.e. `name` and
+            `bodyCount`) once all records have been passed on.
         """
 
-        self._request(api, endpoint, 'GET', **request_params)
+        stream = (self.STREAM_PATHS.get((api, endpoint)), fields, callback, models)
+        return self._request(api, endpoint, 'GET', priority, supersede, False, stream=stream, **request_params)
 
-    def request_post(self, api, endpoint, **data):
+    def request_post(self, api, endpoint, *, priority=None, supersede=None, broadcast=True, **data):
         """Send out a post request.
 
         See #_request() for information on parameters.
+        :return: an `EDSMFuture` for the reply.
+        """
+
+        return self._request(api, endpoint, 'POST', priority, supersede, broadcast, **data)
+
+    def cancel(self, supersede):
+        """Cancel the queued request registered under a supersession key.
+
+        Requests that are already being performed can not be cancelled. When identical requests
+        without the key have been coalesced into it, only the future queued under the key is
+        cancelled and the request stays queued for the others.
+        :param supersede: the key the request was queued with.
+        :return: True if a queued request was cancelled.
         """
 
-        self._request(api, endpoint, 'POST', **data)
+        with self.supersedeLock:
+            job = self.superseded.pop(supersede, None)
+        if job is None:
+            return False
+
+        # The first future is the one queued under the key, the others were coalesced into the request.
+        keyed = job.futures[0]
+        with self.inFlightLock:
+            others = [future for future in job.futures[1:] if not future.cancelled()]
+        if others:
+            # Other requesters still wait for the reply: the request stays queued for them.
+            self.logger.debug("Cancelled %s/%s (%s), %s other requester(s) still waiting",
+                              job.request[0], job.request[1], supersede, len(others))
+            job.supersede = None
+            keyed.cancel()
+            return True
+
+        if not self._dequeue(job):
+            return False
+
+        self.logger.debug("Cancelled queued request for %s/%s (%s)", job.request[0], job.request[1], supersede)
+        for future in job.futures:
+            future.cancel()
+        return True
 
-    def _request(self, api, endpoint, method, **request_params):
+    def _request(self, api, endpoint, method, priority, supersede, broadcast, stream=None, models=False,
+                 **request_params):
         """Add a new request to the queue.
 
         :param api: api you want to get
         :param endpoint: EDSMs api endpoint you want to hit
         :param method: HTTP method to use.
+        :param priority: queue lane to use, one of the `PRIORITY_*` constants. Defaults to `DEFAULT_PRIORITY`.
+        :param supersede: optional supersession key, i.e. 'myplugin.current_system'. A newer request with the same
+            key cancels the older one if it is still queued.
+        :param broadcast: pass the reply to subscriptions and plugin callbacks. When False, the reply only
+            goes to the returned future.
+        :param stream: `(path, fields, callback, models)` for streamed requests, see request_stream().
+        :param models: resolve the future with the reply decoded into `models` instead of raw dicts.
         :param request_params: additional request parameters.
+        :return: an `EDSMFuture` for the reply.
+        """
+
+        if priority is None:
+            priority = self.DEFAULT_PRIORITY
+        if not self.queue.has_lane(priority):
+            raise ValueError("Unknown priority: {priority}".format(priority=priority))
+
+        request = (api, endpoint, method, request_params)
+        key = self.cache.key(*request)
+        future = EDSMFuture(request, self, broadcast, models)
+        if supersede is not None:
+            with self.supersedeLock:
+                previous = self.superseded.get(supersede)
+            if previous is not None and previous.key != key:
+                self.cancel(supersede)
+
+        # Only the memory part of the cache here, the on-disk store is looked up by the workers (see _from_cache).
+        reply = self.cache.get(key, disk=False) if stream is None else None
+        if reply is not None:
+            self.logger.debug("Cache hit for %s/%s", api, endpoint)
+            self._resolve(request, [future], reply)
+            return future
+
+        coalesce = method == 'GET' and stream is None
+        with self.inFlightLock:
+            job = self.inFlight.get(key) if coalesce else None
+            if job is not None:
+                # An identical request is queued or running: share its reply.
+                job.futures.append(future)
+                future._job = job
+                self.coalesced += 1
+                self.logger.debug("Coalesced duplicate request for %s/%s", api, endpoint)
+                return future
+
+            job = QueuedRequest(request, key, priority, supersede, future, stream)
+            future._job = job
+            if coalesce:
+                self.inFlight[key] = job
+
+        if supersede is not None:
+            with self.supersedeLock:
+                self.superseded[supersede] = job
+        self.queue.put((priority, job), False)
+        return future
+
+    def _dequeue(self, job):
+        """Remove a job from the queue if no worker picked it up yet.
+
+        :return: True if the job was removed.
+        """
+
+        if not self.queue.take(lambda queued: queued is job, 1):
+            return False
+
+        self._finish(job)
+        self._unregister_supersede(job)
+        self.queue.task_done()
+        return True
+
+    def _cancel_future(self, future):
+        """Drop a cancelled future; dequeue its request if nobody else waits for it."""
+
+        job = future._job
+        if job is None:
+            return
+
+        with self.inFlightLock:
+            waiting = [queued for queued in job.futures if not queued.cancelled()]
+        if not waiting:
+            self._dequeue(job)
+
+    def _unregister_supersede(self, job):
+        """Drop the supersession key of a request that has left the queue."""
+
+        if job.supersede is None:
+            return
+
+        with self.supersedeLock:
+            if self.superseded.get(job.supersede) is job:
+                del self.superseded[job.supersede]
+
+    def is_pending(self, api, endpoint, method='GET', **request_params):
+        """Return whether an identical GET request is queued or running."""
+
+        key = self.cache.key(api, endpoint, method, request_params)
+        with self.inFlightLock:
+            return key in self.inFlight
+
+    def _finish(self, job):
+        """Forget about an in-flight request so a new identical request is sent out again."""
+
+        with self.inFlightLock:
+            if self.inFlight.get(job.key) is job:
+                del self.inFlight[job.key]
+
+    def _resolve(self, request, futures, reply):
+        """Pass a reply (or failure) to the futures waiting for it and broadcast it if anyone wants that."""
+
+        waiting = [future for future in futures if not future.cancelled()]
+        decoded = None
+        for future in waiting:
+            if reply and future.models:
+                if decoded is None:
+                    decoded = decode(request, reply)
+                future.set_result(decoded)
+            elif reply:
+                future.set_result(reply)
+            else:
+                future.set_exception(RequestError("Unable to perform request {api}/{endpoint}".format(
+                    api=request[0],
+                    endpoint=request[1],
+                )))
+
+        if reply and any(future.broadcast for future in waiting):
+            self._deliver(request, reply)
+
+    def _schedule_callbacks(self, future):
+        """Queue the done callbacks of a future for the Tk main loop."""
+
+        with self.signalLock:
+            self.completedFutures.append(future)
+            signal = not self.completedSignalled
+            self.completedSignalled = True
+        if signal:
+            self._signal()
+
+    def _call_soon(self, callback, *args):
+        """Queue a call for the Tk main loop."""
+
+        with self.signalLock:
+            self.pendingCalls.append((callback, args))
+            signal = not self.completedSignalled
+            self.completedSignalled = True
+        if signal:
+            self._signal()
+
+    def run_callbacks(self):
+        """Run the done callbacks of completed futures and other queued calls. Must be called on the Tk main loop."""
+
+        with self.signalLock:
+            futures = list(self.completedFutures)
+            self.completedFutures.clear()
+            calls = list(self.pendingCalls)
+            self.pendingCalls.clear()
+            self.completedSignalled = False
+
+        for future in futures:
+            for callback in future._pop_callbacks():
+                try:
+                    callback(future)
+                except Exception as err:  # pylint: disable=broad-except
+                    self.logger.error("Future callback %s failed: %s", callback, err)
+
+        for (callback, args) in calls:
+            try:
+                callback(*args)
+            except Exception as err:  # pylint: disable=broad-except
+                self.logger.error("Callback %s failed: %s", callback, err)
+
+    def _deliver(self, request, reply):
+        """Queue a reply for the gui thread and notify the callback widget."""
+
+        # Cache hits are delivered on the requesting thread, usually the Tk main loop that drains the
+        # channel: only workers may wait for room.
+        if self.resultQueue.put((request, reply), current_thread() in self.threads):
+            self._signal()
+
+    def signal_pending(self):
+        """Post an `EDSM_CALLBACK_SEQUENCE` event if replies or callbacks are waiting.
+
+        Replies delivered before the callback widget was set did not post an event, while the
+        channel and callback queues consider themselves signalled until they are drained. Call
+        this once the widget is set.
         """
 
-        self.queue.put((api, endpoint, method, request_params), False)
+        with self.signalLock:
+            pending = bool(self.completedFutures or self.pendingCalls)
+        if pending or len(self.resultQueue):
+            self._signal()
+
+    def _signal(self):
+        """Post a single `EDSM_CALLBACK_SEQUENCE` event, at most once per `SIGNAL_INTERVAL`."""
+
+        if self.callbackWidget is None:
+            return
+
+        with self.signalLock:
+            if self.signalTimer is not None:
+                return
+            wait = self.lastSignal + self.SIGNAL_INTERVAL - time.monotonic()
+            if wait > 0:
+                self.signalTimer = Timer(wait, self._signal_now)
+                self.signalTimer.daemon = True
+                self.signalTimer.start()
+                return
+
+        self._signal_now()
+
+    def _signal_now(self):
+        with self.signalLock:
+            self.signalTimer = None
+            self.lastSignal = time.monotonic()
+        if self.callbackWidget is not None:
+            self.callbackWidget.event_generate(EDSM_CALLBACK_SEQUENCE, when='tail')
 
     def _http_request(self, api, endpoint, method, request_params):
         """Perform the http request to edsm.
@@ -165,50 +740,404 @@ class EDSMQueries(object):
         """
 
         url = "{base}/{api}/{endpoint}".format(base=self.API_BASE_URL, api=api, endpoint=endpoint)
-        self._log(LOG_DEBUG, "request {method} '{url}'".format(method=method, url=url))
+        self.logger.debug("request %s '%s'", method, url)
         if method == 'GET':
-            session_request = self.session.get(url, params=request_params, timeout=self.API_TIMEOUT)
+            session_request = self.transport.request(method, url, params=request_params, timeout=self.API_TIMEOUT)
         elif method == 'POST':
-            session_request = self.session.post(url, data=request_params, timeout=self.API_TIMEOUT)
+            session_request = self.transport.request(method, url, data=request_params, timeout=self.API_TIMEOUT)
         else:
             return
 
+        self.rateLimiter.update(session_request.headers)
         session_request.raise_for_status()
         return session_request.json()
 
+    def _http_stream(self, api, endpoint, request_params, path, fields, header):
+        """Perform a GET request to edsm and yield the records of its reply as they are parsed.
+
+        See `stream.iter_records()` for `path`, `fields` and `header`.
+        """
+
+        url = "{base}/{api}/{endpoint}".format(base=self.API_BASE_URL, api=api, endpoint=endpoint)
+        self.logger.debug("request streamed GET '%s'", url)
+        session_request = self.transport.request('GET', url, params=request_params, timeout=self.API_TIMEOUT,
+                                                 stream=True)
+        try:
+            self.rateLimiter.update(session_request.headers)
+            session_request.raise_for_status()
+            for record in iter_records(session_request.iter_content(CHUNK_SIZE), path, fields, header):
+                yield record
+        finally:
+            session_request.close()
+
     def worker(self):
         """Wait for a request to come in.
 
         Executes the http request and makes the callback with the reply.
         """
         while True:
-            request = self.queue.get()
-            if request is None:
+            job = self.queue.get()
+            if job is None:
                 break
 
-            (api, endpoint, method, request_params) = request
-            reply = None
-            retrying = 0
-            self._log(LOG_DEBUG, "Performing callback for {api}/{endpoint}".format(api=api, endpoint=endpoint))
-            while retrying < 3:
-                try:
-                    reply = self._http_request(api, endpoint, method, request_params)
-                    break
-                except ConnectionError as err:
-                    self._log(LOG_ERROR, "HTTP Connection error: {err}".format(err=err))
-                except HTTPError as err:
-                    self._log(LOG_ERROR, "HTTP error occurred: {err}".format(err=err))
-                retrying += 1
-
-            if reply:
-                self.resultQueue.append((request, reply))
-                self.callbackWidget.event_generate(EDSM_CALLBACK_SEQUENCE, when='tail')
+            self._unregister_supersede(job)
+            batch = self._collect_batch(job)
+            for batched in batch[1:]:
+                self._unregister_supersede(batched)
+            if len(batch) > 1:
+                self._process_batch(batch)
+            else:
+                self._process(job)
+
+            for _ in batch:
+                self.queue.task_done()
+
+    def _perform(self, api, endpoint, method, request_params):
+        """Perform a request once, waiting for the rate limiter first.
+
+        :return: the parsed reply or None if we got interrupted while waiting.
+        :raises RequestException: the request failed.
+        :raises ValueError: the reply could not be parsed.
+        """
+
+        self.logger.debug("Performing callback for %s/%s", api, endpoint)
+        if not self.rateLimiter.wait(self.interruptEvent):
+            return None
+        return self._http_request(api, endpoint, method, request_params)
+
+    def _failed(self, jobs, error):
+        """Reschedule the jobs of a failed request according to the retry policy, or give up on them.
+
+        Retries wait on a timer instead of in the worker, so other requests go ahead in the meantime.
+        """
+
+        for job in jobs:
+            job.attempts += 1
+            (api, endpoint, _method, _request_params) = job.request
+            if self.breaker().state == CircuitBreaker.OPEN:
+                self._short_circuit(job)
+                continue
+
+            delay = self.retryPolicy.next_delay(job.attempts, error)
+            if delay is None or self.interruptEvent.is_set():
+                self.logger.error("HTTP error occurred for %s/%s: %s", api, endpoint, error)
+                self._complete(job, None)
+                continue
+
+            self.logger.warning("HTTP error occurred for %s/%s: %s, retrying in %.1f seconds.",
+                                api, endpoint, error, delay)
+            timer = Timer(delay, self._retry, (job,))
+            timer.daemon = True
+            with self.retryLock:
+                self.retries[job] = timer
+            timer.start()
+
+    def _retry(self, job):
+        """Put a failed job back in its queue lane, unless nobody is waiting for it anymore."""
+
+        with self.retryLock:
+            if self.retries.pop(job, None) is None:
+                # Cancelled by stop().
+                return
+
+        with self.inFlightLock:
+            waiting = [future for future in job.futures if not future.cancelled()]
+        superseded = False
+        if job.supersede is not None:
+            with self.supersedeLock:
+                newer = self.superseded.get(job.supersede)
+                superseded = newer is not None and newer is not job
+                if not superseded:
+                    self.superseded[job.supersede] = job
+
+        if not waiting or superseded:
+            self._finish(job)
+            for future in job.futures:
+                future.cancel()
+            return
+
+        self.queue.put((job.priority, job), False)
+
+    def _from_cache(self, job):
+        """Complete a job from the cache or the galaxy index, if possible.
+
+        Runs on a worker: the galaxy index may be busy importing a dump.
+        :return: True if the job has been answered without a request.
+        """
+
+        (api, endpoint, method, request_params) = job.request
+        # A retried job has been counted in the cache statistics on its first attempt.
+        reply = self.cache.get(job.key, count=job.attempts == 0)
+        if reply is not None:
+            self.logger.debug("Cache hit for %s/%s", api, endpoint)
+        elif method == 'GET':
+            reply = self.galaxy.answer(api, endpoint, request_params)
+            if reply is None:
+                return False
+            self.logger.debug("Answered %s/%s from the galaxy index", api, endpoint)
+        else:
+            return False
+
+        self._finish(job)
+        self._resolve(job.request, job.futures, reply)
+        return True
+
+    def _process(self, job):
+        """Handle a single request: serve it from the cache or perform it."""
+
+        if job.stream is not None:
+            self._process_stream(job)
+            return
+        if self._from_cache(job):
+            return
+        self._send(job)
+
+    def _send(self, job):
+        """Perform the request of a job that could not be answered from the cache."""
+
+        (api, endpoint, method, request_params) = job.request
+        breaker = self.breaker()
+        if not breaker.allow():
+            self._short_circuit(job)
+            return
+
+        try:
+            reply = self._perform(api, endpoint, method, request_params)
+        except (RequestException, ValueError) as err:
+            self._report(breaker, err)
+            self._failed([job], err)
+        else:
+            if reply is not None:
+                breaker.record_success()
+            self._complete(job, reply)
+
+    def _process_stream(self, job):
+        """Handle a streamed request, passing records on in batches while they are parsed."""
+
+        (api, endpoint, _method, request_params) = job.request
+        (path, fields, _callback, _models) = job.stream
+        header = dict()
+        reply = self.cache.get(job.key, count=job.attempts == 0)
+        if reply is not None:
+            # Someone already fetched the whole reply.
+            self.logger.debug("Cache hit for streamed %s/%s", api, endpoint)
+            records = reply
+            if isinstance(reply, dict):
+                header = dict((name, value) for (name, value) in reply.items() if not isinstance(value, (dict, list)))
+                records = (reply.get(path) or []) if path is not None else []
+            for start in range(0, len(records), self.STREAM_BATCH_SIZE):
+                self._stream_records(job, [project(record, fields)
+                                           for record in records[start:start + self.STREAM_BATCH_SIZE]])
+            self._stream_done(job, header)
+            return
+
+        breaker = self.breaker()
+        if not breaker.allow():
+            self.logger.debug("EDSM is unavailable, failing streamed %s/%s.", api, endpoint)
+            self._stream_done(job, None)
+            return
+        if not self.rateLimiter.wait(self.interruptEvent):
+            self._stream_done(job, None)
+            return
+
+        delivered = 0
+        records = []
+        try:
+            for record in self._http_stream(api, endpoint, request_params, path, fields, header):
+                records.append(record)
+                if len(records) >= self.STREAM_BATCH_SIZE:
+                    if not self._stream_records(job, records):
+                        self.logger.debug("Streamed %s/%s has been cancelled.", api, endpoint)
+                        return
+                    delivered += len(records)
+                    records = []
+        except (RequestException, ValueError) as err:
+            self._report(breaker, err)
+            if delivered:
+                # Trying again would pass the same records on twice.
+                self.logger.error("HTTP error occurred for streamed %s/%s: %s", api, endpoint, err)
+                self._stream_done(job, None)
+            else:
+                self._failed([job], err)
+            return
+
+        breaker.record_success()
+        if records:
+            self._stream_records(job, records)
+        self._stream_done(job, header)
+
+    def _stream_records(self, job, records):
+        """Pass a batch of streamed records to the Tk main loop.
+
+        :return: False if nobody is waiting for the records anymore.
+        """
+
+        if all(future.cancelled() for future in job.futures):
+            return False
+        (_path, _fields, callback, models) = job.stream
+        if models:
+            records = decode_records(job.request, records)
+        self._call_soon(callback, job.request, records)
+        return True
+
+    def _stream_done(self, job, header):
+        """Resolve the futures of a streamed request, with the header of the reply or an error when it is None."""
+
+        self._finish(job)
+        for future in job.futures:
+            if header is not None:
+                future.set_result(header)
             else:
-                self._log(LOG_ERROR, "Unable to perform request {api}/{endpoint}".format(api=api, endpoint=endpoint))
+                future.set_exception(RequestError("Unable to perform request {api}/{endpoint}".format(
+                    api=job.request[0],
+                    endpoint=job.request[1],
+                )))
+
+    @staticmethod
+    def _report(breaker, error):
+        """Tell a circuit breaker about a failed request."""
+
+        if breaker.is_outage(error):
+            breaker.record_failure()
+        else:
+            # EDSM answered, it just did not like the request.
+            breaker.record_success()
+
+    def _short_circuit(self, job):
+        """Fail a job without performing it, because EDSM is unavailable.
+
+        A stale reply from the cache is used if there is one.
+        """
+
+        (api, endpoint, _method, _request_params) = job.request
+        if job.stream is not None:
+            self._stream_done(job, None)
+            return
 
-            if self.THROTTLE > 0:
-                self.interruptEvent.wait(self.THROTTLE)
-            self.queue.task_done()
+        # Already counted as a miss by _from_cache().
+        reply = self.cache.get(job.key, stale=True, count=False)
+        self.logger.debug("EDSM is unavailable, %s %s/%s.",
+                          "serving a stale reply for" if reply else "failing", api, endpoint)
+        self._finish(job)
+        self._resolve(job.request, job.futures, reply)
+
+    def _complete(self, job, reply):
+        """Cache and deliver the reply of a request that has been performed."""
+
+        if reply:
+            self.cache.put(job.key, reply)
+            self.galaxy.learn(job.request, reply)
+        self._finish(job)
+        self._resolve(job.request, job.futures, reply)
+
+        if not reply:
+            (api, endpoint, _method, _request_params) = job.request
+            self.logger.error("Unable to perform request %s/%s", api, endpoint)
+
+    def _batch_group(self, job):
+        """Return the group of requests that can share a bulk request with `job`, or None.
+
+        Single system lookups (`api-v1/system`) with the same flags can be merged into one
+        `api-v1/systems` request.
+        """
+
+        if job is None or job.stream is not None:
+            return None
+
+        (api, endpoint, method, request_params) = job.request
+        if (api, endpoint, method) != (self.API_V1, self.API_V1__SYSTEM, 'GET'):
+            return None
+        if 'systemName' not in request_params:
+            return None
+
+        flags = []
+        for name, value in request_params.items():
+            if name == 'systemName':
+                continue
+            if name not in self.BATCH_FLAGS:
+                return None
+            flags.append((name, str(value)))
+
+        return tuple(sorted(flags))
+
+    def _collect_batch(self, job):
+        """Gather queued requests that can be merged with `job` into one bulk request."""
+
+        group = self._batch_group(job)
+        if group is None:
+            return [job]
+
+        # Give other lookups a short moment to come in.
+        if self.interruptEvent.wait(self.BATCH_WINDOW):
+            return [job]
+
+        others = self.queue.take(
+            lambda queued: self._batch_group(queued) == group,
+            self.BATCH_SIZE - 1,
+        )
+        return [job] + others
+
+    def _process_batch(self, batch):
+        """Perform a bulk `api-v1/systems` request and split the reply per original request."""
+
+        pending = [job for job in batch if not self._from_cache(job)]
+        if not pending:
+            return
+
+        if len(pending) == 1:
+            self._send(pending[0])
+            return
+
+        (_api, _endpoint, _method, request_params) = pending[0].request
+        bulk_params = dict((name, value) for name, value in request_params.items() if name != 'systemName')
+        bulk_params['systemName[]'] = [job.request[3]['systemName'] for job in pending]
+        self.logger.debug("Merged %s system lookups into one bulk request.", len(pending))
+
+        breaker = self.breaker()
+        if not breaker.allow():
+            for job in pending:
+                self._short_circuit(job)
+            return
+
+        try:
+            reply = self._perform(self.API_V1, self.API_V1__SYSTEMS, 'GET', bulk_params)
+        except (RequestException, ValueError) as err:
+            self._report(breaker, err)
+            self._failed(pending, err)
+            return
+        if reply is not None:
+            breaker.record_success()
+
+        systems = dict()
+        if isinstance(reply, list):
+            for system in reply:
+                systems[system.get(EDSM_RESPONSE_FIELD_NAME, '').lower()] = system
+
+        for job in pending:
+            self._complete(job, systems.get(str(job.request[3]['systemName']).lower()))
+
+
+class QueuedRequest(object):
+    """A request waiting in (or taken from) the queue, with the futures waiting for its reply."""
+
+    def __init__(self, request, key, priority, supersede, future, stream=None):
+        """Initialize the queued request.
+
+        :param request: the request tuple `(api, endpoint, method, request_params)`.
+        :param key: the normalized cache key of the request.
+        :param priority: the lane it has been queued in.
+        :param supersede: its supersession key, or None.
+        :param future: the future of the first requester.
+        :param stream: `(path, fields, callback, models)` of a streamed request, None for a regular one.
+        """
+
+        self.request = request
+        self.key = key
+        self.priority = priority
+        self.supersede = supersede
+        self.futures = [future]
+        self.attempts = 0
+        self.stream = stream
 
 
 class ClearableQueue(Queue):
@@ -219,6 +1148,24 @@ class ClearableQueue(Queue):
 
         Queue.__init__(self)
 
+    def take(self, predicate, limit):
+        """Remove and return up to `limit` queued items matching `predicate`.
+
+        Callers are responsible for calling `task_done()` for each returned item.
+        """
+
+        taken = []
+        with self.mutex:
+            for item in list(self.queue):
+                if len(taken) >= limit:
+                    break
+                if predicate(item):
+                    self.queue.remove(item)
+                    taken.append(item)
+            if taken:
+                self.not_full.notify(len(taken))
+        return taken
+
     def clear(self):
         """Clear all elements from the queue until we are empty."""
 
@@ -229,4 +1176,82 @@ class ClearableQueue(Queue):
             pass
 
 
+class LaneQueue(ClearableQueue):
+    """Queue with named priority lanes.
+
+    Items are put as `(lane, item)` tuples and `get()` returns the item. Lanes are
+    served by weighted round robin so busy urgent lanes never starve the others.
+    `None` (the worker stop marker) skips the lanes and is returned first.
+    """
+
+    def __init__(self, weights):
+        """Initialize the queue.
+
+        :param weights: ordered `(lane, weight)` pairs, most urgent lane first.
+        """
+
+        self.weights = OrderedDict(weights)
+        ClearableQueue.__init__(self)
+
+    def _init(self, maxsize):
+        self.control = deque()
+        self.lanes = OrderedDict((lane, deque()) for lane in self.weights)
+        self.schedule = []
+        for turn in range(max(self.weights.values())):
+            self.schedule.extend(lane for lane, weight in self.weights.items() if weight > turn)
+        self.position = 0
+
+    def _qsize(self):
+        return len(self.control) + sum(len(lane) for lane in self.lanes.values())
+
+    def _put(self, item):
+        if item is None:
+            self.control.append(item)
+            return
+
+        (lane, payload) = item
+        self.lanes[lane].append(payload)
+
+    def _get(self):
+        if self.control:
+            return self.control.popleft()
+
+        for offset in range(len(self.schedule)):
+            index = (self.position + offset) % len(self.schedule)
+            lane = self.lanes[self.schedule[index]]
+            if lane:
+                self.position = (index + 1) % len(self.schedule)
+                return lane.popleft()
+
+    def has_lane(self, lane):
+        """Return whether `lane` is a known lane."""
+
+        return lane in self.lanes
+
+    def depths(self):
+        """Return the number of queued items per lane."""
+
+        with self.mutex:
+            return dict((name, len(lane)) for name, lane in self.lanes.items())
+
+    def take(self, predicate, limit):
+        """Remove and return up to `limit` queued items matching `predicate`, most urgent lanes first.
+
+        Callers are responsible for calling `task_done()` for each returned item.
+        """
+
+        taken = []
+        with self.mutex:
+            for lane in self.lanes.values():
+                for item in list(lane):
+                    if len(taken) >= limit:
+                        break
+                    if predicate(item):
+                        lane.remove(item)
+                        taken.append(item)
+            if taken:
+                self.not_full.notify(len(taken))
+        return taken
+
+
 EDSM_QUERIES = EDSMQueries()
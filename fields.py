@@ -29,10 +29,16 @@ JOURNAL_ENTRY_FIELD_BODY_NAME = "BodyName"
 JOURNAL_ENTRY_FIELD_BODY_COUNT = "BodyCount"
 JOURNAL_ENTRY_FIELD_LANDABLE = "Landable"
 JOURNAL_ENTRY_FIELD_MATERIALS = "Materials"
+JOURNAL_ENTRY_FIELD_ROUTE = "Route"
 
 JOURNAL_ENTRY_VALUE_EVENT_FSS_DISCOVERY_SCAN = "FSSDiscoveryScan"
 JOURNAL_ENTRY_VALUE_EVENT_FSDJUMP = "FSDJump"
 JOURNAL_ENTRY_VALUE_EVENT_SCAN = "Scan"
+JOURNAL_ENTRY_VALUE_EVENT_NAV_ROUTE = "NavRoute"
+JOURNAL_ENTRY_VALUE_EVENT_NAV_ROUTE_CLEAR = "NavRouteClear"
+JOURNAL_ENTRY_VALUE_EVENT_FSD_TARGET = "FSDTarget"
+JOURNAL_ENTRY_VALUE_EVENT_LOCATION = "Location"
+JOURNAL_ENTRY_VALUE_EVENT_CARRIER_JUMP = "CarrierJump"
 
 JOURNAL_ENTRY_VALUE_SCAN_TYPE_DETAILED = "Detailed"
 JOURNAL_ENTRY_VALUE_SCAN_TYPE_AUTOSCAN = "AutoScan"
@@ -0,0 +1,189 @@
+"""
+Future handles for queued EDSM requests.
+
+`EDSMQueries.request_get()` and `request_post()` return an `EDSMFuture`. Worker
+threads can block on `result()`, while callbacks added with
+`add_done_callback()` always run on the Tk main loop.
+"""
+import concurrent.futures
+from threading import Event, Lock
+
+
+class RequestError(Exception):
+    """Raised by `EDSMFuture.result()` when a request could not be performed."""
+
+
+class EDSMFuture(object):
+    """The eventual reply to a queued EDSM request."""
+
+    PENDING = 'pending'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, request, owner=None, broadcast=True, models=False):
+        """Initialize the future.
+
+        :param request: the request tuple `(api, endpoint, method, request_params)`.
+        :param owner: the `EDSMQueries` instance that resolves this future.
+        :param broadcast: whether the reply is also passed to subscriptions and plugin callbacks.
+        :param models: whether the reply is decoded into `models` instead of raw dicts.
+        """
+
+        self.request = request
+        self.broadcast = broadcast
+        self.models = models
+        self._owner = owner
+        self._job = None
+        self._state = self.PENDING
+        self._reply = None
+        self._exception = None
+        self._callbacks = []
+        self._event = Event()
+        self._lock = Lock()
+
+    def done(self):
+        """Return whether the future has a reply, an error or has been cancelled."""
+
+        return self._state != self.PENDING
+
+    def cancelled(self):
+        """Return whether the future has been cancelled."""
+
+        return self._state == self.CANCELLED
+
+    def result(self, timeout=None):
+        """Wait for and return the reply.
+
+        Do not call this on the Tk main loop without a timeout: replies are delivered by worker threads,
+        but blocking the main loop blocks EDMC.
+        :param timeout: seconds to wait, None waits forever.
+        :raises concurrent.futures.TimeoutError: the reply did not arrive in time.
+        :raises concurrent.futures.CancelledError: the request was cancelled.
+        :raises RequestError: the request failed.
+        """
+
+        if not self._event.wait(timeout):
+            raise concurrent.futures.TimeoutError()
+        if self._state == self.CANCELLED:
+            raise concurrent.futures.CancelledError()
+        if self._exception is not None:
+            raise self._exception
+        return self._reply
+
+    def exception(self, timeout=None):
+        """Wait for the future and return its exception, or None if it has a reply."""
+
+        if not self._event.wait(timeout):
+            raise concurrent.futures.TimeoutError()
+        if self._state == self.CANCELLED:
+            raise concurrent.futures.CancelledError()
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """Call `callback(future)` on the Tk main loop once the future is done.
+
+        If the future is already done, the callback runs on the next pass of the main loop.
+        """
+
+        with self._lock:
+            self._callbacks.append(callback)
+            done = self._state != self.PENDING
+        if done:
+            self._schedule_callbacks()
+
+    def cancel(self):
+        """Cancel the request.
+
+        A queued request that no one else is waiting for is removed from the queue. A request that
+        is already being performed keeps running, but its reply is no longer passed to this future.
+        :return: False if the future is already done.
+        """
+
+        with self._lock:
+            if self._state != self.PENDING:
+                return False
+            self._state = self.CANCELLED
+            has_callbacks = bool(self._callbacks)
+
+        self._event.set()
+        if self._owner is not None:
+            self._owner._cancel_future(self)
+        if has_callbacks:
+            self._schedule_callbacks()
+        return True
+
+    def then(self, callback):
+        """Chain another step to this future.
+
+        `callback(reply)` is called on the Tk main loop. It may queue a new request and return its
+        future, in which case the returned future resolves with the reply of that request.
+        :return: a future resolving with the (eventual) value returned by `callback`.
+        """
+
+        chained = EDSMFuture(self.request, self._owner, broadcast=False)
+
+        def on_done(future):
+            if future.cancelled():
+                chained.cancel()
+                return
+
+            try:
+                value = callback(future.result(0))
+            except Exception as err:  # pylint: disable=broad-except
+                chained.set_exception(err)
+                return
+
+            if isinstance(value, EDSMFuture):
+                value.add_done_callback(chained._copy)
+            else:
+                chained.set_result(value)
+
+        self.add_done_callback(on_done)
+        return chained
+
+    def set_result(self, reply):
+        """Resolve the future with a reply. Called by the worker that performed the request."""
+
+        self._resolve(reply, None)
+
+    def set_exception(self, exception):
+        """Resolve the future with an error. Called by the worker that performed the request."""
+
+        self._resolve(None, exception)
+
+    def _copy(self, future):
+        if future.cancelled():
+            self.cancel()
+        elif future.exception(0) is not None:
+            self.set_exception(future.exception(0))
+        else:
+            self.set_result(future.result(0))
+
+    def _resolve(self, reply, exception):
+        with self._lock:
+            if self._state != self.PENDING:
+                return False
+            self._state = self.DONE
+            self._reply = reply
+            self._exception = exception
+            has_callbacks = bool(self._callbacks)
+
+        self._event.set()
+        if has_callbacks:
+            self._schedule_callbacks()
+        return True
+
+    def _schedule_callbacks(self):
+        if self._owner is not None:
+            self._owner._schedule_callbacks(self)
+        else:
+            for callback in self._pop_callbacks():
+                callback(self)
+
+    def _pop_callbacks(self):
+        """Return the done callbacks that still have to be called, and forget about them."""
+
+        with self._lock:
+            callbacks = self._callbacks
+            self._callbacks = []
+        return callbacks
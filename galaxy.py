@@ -0,0 +1,455 @@
+"""
+Local galaxy index built from the EDSM nightly dumps.
+
+EDSM publishes the systems it knows (with coordinates) and their bodies as
+gzipped JSON dumps, plus smaller dumps of what changed during the last seven
+days. `GalaxyIndex` streams them into a SQLite database with an R-tree on the
+system coordinates, and answers some EDSM requests without going to the
+network: system lookups, sphere searches and, if the much larger bodies dump
+is imported as well, the bodies of a system.
+
+Requests are only answered when the index can be trusted to give the same
+reply EDSM would: a full dump has been imported and the index has been kept
+up to date with the seven day dumps since. Otherwise (or when a request asks
+for information the dumps do not hold) the request goes to EDSM as usual.
+"""
+import json
+import math
+import sqlite3
+import time
+import zlib
+from threading import RLock
+
+from logs import get_logger
+from stream import CHUNK_SIZE, iter_records
+
+
+class GalaxyIndex(object):
+    """SQLite index of EDSM systems and bodies, filled from the nightly dumps."""
+
+    DUMP_URL = 'https://www.edsm.net/dump/{name}'
+    SYSTEMS = 'systems'
+    BODIES = 'bodies'
+    # Dump with everything, and dump with the changes of the last DELTA_DAYS, per kind of record.
+    FULL_DUMPS = {
+        SYSTEMS: 'systemsWithCoordinates.json.gz',
+        BODIES: 'bodies.json.gz',
+    }
+    DELTA_DUMPS = {
+        SYSTEMS: 'systemsWithCoordinates7days.json.gz',
+        BODIES: 'bodies7days.json.gz',
+    }
+    DELTA_DAYS = 7
+    # Seconds between two updates from the delta dumps.
+    UPDATE_INTERVAL = 24 * 3600
+    # Records written per transaction while importing a dump.
+    BATCH_SIZE = 5000
+    DOWNLOAD_TIMEOUT = (10, 60)
+
+    # EDSM's default and maximal radius of a sphere search, in light years.
+    SPHERE_RADIUS = 50
+    MAX_SPHERE_RADIUS = 100
+
+    # Request flags the index can answer, other `show*` flags need data the dumps do not have.
+    SUPPORTED_FLAGS = ('showId', 'showCoordinates')
+
+    def __init__(self):
+        """Initialize a closed index, see open()."""
+
+        self.hits = 0
+        self.misses = 0
+        self.imported = 0
+        self._lock = RLock()
+        self._db = None
+        self.logger = get_logger('galaxy')
+
+    def open(self, path):
+        """Open (or create) the index at `path`."""
+
+        with self._lock:
+            self.close()
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS systems ("
+                " id64 INTEGER PRIMARY KEY,"
+                " id INTEGER,"
+                " name TEXT NOT NULL COLLATE NOCASE,"
+                " x REAL NOT NULL,"
+                " y REAL NOT NULL,"
+                " z REAL NOT NULL,"
+                " bodyCount INTEGER"
+                ");"
+                "CREATE INDEX IF NOT EXISTS systems_name ON systems (name);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS systems_coords USING rtree ("
+                " id64, minX, maxX, minY, maxY, minZ, maxZ"
+                ");"
+                "CREATE TABLE IF NOT EXISTS bodies ("
+                " id INTEGER PRIMARY KEY,"
+                " systemId64 INTEGER,"
+                " systemName TEXT COLLATE NOCASE,"
+                " bodyId INTEGER,"
+                " updateTime TEXT,"
+                " body BLOB NOT NULL"
+                ");"
+                "CREATE INDEX IF NOT EXISTS bodies_system ON bodies (systemId64);"
+                "CREATE INDEX IF NOT EXISTS bodies_system_name ON bodies (systemName);"
+                "CREATE TABLE IF NOT EXISTS dumps ("
+                " kind TEXT PRIMARY KEY,"
+                " complete REAL,"
+                " updated REAL"
+                ");"
+            )
+            self._db.commit()
+
+    def close(self):
+        """Close the index, if open."""
+
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def is_open(self):
+        """Return whether the index has been opened."""
+
+        return self._db is not None
+
+    def is_current(self, kind, now=None):
+        """Return whether records of `kind` are complete: a full dump and every delta since have been imported."""
+
+        with self._lock:
+            if self._db is None:
+                return False
+            row = self._db.execute("SELECT complete, updated FROM dumps WHERE kind = ?", (kind,)).fetchone()
+        if row is None or row[0] is None:
+            return False
+        now = time.time() if now is None else now
+        return now - row[1] < self.DELTA_DAYS * 24 * 3600
+
+    def needs_update(self, kind, now=None):
+        """Return whether the dumps of `kind` should be downloaded again."""
+
+        with self._lock:
+            if self._db is None:
+                return False
+            row = self._db.execute("SELECT updated FROM dumps WHERE kind = ?", (kind,)).fetchone()
+        now = time.time() if now is None else now
+        return row is None or row[0] is None or now - row[0] >= self.UPDATE_INTERVAL
+
+    #  _                       _
+    # | |   ___  ___  _ _ _  _| |__ ___
+    # | |__/ _ \/ _ \| / / || | '_ (_-<
+    # |____\___/\___/|_\_\\_,_| .__/__/
+    #                        |_|
+
+    def answer(self, api, endpoint, request_params):
+        """Return the reply EDSM would give to a GET request, or None if the index can not answer it."""
+
+        if self._db is None:
+            return None
+
+        handler = self.HANDLERS.get((api, endpoint))
+        params = request_params or {}
+        flags = [name for name in params if name.startswith('show') and str(params[name]) not in ('0', '')]
+        if handler is None or any(flag not in self.SUPPORTED_FLAGS for flag in flags):
+            return None
+
+        with self._lock:
+            if self._db is None:
+                return None
+            reply = handler(self, params)
+            if reply is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return reply
+
+    @staticmethod
+    def _flag(params, name):
+        return str(params.get(name, 0)) not in ('0', '')
+
+    def _system_row(self, params):
+        """Return `(id64, id, name, x, y, z, bodyCount)` of the system a request is about, or None."""
+
+        if params.get('systemId64') is not None:
+            return self._db.execute(
+                "SELECT id64, id, name, x, y, z, bodyCount FROM systems WHERE id64 = ?",
+                (int(params['systemId64']),),
+            ).fetchone()
+        if params.get('systemName'):
+            return self._db.execute(
+                "SELECT id64, id, name, x, y, z, bodyCount FROM systems WHERE name = ? LIMIT 1",
+                (str(params['systemName']),),
+            ).fetchone()
+        return None
+
+    def _system_reply(self, row, params, **extra):
+        (id64, system_id, name, x, y, z, _body_count) = row
+        reply = dict(extra)
+        reply['name'] = name
+        if self._flag(params, 'showId'):
+            reply['id'] = system_id
+            reply['id64'] = id64
+        if self._flag(params, 'showCoordinates'):
+            reply['coords'] = {'x': x, 'y': y, 'z': z}
+        return reply
+
+    def _answer_system(self, params):
+        """Answer `api-v1/system`. Systems do not move, so a known system is answered even if the index is old."""
+
+        row = self._system_row(params)
+        if row is None:
+            return None
+        return self._system_reply(row, params)
+
+    def _answer_sphere_systems(self, params):
+        """Answer `api-v1/sphere-systems` from the R-tree, if every system is known."""
+
+        if not self.is_current(self.SYSTEMS):
+            return None
+
+        if params.get('x') is not None:
+            try:
+                center = (float(params['x']), float(params['y']), float(params['z']))
+            except (KeyError, TypeError, ValueError):
+                return None
+        else:
+            row = self._system_row(params)
+            if row is None:
+                return None
+            center = row[3:6]
+
+        try:
+            radius = min(float(params.get('radius', self.SPHERE_RADIUS)), self.MAX_SPHERE_RADIUS)
+            min_radius = float(params.get('minRadius', 0))
+        except (TypeError, ValueError):
+            return None
+
+        (cx, cy, cz) = center
+        rows = self._db.execute(
+            "SELECT s.id64, s.id, s.name, s.x, s.y, s.z, s.bodyCount"
+            " FROM systems_coords c JOIN systems s ON s.id64 = c.id64"
+            " WHERE c.minX <= ? AND c.maxX >= ? AND c.minY <= ? AND c.maxY >= ? AND c.minZ <= ? AND c.maxZ >= ?",
+            (cx + radius, cx - radius, cy + radius, cy - radius, cz + radius, cz - radius),
+        ).fetchall()
+
+        systems = []
+        for row in rows:
+            distance = math.sqrt((row[3] - cx) ** 2 + (row[4] - cy) ** 2 + (row[5] - cz) ** 2)
+            if min_radius <= distance <= radius:
+                systems.append(self._system_reply(row, params, distance=round(distance, 2)))
+        systems.sort(key=lambda system: system['distance'])
+        return systems
+
+    def _answer_bodies(self, params):
+        """Answer `api-system-v1/bodies`, if every body and the body count of the system are known.
+
+        The dumps do not have the body count, it is only known from live replies (see learn()).
+        Without it the reply would leave the scan progress unknown, so EDSM is asked instead.
+        """
+
+        if not self.is_current(self.BODIES):
+            return None
+
+        row = self._system_row(params)
+        if row is None or row[6] is None:
+            return None
+
+        (id64, system_id, name, _x, _y, _z, body_count) = row
+        bodies = self._db.execute(
+            "SELECT body FROM bodies WHERE systemId64 = ? ORDER BY bodyId, id", (id64,),
+        ).fetchall()
+        return {
+            'id': system_id,
+            'id64': id64,
+            'name': name,
+            'bodyCount': body_count,
+            'bodies': [json.loads(zlib.decompress(body).decode('utf-8')) for (body,) in bodies],
+        }
+
+    HANDLERS = {
+        ('api-v1', 'system'): _answer_system,
+        ('api-v1', 'sphere-systems'): _answer_sphere_systems,
+        ('api-system-v1', 'bodies'): _answer_bodies,
+    }
+
+    def learn(self, request, reply):
+        """Store what a live EDSM reply tells about a system, i.e. its bodyCount, which is not part of the dumps.
+
+        Only done once the bodies dump has been imported: without it bodies are never answered from the index.
+        """
+
+        (api, endpoint, _method, _request_params) = request
+        if self._db is None or (api, endpoint) != ('api-system-v1', 'bodies') or not isinstance(reply, dict):
+            return
+
+        with self._lock:
+            if self._db is None or self._db.execute(
+                    "SELECT 1 FROM dumps WHERE kind = ? AND complete IS NOT NULL", (self.BODIES,)).fetchone() is None:
+                return
+            if reply.get('id64') is not None and reply.get('bodyCount') is not None:
+                self._db.execute("UPDATE systems SET bodyCount = ? WHERE id64 = ?", (reply['bodyCount'], reply['id64']))
+            self._put_bodies(dict(body, systemId64=reply.get('id64'), systemName=reply.get('name'))
+                             for body in reply.get('bodies') or [])
+            self._db.commit()
+
+    #  ___                   _
+    # |_ _|_ __  _ __  ___ _| |_
+    #  | || '  \| '_ \/ _ \ '_|  _|
+    # |___|_|_|_| .__/\___/_|  \__|
+    #           |_|
+
+    def update(self, session, kinds=(SYSTEMS,), interrupt=None):
+        """Download and import the dumps that are due, blocking until done.
+
+        A kind is imported from its full dump the first time, or when the index fell more than
+        DELTA_DAYS behind; from its seven day dump otherwise.
+        :param session: a `requests.Session` to download with.
+        :param kinds: the kinds of records to update. BODIES is left out by default: its full dump is tens
+            of gigabytes once unpacked, for lookups that also need a bodyCount learned from live replies.
+        :param interrupt: optional `threading.Event` that stops the import when set.
+        :return: the number of records imported.
+        """
+
+        imported = 0
+        for kind in kinds:
+            if interrupt is not None and interrupt.is_set():
+                break
+            if not self.needs_update(kind):
+                continue
+            full = not self.is_current(kind)
+            name = (self.FULL_DUMPS if full else self.DELTA_DUMPS)[kind]
+            started = time.time()
+            self.logger.info("Importing EDSM dump %s.", name)
+            response = session.get(self.DUMP_URL.format(name=name), stream=True, timeout=self.DOWNLOAD_TIMEOUT)
+            try:
+                response.raise_for_status()
+                count = self.import_dump(kind, response.iter_content(CHUNK_SIZE), interrupt)
+            finally:
+                response.close()
+            if count is None:
+                self.logger.info("Import of EDSM dump %s interrupted.", name)
+                break
+
+            self._imported(kind, full, started)
+            imported += count
+            self.logger.info("Imported %s records from EDSM dump %s.", count, name)
+        return imported
+
+    def import_dump(self, kind, chunks, interrupt=None):
+        """Import the records of a gzipped dump.
+
+        :param kind: SYSTEMS or BODIES.
+        :param chunks: iterable of the compressed bytes.
+        :param interrupt: optional `threading.Event` that stops the import when set.
+        :return: the number of records imported, None if interrupted or closed.
+        """
+
+        put = self._put_systems if kind == self.SYSTEMS else self._put_bodies
+        count = 0
+        batch = []
+        for record in iter_records(_gunzip(chunks)):
+            if isinstance(record, dict):
+                batch.append(record)
+            if len(batch) >= self.BATCH_SIZE:
+                if not self._write(put, batch, interrupt):
+                    return None
+                count += len(batch)
+                batch = []
+        if not self._write(put, batch, interrupt):
+            return None
+        return count + len(batch)
+
+    def _write(self, put, records, interrupt):
+        """Write a batch in one transaction. The lock is released in between, so lookups go on during an import."""
+
+        if interrupt is not None and interrupt.is_set():
+            return False
+        with self._lock:
+            if self._db is None:
+                return False
+            put(records)
+            self._db.commit()
+            self.imported += len(records)
+        return True
+
+    def _put_systems(self, records):
+        rows = []
+        for record in records:
+            coords = record.get('coords') or {}
+            if record.get('id64') is None or not record.get('name') or coords.get('x') is None:
+                continue
+            rows.append((record['id64'], record.get('id'), record['name'], coords['x'], coords['y'], coords['z']))
+
+        self._db.executemany(
+            "INSERT INTO systems (id64, id, name, x, y, z) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (id64) DO UPDATE SET id = excluded.id, name = excluded.name,"
+            " x = excluded.x, y = excluded.y, z = excluded.z",
+            rows,
+        )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO systems_coords (id64, minX, maxX, minY, maxY, minZ, maxZ)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(id64, x, x, y, y, z, z) for (id64, _id, _name, x, y, z) in rows],
+        )
+
+    def _put_bodies(self, records):
+        """Upsert bodies, each stored as compressed compact JSON without the fields of its system."""
+
+        rows = []
+        for record in records:
+            if record.get('id') is None:
+                continue
+            body = dict((field, value) for (field, value) in record.items() if not field.startswith('system'))
+            data = zlib.compress(json.dumps(body, separators=(',', ':')).encode('utf-8'))
+            rows.append((record['id'], record.get('systemId64'), record.get('systemName'), record.get('bodyId'),
+                         record.get('updateTime'), data))
+
+        # Keep the newest copy of a body: a delta dump may be older than a live reply we learned from.
+        self._db.executemany(
+            "INSERT INTO bodies (id, systemId64, systemName, bodyId, updateTime, body) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET systemId64 = excluded.systemId64, systemName = excluded.systemName,"
+            " bodyId = excluded.bodyId, updateTime = excluded.updateTime, body = excluded.body"
+            " WHERE excluded.updateTime IS NULL OR bodies.updateTime IS NULL"
+            " OR excluded.updateTime >= bodies.updateTime",
+            rows,
+        )
+
+    def _imported(self, kind, full, started):
+        """Record a finished import; `started` is when its dump was requested."""
+
+        with self._lock:
+            if self._db is None:
+                return
+            row = self._db.execute("SELECT complete FROM dumps WHERE kind = ?", (kind,)).fetchone()
+            complete = started if full else (row[0] if row else None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO dumps (kind, complete, updated) VALUES (?, ?, ?)",
+                (kind, complete, started),
+            )
+            self._db.commit()
+
+    def stats(self):
+        """Return lookup counters, the number of imported records and which kinds are current."""
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'imported': self.imported,
+                'current': [kind for kind in (self.SYSTEMS, self.BODIES) if self.is_current(kind)],
+            }
+
+
+def _gunzip(chunks):
+    """Decompress a gzipped stream of bytes chunk by chunk."""
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
@@ -5,16 +5,25 @@
 
 from version import VERSION
 from fields import EDSM_CALLBACK_SEQUENCE
-from fields import LOG_DEBUG, LOG_INFO, LOG_OUTPUT
 from fields import JOURNAL_ENTRY_FIELD_EVENT, JOURNAL_ENTRY_VALUE_EVENT_FSS_DISCOVERY_SCAN, \
     JOURNAL_ENTRY_FIELD_BODY_COUNT, JOURNAL_ENTRY_VALUE_EVENT_SCAN, JOURNAL_ENTRY_FIELD_SCAN_TYPE, \
     JOURNAL_ENTRY_VALUE_SCAN_TYPE_AUTOSCAN, JOURNAL_ENTRY_VALUE_SCAN_TYPE_DETAILED, JOURNAL_ENTRY_FIELD_BODY_NAME, \
-    LOG_WARN, EDSM_RESPONSE_FIELD_BODY_COUNT, EDSM_RESPONSE_FIELD_BODIES, EDSM_RESPONSE_FIELD_NAME
-
+    JOURNAL_ENTRY_FIELD_SYSTEM_ADDRESS, JOURNAL_ENTRY_FIELD_STAR_SYSTEM, JOURNAL_ENTRY_FIELD_NAME, \
+    JOURNAL_ENTRY_FIELD_ROUTE, JOURNAL_ENTRY_VALUE_EVENT_NAV_ROUTE, JOURNAL_ENTRY_VALUE_EVENT_NAV_ROUTE_CLEAR, \
+    JOURNAL_ENTRY_VALUE_EVENT_FSD_TARGET, JOURNAL_ENTRY_VALUE_EVENT_FSDJUMP, JOURNAL_ENTRY_VALUE_EVENT_LOCATION, \
+    JOURNAL_ENTRY_VALUE_EVENT_CARRIER_JUMP, \
+    EDSM_RESPONSE_FIELD_BODY_COUNT, EDSM_RESPONSE_FIELD_BODIES, EDSM_RESPONSE_FIELD_NAME, EDSM_RESPONSE_FIELD_ID64
+
+from logs import get_logger, Lazy
+from bodies import SystemBodies, SystemBodiesCache
+from settings import Settings
+from breaker import CircuitBreaker
 from edsmquery.edsmquery import EDSM_QUERIES
 
 # System
+import os
 import sys
+import time
 from pprint import pformat
 
 # EDMarketConnector: Core
@@ -37,31 +46,61 @@ _ = functools.partial(l10n.Translations.translate, context=__file__)
 
 this = sys.modules[__name__]  # For holding module globals
 
-this.LOG_LEVEL = LOG_INFO  # Change this to LOG_DEBUG if you are debugging.
-this.LOG_PREFIX = "edsmquery: load.py > "
+# Use logger.setLevel(logging.DEBUG) if you are debugging.
+logger = get_logger('load')
 
 # Configuration keys used. Some are defaulted at plugin startup (if needed) to workaround getint() and unset values.
 CONFIG_KEY_DISABLE_AUTO_SYSTEM_BODIES = 'edsmquery.disable_auto_edsm_system_bodies'
 CONFIG_KEY_SHOW_SCAN_PROGRESS = 'edsmquery.show_edsm_bodies_scan_progress'
 CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS = 'edsmquery.hide_scan_progress_if_complete'
+CONFIG_KEY_WORKERS = 'edsmquery.workers'
+CONFIG_KEY_PREFETCH_ROUTE_SYSTEMS = 'edsmquery.prefetch_route_systems'
+CONFIG_KEY_GALAXY_INDEX = 'edsmquery.galaxy_index'
+
+# Supersession key for the bodies request of the system we are in. A newer jump cancels the older request.
+SUPERSEDE_CURRENT_SYSTEM_BODIES = 'edsmquery.current_system_bodies'
+# Supersession keys of the prefetch requests for the systems on the plotted route, see _prefetch_route().
+SUPERSEDE_ROUTE_PREFETCH_SYSTEM = 'edsmquery.route_prefetch.system.{system}'
+SUPERSEDE_ROUTE_PREFETCH_BODIES = 'edsmquery.route_prefetch.bodies.{system}'
+
+# Events whose SystemAddress is the system we are in. Others (i.e. FSDTarget) refer to another system.
+CURRENT_SYSTEM_EVENTS = (
+    JOURNAL_ENTRY_VALUE_EVENT_LOCATION,
+    JOURNAL_ENTRY_VALUE_EVENT_FSDJUMP,
+    JOURNAL_ENTRY_VALUE_EVENT_CARRIER_JUMP,
+)
+
+# Persistent EDSM response cache, stored in the plugin directory.
+CACHE_FILENAME = 'edsmquery-cache.sqlite'
+
+# Body state of recently visited systems, stored in the plugin directory.
+BODIES_FILENAME = 'edsmquery-bodies.sqlite'
+
+# Local index of the EDSM nightly dumps (see GalaxyIndex), stored in the plugin directory.
+GALAXY_FILENAME = 'edsmquery-galaxy.sqlite'
+
+# Minimum time between two redraws of the progress bar, in milliseconds.
+PROGRESS_FRAME_INTERVAL = 100
 
 # 0: disable, 1: enabled.
 CONFIG_DEFAULTS = {
     CONFIG_KEY_DISABLE_AUTO_SYSTEM_BODIES: False,
     CONFIG_KEY_SHOW_SCAN_PROGRESS: True,
     CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS: False,
+    CONFIG_KEY_WORKERS: EDSM_QUERIES.WORKERS,
+    CONFIG_KEY_PREFETCH_ROUTE_SYSTEMS: 5,
+    CONFIG_KEY_GALAXY_INDEX: False,
 }
 
-
-def log(level, message):
-    """Print a log message.
-
-    :param level: level of the log message
-    :param message: the message to print
-    """
-    print_level = LOG_OUTPUT.get(level, 'UNKNOWN')
-    if level <= this.LOG_LEVEL:
-        print("{prefix}{level}: {message}".format(prefix=this.LOG_PREFIX, level=print_level, message=message))
+# Attributes of this.settings, mapped to their config key.
+SETTINGS = {
+    'disableAutoSystemBodies': CONFIG_KEY_DISABLE_AUTO_SYSTEM_BODIES,
+    'showScanProgress': CONFIG_KEY_SHOW_SCAN_PROGRESS,
+    'hideCompleteScanProgress': CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS,
+    'workers': CONFIG_KEY_WORKERS,
+    'prefetchRouteSystems': CONFIG_KEY_PREFETCH_ROUTE_SYSTEMS,
+    'galaxyIndex': CONFIG_KEY_GALAXY_INDEX,
+}
 
 
 def plugin_start3(plugin_dir):
@@ -69,7 +108,7 @@ def plugin_start3(plugin_dir):
     return plugin_start(plugin_dir)
 
 
-def plugin_start(_plugin_dir):
+def plugin_start(plugin_dir):
     """Perform plugin initialization."""
 
     #                |
@@ -77,22 +116,48 @@ def plugin_start(_plugin_dir):
     # | | ||   ||    |  \ |---'|
     # `-'-'`---'`    `   ``---'`
 
+    # Preferences are read once here and refreshed in prefs_changed().
+    this.settings = Settings(SETTINGS, CONFIG_DEFAULTS)
+    this.settings.load(config)
+
     this.edsmQueries = EDSM_QUERIES  # Background threading
+    this.edsmQueries.apply_settings(this.settings)
+    this.edsmQueries.cache.open(os.path.join(plugin_dir, CACHE_FILENAME))
     this.lastEDSMRequest = None  # System name of the last request we sent out to prevent hammering.
+    this.galaxyPath = os.path.join(plugin_dir, GALAXY_FILENAME)
+    _apply_galaxy_index()
 
-    # Used by our progress bar
-    this.currentSystem = None
-    this.currentSystemBodyCount = 0
-    this.currentKnownBodies = []
+    # Plugin callbacks per (api, endpoint), see _edsmquery_handlers().
+    this.dispatchTable = dict()
+    this.dispatchSignature = None
 
-    log(LOG_INFO, "{name} (v{version}) initialized.".format(name='edsmquery', version=VERSION))
+    # Used by our progress bar
+    this.bodiesCache = SystemBodiesCache()
+    this.bodiesCache.open(os.path.join(plugin_dir, BODIES_FILENAME))
+    this.systemBodies = SystemBodies()
+    # Pending redraw (see __update_progress_frame) and what is currently on screen.
+    this.progressRenderId = None
+    this.progressRenderedAt = 0
+    this.progressRendered = (None, None, None, None)
+
+    # The plotted route as (system name, system address) and the systems we are prefetching.
+    this.route = []
+    this.prefetching = dict()
+
+    logger.info("%s (v%s) initialized.", 'edsmquery', VERSION)
     return 'edsmquery'
 
 
 def plugin_stop():
     """Stop and cleanup all running threads."""
 
+    if this.progressRenderId is not None:
+        this.wrapped_parent.after_cancel(this.progressRenderId)
+        this.progressRenderId = None
     this.edsmQueries.stop()
+    this.edsmQueries.cache.close()
+    this.edsmQueries.galaxy.close()
+    this.bodiesCache.close()
 
 
 def plugin_app(parent):
@@ -100,24 +165,25 @@ def plugin_app(parent):
     this.edsmQueries.callbackWidget = parent
     # Bind to events thrown by edsmquery
     parent.bind(EDSM_CALLBACK_SEQUENCE, _edsm_callback_received)
+    # Replies to requests made before we had a widget (i.e. from another plugin's plugin_start).
+    this.edsmQueries.signal_pending()
 
     # this.edsmQueries.start(parent)
     __initialize_progress_frame(parent)
     __update_progress_frame()
+    this.edsmQueries.add_breaker_listener(_edsm_availability_changed)
     return this.wrapped_parent
 
 
-def config_bool(key: str) -> bool:
-    """Gets a boolean or uses the default"""
-    return config.get_bool(key, default=CONFIG_DEFAULTS[key])
-
-
 def plugin_prefs(parent, _cmdr, _is_beta):
     """Return a Tk Frame for adding to the EDMC settings dialog."""
     # used IntVars for configuration settings.
-    this.disable_auto_edsm_system_bodies = tk.IntVar(value=config_bool(CONFIG_KEY_DISABLE_AUTO_SYSTEM_BODIES))
-    this.show_edsm_system_scan_progress = tk.IntVar(value=config_bool(CONFIG_KEY_SHOW_SCAN_PROGRESS))
-    this.hide_complete_scan_progress = tk.IntVar(value=config_bool(CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS))
+    this.disable_auto_edsm_system_bodies = tk.IntVar(value=this.settings.disableAutoSystemBodies)
+    this.show_edsm_system_scan_progress = tk.IntVar(value=this.settings.showScanProgress)
+    this.hide_complete_scan_progress = tk.IntVar(value=this.settings.hideCompleteScanProgress)
+    this.workers = tk.IntVar(value=this.settings.workers)
+    this.prefetch_route_systems = tk.IntVar(value=this.settings.prefetchRouteSystems)
+    this.galaxy_index = tk.IntVar(value=this.settings.galaxyIndex)
 
     text_show_edsm_system_scan_progress = _("Show EDSM scanned bodies progress for the current system.")
     text_hide_complete_scan_progress = _("Hide the progressbar if all bodies have been scanned.")
@@ -125,6 +191,9 @@ def plugin_prefs(parent, _cmdr, _is_beta):
     text_advanced_options = _("Advanced preferences:")
     text_system_bodies_api_checkbutton = _("Disable auto EDSM system/bodies request for known systems.")
     text_system_bodies_api_warn_plugins = _("Warning: Plugins listed below may fail to work correctly, if disabled.")
+    text_workers = _("Parallel EDSM requests:")
+    text_prefetch_route_systems = _("Prefetch bodies for the next systems on the route (0 to disable):")
+    text_galaxy_index = _("Answer system lookups from a local copy of the EDSM nightly dumps (large download).")
 
     frame = nb.Frame(parent)
     nb.Checkbutton(frame, text=text_show_edsm_system_scan_progress, variable=this.show_edsm_system_scan_progress,
@@ -136,6 +205,18 @@ def plugin_prefs(parent, _cmdr, _is_beta):
     ttk.Separator(frame).grid(sticky=tk.E + tk.W, padx=0, pady=5)
     nb.Label(frame, text=text_advanced_options, justify=tk.LEFT) \
         .grid(sticky=tk.W, pady=5)
+    workers_frame = nb.Frame(frame)
+    nb.Label(workers_frame, text=text_workers, justify=tk.LEFT) \
+        .grid(column=0, row=0, sticky=tk.W)
+    nb.Entry(workers_frame, textvariable=this.workers, width=3) \
+        .grid(column=1, row=0, sticky=tk.W)
+    nb.Label(workers_frame, text=text_prefetch_route_systems, justify=tk.LEFT) \
+        .grid(column=0, row=1, sticky=tk.W)
+    nb.Entry(workers_frame, textvariable=this.prefetch_route_systems, width=3) \
+        .grid(column=1, row=1, sticky=tk.W)
+    workers_frame.grid(sticky=tk.W)
+    nb.Checkbutton(frame, text=text_galaxy_index, variable=this.galaxy_index) \
+        .grid(sticky=tk.W)
     nb.Checkbutton(frame, text=text_system_bodies_api_checkbutton,
                    variable=this.disable_auto_edsm_system_bodies,
                    offvalue=-1, onvalue=1) \
@@ -165,9 +246,44 @@ def prefs_changed(_cmdr, _is_beta):
     config.set(CONFIG_KEY_DISABLE_AUTO_SYSTEM_BODIES, str(this.disable_auto_edsm_system_bodies.get()))
     config.set(CONFIG_KEY_SHOW_SCAN_PROGRESS, str(this.show_edsm_system_scan_progress.get()))
     config.set(CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS, str(this.hide_complete_scan_progress.get()))
+    try:
+        workers = this.workers.get()
+    except tk.TclError:
+        logger.warning("Ignoring invalid number of parallel requests.")
+    else:
+        config.set(CONFIG_KEY_WORKERS, max(1, min(workers, EDSM_QUERIES.MAX_WORKERS)))
+    try:
+        prefetch_route_systems = this.prefetch_route_systems.get()
+    except tk.TclError:
+        logger.warning("Ignoring invalid number of route systems to prefetch.")
+    else:
+        config.set(CONFIG_KEY_PREFETCH_ROUTE_SYSTEMS, max(0, prefetch_route_systems))
+    config.set(CONFIG_KEY_GALAXY_INDEX, bool(this.galaxy_index.get()))
+
+    changed = this.settings.load(config)
+    logger.debug("Changed settings: %s", Lazy(", ".join, sorted(changed)))
+    this.edsmQueries.apply_settings(this.settings)
+    if 'galaxyIndex' in changed:
+        _apply_galaxy_index()
+    if 'prefetchRouteSystems' in changed:
+        _prefetch_route()
     __update_progress_frame()
 
 
+def _apply_galaxy_index():
+    """Open (and bring up to date) or close the local galaxy index, following the preferences."""
+
+    galaxy = this.edsmQueries.galaxy
+    if not this.settings.galaxyIndex:
+        galaxy.close()
+        return
+
+    if not galaxy.is_open:
+        galaxy.open(this.galaxyPath)
+    if this.edsmQueries.update_galaxy():
+        logger.info("Updating the local galaxy index from the EDSM dumps.")
+
+
 def __initialize_progress_frame(parent):
     this.system_progress = tk.IntVar(value=0)
     this.wrapped_parent = tk.Frame(parent)
@@ -190,63 +306,113 @@ def __initialize_progress_frame(parent):
                                                style="red.Horizontal.TProgressbar")
 
     this.system_progress_label = tk.Label(this.progress_frame, text="[?/?]")
+    this.edsm_status_label = tk.Label(this.progress_frame, text="", foreground="red")
 
     this.edsm_progress_label.grid(column=0, row=0)
     this.system_progress_bar.grid(column=1, row=0, sticky=tk.E + tk.W)
     this.system_progress_label.grid(column=2, row=0)
+    this.edsm_status_label.grid(column=3, row=0)
 
     this.progress_frame.grid(columnspan=2, sticky=tk.N + tk.W + tk.E + tk.S)
     this.progress_frame.grid_columnconfigure(0, weight=0)
     this.progress_frame.grid_columnconfigure(1, weight=5)
     this.progress_frame.grid_columnconfigure(2, weight=0)
+    this.progress_frame.grid_columnconfigure(3, weight=0)
     this.wrapped_parent.grid_columnconfigure(0, weight=1)
     return this.wrapped_parent
 
 
 def __update_progress_frame():
-    if not config_bool(CONFIG_KEY_SHOW_SCAN_PROGRESS):
-        this.progress_frame.grid_forget()
+    """Mark the progress bar as changed.
+
+    The actual redraw is deferred to the Tk main loop and happens at most once every
+    PROGRESS_FRAME_INTERVAL, so bursts of scans and replies result in a single redraw.
+    """
+
+    if this.progressRenderId is not None:
+        return
+
+    wait = PROGRESS_FRAME_INTERVAL - int((time.monotonic() - this.progressRenderedAt) * 1000)
+    if wait > 0:
+        this.progressRenderId = this.wrapped_parent.after(wait, __render_progress_frame)
+    else:
+        this.progressRenderId = this.wrapped_parent.after_idle(__render_progress_frame)
+
+
+def __render_progress_frame():
+    """Redraw the progress bar, only touching the widgets whose value changed."""
+
+    this.progressRenderId = None
+    this.progressRenderedAt = time.monotonic()
+
+    system_bodies = this.systemBodies
+    progress = system_bodies.progress
+    unavailable = any(state != CircuitBreaker.CLOSED for state in this.edsmQueries.breaker_states().values())
+    if not this.settings.showScanProgress:
+        visible = False
+    elif this.settings.hideCompleteScanProgress:
+        visible = unavailable or (len(system_bodies) > 0 if progress is None else progress < 100)
+    else:
+        visible = True
+    status = _("EDSM unavailable") if unavailable else ""
+
+    if progress is None:
+        label = '[?/?]'
     else:
-        if this.currentSystemBodyCount == 0:
-            this.system_progress.set(0)
-            this.system_progress_label.config(text='[?/?]')
-            if config_bool(CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS) and len(this.currentKnownBodies) == 0:
-                this.progress_frame.grid_forget()
-            else:
-                this.progress_frame.grid(columnspan=2, sticky=tk.N + tk.W + tk.E + tk.S)
+        label = "{done}/{total}".format(
+            done=len(system_bodies),
+            total=system_bodies.bodyCount,
+        )
+
+    (rendered_visible, rendered_progress, rendered_label, rendered_status) = this.progressRendered
+    if visible:
+        if progress != rendered_progress:
+            this.system_progress.set(progress or 0)
+        if label != rendered_label:
+            this.system_progress_label.config(text=label)
+        if status != rendered_status:
+            this.edsm_status_label.config(text=status)
+    if visible != rendered_visible:
+        if visible:
+            this.progress_frame.grid(columnspan=2, sticky=tk.N + tk.W + tk.E + tk.S)
         else:
-            progress = len(this.currentKnownBodies) * 100 / this.currentSystemBodyCount
-            this.system_progress.set(progress)
-            this.system_progress_label["text"] = "{done}/{total}".format(
-                done=len(this.currentKnownBodies),
-                total=this.currentSystemBodyCount,
-            )
-            if config_bool(CONFIG_KEY_HIDE_COMPLETE_SCAN_PROGRESS) and progress >= 100:
-                this.progress_frame.grid_forget()
-            else:
-                this.progress_frame.grid(columnspan=2, sticky=tk.N + tk.W + tk.E + tk.S)
+            this.progress_frame.grid_forget()
 
-    this.wrapped_parent.update()
+    if visible:
+        this.progressRendered = (visible, progress, label, status)
+    else:
+        # Hidden widgets are not updated, so refresh them when they are shown again.
+        this.progressRendered = (visible, rendered_progress, rendered_label, rendered_status)
 
 
-def journal_entry(_cmdr, _is_beta, system, _station, entry, _state):
+def _edsm_availability_changed(base_url, state):
+    """Show whether EDSM is available, see EDSMQueries.add_breaker_listener()."""
+
+    logger.debug("EDSM (%s) is %s.", base_url, state)
+    __update_progress_frame()
+
+
+def journal_entry(_cmdr, _is_beta, system, _station, entry, state):
     """Process EDMarketConnector journal entry."""
     need_ui_update = False
-    log(LOG_DEBUG, "Journal entry received: {event}".format(event=entry['event']))
-    log(LOG_DEBUG, "  event: {event}".format(event=pformat(entry)))
-
-    if this.currentSystem != system:
-        this.currentSystemBodyCount = 0
-        this.currentKnownBodies = []
-        this.currentSystem = system
+    logger.debug("Journal entry received: %s", entry['event'])
+    logger.debug("  event: %s", Lazy(pformat, entry))
+
+    address = state.get(JOURNAL_ENTRY_FIELD_SYSTEM_ADDRESS)
+    if entry[JOURNAL_ENTRY_FIELD_EVENT] in CURRENT_SYSTEM_EVENTS:
+        address = entry.get(JOURNAL_ENTRY_FIELD_SYSTEM_ADDRESS, address)
+    if this.systemBodies.name != system \
+            or (address is not None and this.systemBodies.address != address):
+        # Keep what we know about the system we leave, and restore what we know about the new one.
+        this.bodiesCache.save()
+        this.systemBodies = this.bodiesCache.get(address, system)
         need_ui_update = True
-        log(LOG_WARN, "New system entered. Clearing all values.")
+        logger.info("New system entered: %s (%s known bodies).", system, len(this.systemBodies))
 
     # discovery scan
     if entry[JOURNAL_ENTRY_FIELD_EVENT] == JOURNAL_ENTRY_VALUE_EVENT_FSS_DISCOVERY_SCAN \
-            and this.currentSystemBodyCount != entry[JOURNAL_ENTRY_FIELD_BODY_COUNT]:
-        log(LOG_DEBUG, "Discovery Scan detected")
-        this.currentSystemBodyCount = entry[JOURNAL_ENTRY_FIELD_BODY_COUNT]
+            and this.systemBodies.set_body_count(entry[JOURNAL_ENTRY_FIELD_BODY_COUNT]):
+        logger.debug("Discovery Scan detected")
         need_ui_update = True
 
     # planet scan / auto scan
@@ -254,57 +420,149 @@ def journal_entry(_cmdr, _is_beta, system, _station, entry, _state):
             and entry[JOURNAL_ENTRY_FIELD_SCAN_TYPE] in [JOURNAL_ENTRY_VALUE_SCAN_TYPE_AUTOSCAN,
                                                          JOURNAL_ENTRY_VALUE_SCAN_TYPE_DETAILED]:
 
-        log(LOG_DEBUG, "Scanned body: {event}".format(event=pformat(entry)))
-        body_name = entry[JOURNAL_ENTRY_FIELD_BODY_NAME]
-        if 'belt cluster' not in body_name.lower() and body_name not in this.currentKnownBodies:
-            this.currentKnownBodies.append(body_name)
+        logger.debug("Scanned body: %s", Lazy(pformat, entry))
+        if this.systemBodies.add_journal_body(entry[JOURNAL_ENTRY_FIELD_BODY_NAME]):
             need_ui_update = True
 
+    # plotted route
+    event = entry[JOURNAL_ENTRY_FIELD_EVENT]
+    if event == JOURNAL_ENTRY_VALUE_EVENT_NAV_ROUTE:
+        route = entry.get(JOURNAL_ENTRY_FIELD_ROUTE) or (state.get('NavRoute') or {}).get(JOURNAL_ENTRY_FIELD_ROUTE, [])
+        this.route = [(hop[JOURNAL_ENTRY_FIELD_STAR_SYSTEM], hop.get(JOURNAL_ENTRY_FIELD_SYSTEM_ADDRESS))
+                      for hop in route]
+        _prefetch_route()
+    elif event == JOURNAL_ENTRY_VALUE_EVENT_NAV_ROUTE_CLEAR:
+        this.route = []
+        _prefetch_route()
+    elif event == JOURNAL_ENTRY_VALUE_EVENT_FSD_TARGET:
+        target = (entry[JOURNAL_ENTRY_FIELD_NAME], entry.get(JOURNAL_ENTRY_FIELD_SYSTEM_ADDRESS))
+        if target[0] not in [name for (name, _address) in this.route]:
+            # Targeted a system off the plotted route.
+            this.route = [target]
+        _prefetch_route()
+    elif event == JOURNAL_ENTRY_VALUE_EVENT_FSDJUMP:
+        _prefetch_route()
+
     if need_ui_update:
         __update_progress_frame()
 
 
+def _prefetch_route():
+    """Prefetch the bodies of the next systems on the plotted route.
+
+    Requests go to the bulk lane. The systems are first looked up with api-v1/system, which
+    EDSMQueries merges into bulk api-v1/systems requests, and bodies are only requested for
+    systems EDSM knows. Replies end up in the response cache and this.bodiesCache, so both the
+    progress bar and the bodies request on arrival are answered without waiting for EDSM.
+    Prefetches for systems that dropped out of the next `prefetchRouteSystems` are cancelled.
+    """
+
+    names = [name for (name, _address) in this.route]
+    current = this.systemBodies.name
+    start = names.index(current) + 1 if current in names else 0
+    upcoming = [(name, address) for (name, address) in this.route[start:] if name != current]
+    upcoming = upcoming[:max(0, this.settings.prefetchRouteSystems)]
+
+    upcoming_names = [name for (name, _address) in upcoming]
+    for name in list(this.prefetching):
+        if name not in upcoming_names:
+            del this.prefetching[name]
+            EDSM_QUERIES.cancel(SUPERSEDE_ROUTE_PREFETCH_SYSTEM.format(system=name))
+            EDSM_QUERIES.cancel(SUPERSEDE_ROUTE_PREFETCH_BODIES.format(system=name))
+
+    for (name, address) in upcoming:
+        if name in this.prefetching:
+            continue
+        this.prefetching[name] = address
+        logger.debug("Prefetching EDSM bodies of route system %s.", name)
+        EDSM_QUERIES.request_get(
+            EDSM_QUERIES.API_V1,
+            EDSM_QUERIES.API_V1__SYSTEM,
+            priority=EDSM_QUERIES.PRIORITY_BULK,
+            supersede=SUPERSEDE_ROUTE_PREFETCH_SYSTEM.format(system=name),
+            broadcast=False,
+            systemName=name,
+            showId=1,
+        ).then(functools.partial(_prefetch_bodies, name))
+
+
+def _prefetch_bodies(name, system):
+    """Request the bodies of a route system EDSM knows about (see _prefetch_route())."""
+
+    if not system or name not in this.prefetching:
+        # Unknown to EDSM, or no longer on the route.
+        return None
+
+    future = EDSM_QUERIES.request_get(
+        EDSM_QUERIES.API_SYSTEM_V1,
+        EDSM_QUERIES.API_SYSTEM_V1__BODIES,
+        priority=EDSM_QUERIES.PRIORITY_BULK,
+        supersede=SUPERSEDE_ROUTE_PREFETCH_BODIES.format(system=name),
+        broadcast=False,
+        systemName=name,
+    )
+    return future.then(functools.partial(_prefetched_bodies, name))
+
+
+def _prefetched_bodies(name, response):
+    """Store prefetched bodies in the body state cache."""
+
+    address = response.get(EDSM_RESPONSE_FIELD_ID64, this.prefetching.get(name))
+    system_bodies = this.bodiesCache.get(address, response.get(EDSM_RESPONSE_FIELD_NAME, name))
+    if _merge_edsm_bodies(system_bodies, response) and system_bodies is this.systemBodies:
+        # Arrived before the prefetch did.
+        __update_progress_frame()
+    return response
+
+
 def edsm_querier_response_api_system_v1_bodies(request, response):
     """Handle EDSM api-system-v1/bodies responses."""
-    log(LOG_DEBUG, "Self received system bodies responses.")
+    logger.debug("Self received system bodies responses.")
     (_api, _endpoint, _method, _params) = request
     need_ui_update = False
     if response:
-        log(LOG_DEBUG, "EDSM bodies: {event}".format(event=pformat(response)))
-        system = response['name']
+        logger.debug("EDSM bodies: %s", Lazy(pformat, response))
+        system = response[EDSM_RESPONSE_FIELD_NAME]
         if monitor.system != system:
-            log(LOG_WARN, "systems disagree on where we are!")
-            log(LOG_DEBUG, "  + system: {system}".format(system=system))
-            log(LOG_DEBUG, "  + monitor.system: {system}".format(system=monitor.system))
-            log(LOG_DEBUG, "  + this.currentSystem: {system}".format(system=this.currentSystem))
-            # woops, bit late or something?
+            # A late reply, or one requested by another plugin: remember it for when we get there.
+            logger.debug("Storing EDSM bodies of %s, we are in %s.", system, monitor.system)
+            _merge_edsm_bodies(this.bodiesCache.get(response.get(EDSM_RESPONSE_FIELD_ID64), system), response)
             return True
 
-        if this.currentSystem != system:
-            this.currentSystem = system
-            this.currentKnownBodies = []
-            this.currentSystemBodyCount = 0
+        if this.systemBodies.name != system:
+            this.systemBodies = this.bodiesCache.get(response.get(EDSM_RESPONSE_FIELD_ID64), system)
+            need_ui_update = True
 
-        body_count = response.get(EDSM_RESPONSE_FIELD_BODY_COUNT, None)
-        log(LOG_DEBUG, "EDSM.bodyCount: {count}".format(count=body_count))
-        if body_count is not None:
-            if this.currentSystemBodyCount != body_count:
-                need_ui_update = True
-            this.currentSystemBodyCount = body_count
+        if _merge_edsm_bodies(this.systemBodies, response):
+            need_ui_update = True
 
-        bodies = response.get(EDSM_RESPONSE_FIELD_BODIES, [])
+    if need_ui_update:
+        __update_progress_frame()
 
-        for body in bodies:
-            planet = body[EDSM_RESPONSE_FIELD_NAME]
-            log(LOG_DEBUG, "EDSM: planet: {planet}".format(planet=planet))
-            if planet not in this.currentKnownBodies:
-                this.currentKnownBodies.append(planet)
-                need_ui_update = True
 
-        log(LOG_DEBUG, "EDSM: Current bodies after import: {list}".format(list=", ".join(this.currentKnownBodies)))
+def _merge_edsm_bodies(system_bodies, response):
+    """Merge an EDSM bodies reply into the state of its system.
 
-    if need_ui_update:
-        __update_progress_frame()
+    :return: True if anything changed.
+    """
+
+    changed = False
+    body_count = response.get(EDSM_RESPONSE_FIELD_BODY_COUNT, None)
+    logger.debug("EDSM.bodyCount: %s", body_count)
+    if system_bodies.set_body_count(body_count):
+        changed = True
+
+    bodies = response.get(EDSM_RESPONSE_FIELD_BODIES, [])
+
+    for body in bodies:
+        planet = body[EDSM_RESPONSE_FIELD_NAME]
+        logger.debug("EDSM: planet: %s", planet)
+        if system_bodies.add_edsm_body(planet):
+            changed = True
+
+    logger.debug("EDSM: Current bodies after import: %s", Lazy(", ".join, system_bodies.bodies))
+
+    return changed
 
 
 #  ___       _                        _
@@ -332,6 +590,42 @@ def _edsmquery_callbacks(api, endpoint):
     ]
 
 
+def _edsmquery_dispatch_table():
+    """Return the callback dispatch table, starting a new one if the loaded plugins changed."""
+
+    signature = tuple((plugin.name, id(plugin.module)) for plugin in plug.PLUGINS)
+    if this.dispatchSignature != signature:
+        logger.debug("Plugins changed, rebuilding the callback dispatch table.")
+        this.dispatchSignature = signature
+        this.dispatchTable = dict()
+    return this.dispatchTable
+
+
+def _edsmquery_handlers(api, endpoint, table=None):
+    """Return the callbacks plugins implement for an api/endpoint combination.
+
+    The result is an ordered list of `(plugin, [(callback_name, function), ...])` with the callbacks
+    of each plugin ordered more specific first. It is computed once per api/endpoint and kept in the
+    dispatch table.
+    """
+
+    if table is None:
+        table = _edsmquery_dispatch_table()
+
+    handlers = table.get((api, endpoint))
+    if handlers is None:
+        handlers = []
+        api_callbacks = _edsmquery_callbacks(api, endpoint)
+        for plugin in plug.PLUGINS:
+            callbacks = [(api_callback, getattr(plugin.module, api_callback))
+                         for api_callback in api_callbacks if hasattr(plugin.module, api_callback)]
+            if callbacks:
+                handlers.append((plugin, callbacks))
+        table[(api, endpoint)] = handlers
+
+    return handlers
+
+
 def _edsmquery_plugins_usage_callback(api, endpoint):
     """
     List all plugins that use an api/endpoint.
@@ -340,15 +634,8 @@ def _edsmquery_plugins_usage_callback(api, endpoint):
     """
 
     usage = dict()
-    for plugin in plug.PLUGINS:
-        for api_callback in _edsmquery_callbacks(api, endpoint):
-            log(LOG_DEBUG, "checking for function: '{func}' on {plugin}".format(
-                func=api_callback,
-                plugin=plugin.name,
-            ))
-            if hasattr(plugin.module, api_callback):
-                usage.setdefault(plugin, [])
-                usage[plugin].append(api_callback)
+    for (plugin, callbacks) in _edsmquery_handlers(api, endpoint):
+        usage[plugin] = [api_callback for (api_callback, _function) in callbacks]
 
     return usage
 
@@ -356,6 +643,10 @@ def _edsmquery_plugins_usage_callback(api, endpoint):
 def _edsm_callback_received(_event=None):
     """Proxy callbacks to plugins that support them.
 
+    Done callbacks of request futures run first, followed by subscriptions made
+    with `EDSM_QUERIES.subscribe()`. The functions below are kept for plugins
+    that do not subscribe explicitly.
+
     You should filter the responses you need out yourself.
     You can pre-filter specific api's and endpoints by implementing
     specific callbacks for each:
@@ -368,35 +659,27 @@ def _edsm_callback_received(_event=None):
     If any of these returns `True`, the remaining more generic methods will be skipped for your plugin.
     """
 
-    log(LOG_DEBUG, 'edsm callback received')
-    while True:
-        response = this.edsmQueries.get_response()
-        if response is None:
-            break
-
-        # LOGGER.debug(this, 'response: {resp}'.format(resp=pformat(response)))
+    logger.debug('edsm callback received')
+    this.edsmQueries.run_callbacks()
+    table = _edsmquery_dispatch_table()
+    for response in this.edsmQueries.get_responses():
         (request, reply) = response
         (api, endpoint, _method, _request_params) = request
 
-        api_callbacks = _edsmquery_callbacks(api, endpoint)
-
-        for plugin in plug.PLUGINS:
+        this.edsmQueries.dispatch(request, reply)
+        for (plugin, callbacks) in _edsmquery_handlers(api, endpoint, table):
             # We loop over the plugins first so that each plugin can interrupt further callbacks
             # from being called only to itself.
-            for api_callback in api_callbacks:
-                log(LOG_DEBUG, "checking for function: '{func}' on {plugin}".format(
-                    func=api_callback,
-                    plugin=plugin.name,
-                ))
-                if hasattr(plugin.module, api_callback):
-                    response = plug.invoke(plugin.name, None, api_callback, request, reply)
-                    log(LOG_DEBUG, 'calling {func} on {plugin}: {response}'.format(
-                        func=api_callback,
-                        plugin=plugin,
-                        response=str(response),
-                    ))
-                    if response is True:
-                        break
+            for (api_callback, function) in callbacks:
+                # One failing plugin must not keep the replies from the others: they have left the channel already.
+                try:
+                    response = function(request, reply)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Failed calling %s on %s", api_callback, plugin.name)
+                    continue
+                logger.debug('called %s on %s: %s', api_callback, plugin.name, response)
+                if response is True:
+                    break
 
 
 # This only gets us events from the edsm plugin
@@ -407,7 +690,7 @@ def edsm_notify_system(reply):
     When an existing system is encountered, trigger an update from EDSM.
     :param reply:
     """
-    log(LOG_DEBUG, "Processing edsm notify event: {event}".format(event=pformat(reply)))
+    logger.debug("Processing edsm notify event: %s", Lazy(pformat, reply))
     if not reply:
         return
     elif reply['msgnum'] // 100 not in (1, 4):
@@ -415,13 +698,15 @@ def edsm_notify_system(reply):
     elif reply.get('systemCreated'):
         return
     # do not spam edsm if we have already sent out a request for the system we are in.
+    # Coalescing only covers a request still in flight, a later one would broadcast the reply again.
     elif this.lastEDSMRequest and this.lastEDSMRequest == monitor.system:
         return
     else:
         this.lastEDSMRequest = monitor.system
-        if not config_bool(CONFIG_KEY_DISABLE_AUTO_SYSTEM_BODIES):
+        if not this.settings.disableAutoSystemBodies:
             EDSM_QUERIES.request_get(
                 EDSM_QUERIES.API_SYSTEM_V1,
                 EDSM_QUERIES.API_SYSTEM_V1__BODIES,
+                supersede=SUPERSEDE_CURRENT_SYSTEM_BODIES,
                 systemName=this.lastEDSMRequest,
             )
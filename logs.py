@@ -0,0 +1,82 @@
+"""
+Logging helpers.
+
+All edsmquery modules log through children of one stdlib logger. Inside
+EDMarketConnector that logger is `<appname>.edsmquery`, so messages end up in
+EDMC's own log handlers. Levels can be set per module, i.e. to only debug the
+workers: `get_logger('queries').setLevel(logging.DEBUG)`.
+
+Expensive message arguments should be wrapped in `Lazy` so they are only
+rendered when the message is actually emitted.
+"""
+import logging
+
+from fields import LOG_CRIT, LOG_ERROR, LOG_WARN, LOG_INFO, LOG_DEBUG
+
+PLUGIN_NAME = 'edsmquery'
+
+# Our historical log levels mapped to stdlib levels.
+LOG_LEVELS = {
+    LOG_CRIT: logging.CRITICAL,
+    LOG_ERROR: logging.ERROR,
+    LOG_WARN: logging.WARNING,
+    LOG_INFO: logging.INFO,
+    LOG_DEBUG: logging.DEBUG,
+}
+
+try:
+    from config import appname
+    LOGGER_NAME = '{appname}.{plugin}'.format(appname=appname, plugin=PLUGIN_NAME)
+except ImportError:
+    # Running outside of EDMarketConnector (i.e. test_edsmquery_ui.py): log to stderr ourselves.
+    LOGGER_NAME = PLUGIN_NAME
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(name)s > %(levelname)s: %(message)s'))
+    logging.getLogger(LOGGER_NAME).addHandler(_handler)
+
+logging.getLogger(LOGGER_NAME).setLevel(logging.INFO)
+
+
+def get_logger(name=None):
+    """Return the plugin logger, or one of its children.
+
+    :param name: the child logger name, i.e. 'queries'. None returns the plugin logger itself.
+    """
+
+    if name is None:
+        return logging.getLogger(LOGGER_NAME)
+    return logging.getLogger('{base}.{name}'.format(base=LOGGER_NAME, name=name))
+
+
+def to_logging_level(level):
+    """Translate one of the `LOG_*` levels from `fields` to a stdlib logging level."""
+
+    return LOG_LEVELS.get(level, level)
+
+
+def from_logging_level(level):
+    """Translate a stdlib logging level back to the closest `LOG_*` level."""
+
+    for log_level, logging_level in sorted(LOG_LEVELS.items()):
+        if level >= logging_level:
+            return log_level
+    return LOG_DEBUG
+
+
+class Lazy(object):
+    """Defer rendering a log argument until the message is emitted.
+
+    `logger.debug("event: %s", Lazy(pformat, entry))` only pretty prints when DEBUG is enabled.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        """Initialize the wrapper with the function rendering the argument and its arguments."""
+
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        """Render the argument."""
+
+        return str(self.function(*self.args, **self.kwargs))
@@ -0,0 +1,235 @@
+"""
+Compact models of EDSM replies.
+
+Replies are nested dicts straight from the JSON parser. The models below keep
+the same data in `__slots__` instances: no per instance dict, repeated strings
+(names, types, material names) are interned, and nested parts such as the
+bodies of a system or the rings and materials of a body are only decoded when
+they are first accessed.
+
+Attributes are named after the EDSM fields, i.e. `body.distanceToArrival`.
+Fields a model does not know about are dropped; `to_dict()` turns a model back
+into the EDSM shape.
+"""
+import sys
+from array import array
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Lazy(object):
+    """Attribute holding the raw JSON value in `slot` until it is first read, then the decoded value."""
+
+    def __init__(self, slot, decoder):
+        self.slot = slot
+        self.decoder = decoder
+
+    def __get__(self, model, owner=None):
+        if model is None:
+            return self
+
+        value = getattr(model, self.slot)
+        if isinstance(value, (list, dict)):
+            value = self.decoder(value)
+            setattr(model, self.slot, value)
+        return value
+
+
+class Model(object):
+    """Base class of the models: `FIELDS` are copied (and interned), `LAZY` fields are decoded on access."""
+
+    __slots__ = ()
+    FIELDS = ()
+    LAZY = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a model from (part of) an EDSM reply."""
+
+        model = cls.__new__(cls)
+        for field in cls.FIELDS:
+            setattr(model, field, _intern(data.get(field)))
+        for field in cls.LAZY:
+            setattr(model, '_' + field, data.get(field))
+        return model
+
+    def to_dict(self):
+        """Return the model in the shape of an EDSM reply, leaving out empty fields."""
+
+        data = dict()
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        for field in self.LAZY:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = _to_json(value)
+        return data
+
+    def __repr__(self):
+        """Return a short description of the model."""
+
+        return "{model}({name!r})".format(model=type(self).__name__, name=getattr(self, 'name', None))
+
+
+def _to_json(value):
+    if isinstance(value, (Model, Materials)):
+        return value.to_dict()
+    if isinstance(value, tuple):
+        return [_to_json(item) for item in value]
+    return value
+
+
+class Materials(object):
+    """Percentages by name, i.e. the `materials` of a body. Names are interned, percentages kept in an array."""
+
+    __slots__ = ('names', 'percents')
+
+    def __init__(self, percents):
+        """Initialize from a dict mapping names to percentages."""
+
+        self.names = tuple(sys.intern(name) for name in percents)
+        self.percents = array('d', (float(percents[name]) for name in percents))
+
+    def __len__(self):
+        """Return the number of materials."""
+
+        return len(self.names)
+
+    def __iter__(self):
+        """Iterate over the material names."""
+
+        return iter(self.names)
+
+    def __contains__(self, name):
+        """Return whether a material is present."""
+
+        return name in self.names
+
+    def __getitem__(self, name):
+        """Return the percentage of a material, raising KeyError if it is not present."""
+
+        try:
+            return self.percents[self.names.index(name)]
+        except ValueError:
+            raise KeyError(name)
+
+    def get(self, name, default=None):
+        """Return the percentage of a material, or `default`."""
+
+        return self[name] if name in self.names else default
+
+    def items(self):
+        """Return `(name, percentage)` pairs."""
+
+        return list(zip(self.names, self.percents))
+
+    def to_dict(self):
+        """Return the materials as a dict."""
+
+        return dict(self.items())
+
+
+def _models(model):
+    def decode(values):
+        return tuple(model.from_dict(value) for value in values)
+    return decode
+
+
+class Ring(Model):
+    """A ring or belt of a body."""
+
+    FIELDS = ('name', 'type', 'mass', 'innerRadius', 'outerRadius')
+    __slots__ = FIELDS
+
+
+class Body(Model):
+    """A star or planet, as found in the `bodies` of `api-system-v1/bodies`."""
+
+    FIELDS = (
+        'id', 'id64', 'bodyId', 'name', 'type', 'subType', 'distanceToArrival',
+        'isMainStar', 'isScoopable', 'spectralClass', 'luminosity', 'solarMasses', 'solarRadius',
+        'isLandable', 'gravity', 'earthMasses', 'radius', 'surfaceTemperature', 'surfacePressure',
+        'volcanismType', 'atmosphereType', 'terraformingState', 'reserveLevel',
+        'orbitalPeriod', 'semiMajorAxis', 'orbitalEccentricity', 'orbitalInclination', 'argOfPeriapsis',
+        'rotationalPeriod', 'rotationalPeriodTidallyLocked', 'axialTilt', 'updateTime',
+    )
+    LAZY = ('rings', 'belts', 'materials', 'atmosphereComposition', 'solidComposition')
+    __slots__ = FIELDS + tuple('_' + field for field in LAZY)
+
+    rings = _Lazy('_rings', _models(Ring))
+    belts = _Lazy('_belts', _models(Ring))
+    materials = _Lazy('_materials', Materials)
+    atmosphereComposition = _Lazy('_atmosphereComposition', Materials)
+    solidComposition = _Lazy('_solidComposition', Materials)
+
+
+class System(Model):
+    """A star system, as returned by `api-v1/system(s)` and `api-system-v1/bodies`."""
+
+    FIELDS = ('id', 'id64', 'name', 'url', 'bodyCount', 'requirePermit', 'permitName', 'distance')
+    LAZY = ('coords', 'bodies')
+    __slots__ = FIELDS + tuple('_' + field for field in LAZY)
+
+    coords = _Lazy('_coords', lambda coords: (coords.get('x'), coords.get('y'), coords.get('z')))
+    bodies = _Lazy('_bodies', _models(Body))
+
+    def to_dict(self):
+        """Return the system in the shape of an EDSM reply."""
+
+        data = Model.to_dict(self)
+        if 'coords' in data:
+            (x, y, z) = data['coords']
+            data['coords'] = {'x': x, 'y': y, 'z': z}
+        return data
+
+
+# Model for the replies of each api/endpoint that has one.
+REPLY_MODELS = {
+    ('api-system-v1', 'bodies'): System,
+    ('api-v1', 'system'): System,
+    ('api-v1', 'systems'): System,
+    ('api-v1', 'sphere-systems'): System,
+    ('api-v1', 'cube-systems'): System,
+}
+
+
+# Model for the records of streamed replies, see `EDSMQueries.request_stream()`.
+RECORD_MODELS = {
+    ('api-system-v1', 'bodies'): Body,
+    ('api-v1', 'sphere-systems'): System,
+    ('api-v1', 'cube-systems'): System,
+    ('api-v1', 'systems'): System,
+}
+
+
+def decode_records(request, records):
+    """Return the models for a list of streamed records, or the records themselves if there is no model for them."""
+
+    (api, endpoint, _method, _request_params) = request
+    model = RECORD_MODELS.get((api, endpoint))
+    if model is None:
+        return records
+    return [model.from_dict(record) if isinstance(record, dict) else record for record in records]
+
+
+def decode(request, reply):
+    """Return the models for an EDSM reply, or the reply itself if there is no model for it.
+
+    Array replies (i.e. `api-v1/systems`) become a tuple of models.
+    :param request: the request tuple `(api, endpoint, method, request_params)`.
+    :param reply: the parsed reply.
+    """
+
+    (api, endpoint, _method, _request_params) = request
+    model = REPLY_MODELS.get((api, endpoint))
+    if model is None or not reply:
+        return reply
+    if isinstance(reply, list):
+        return tuple(model.from_dict(item) for item in reply)
+    if isinstance(reply, dict):
+        return model.from_dict(reply)
+    return reply
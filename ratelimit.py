@@ -0,0 +1,104 @@
+"""
+Adaptive rate limiting for EDSM queries.
+
+EDSM reports the remaining request budget in the `X-Rate-Limit-*` headers of
+every reply. The token bucket below spends that budget as requests come in and
+only makes workers wait when it is actually used up.
+"""
+import time
+from threading import Lock
+
+
+class TokenBucket(object):
+    """Token bucket shared by all workers, tuned by EDSM's rate limit headers."""
+
+    HEADER_LIMIT = 'X-Rate-Limit-Limit'
+    HEADER_REMAINING = 'X-Rate-Limit-Remaining'
+    HEADER_RESET = 'X-Rate-Limit-Reset'
+
+    MAX_BURST = 10
+    MAX_RATE = 1.0
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        """Initialize the bucket.
+
+        :param rate: tokens added per second until EDSM tells us otherwise.
+        :param capacity: maximum number of tokens that can be spent in a burst.
+        :param clock: monotonic clock, replaceable for testing.
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.limit = None
+        self.remaining = None
+        self.resetAt = None
+        self._clock = clock
+        self._updated = clock()
+        self._blockedUntil = 0
+        self._lock = Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """Take a token and return the number of seconds to wait before using it.
+
+        Tokens may be borrowed from the future; concurrent callers then get
+        increasing delays in the order they asked.
+        """
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.tokens -= 1
+            delay = 0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(delay, self._blockedUntil - now)
+
+    def wait(self, interrupt_event):
+        """Take a token, sleeping only if the budget is used up.
+
+        :param interrupt_event: Event that aborts the wait when set.
+        :return: False if the wait got interrupted.
+        """
+
+        delay = self.reserve()
+        if delay > 0:
+            return not interrupt_event.wait(delay)
+        return not interrupt_event.is_set()
+
+    def update(self, headers):
+        """Adjust the bucket to the rate limit headers of an EDSM reply.
+
+        The remaining budget is spread out evenly until the limit resets.
+        :param headers: the (case insensitive) reply headers.
+        :return: False if the reply did not carry rate limit headers.
+        """
+
+        try:
+            limit = int(headers[self.HEADER_LIMIT])
+            remaining = int(headers[self.HEADER_REMAINING])
+            reset = int(headers[self.HEADER_RESET])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.limit = limit
+            self.remaining = remaining
+            self.resetAt = now + reset
+            if remaining <= 0:
+                self.tokens = min(self.tokens, 0)
+                self._blockedUntil = now + reset
+                return True
+
+            self._blockedUntil = 0
+            if reset > 0:
+                self.rate = min(float(remaining) / reset, self.MAX_RATE)
+            self.capacity = max(1, min(remaining, self.MAX_BURST))
+            self.tokens = min(self.tokens, self.capacity)
+        return True
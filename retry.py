@@ -0,0 +1,112 @@
+"""
+Retry policy for failed EDSM requests.
+
+Errors are classified first: connection problems, timeouts, 429 and 5xx
+replies are worth another try, other 4xx replies and unparsable bodies are
+not. Retries are spread out with exponential backoff and full jitter, unless
+EDSM tells us when to come back with a `Retry-After` header.
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from requests import ConnectionError, Timeout
+from requests.exceptions import ChunkedEncodingError
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class RetryPolicy(object):
+    """Decide whether and when a failed request is tried again.
+
+    Any object with a `next_delay(attempt, error)` method can be used as a policy
+    by `EDSMQueries.retryPolicy`.
+    """
+
+    MAX_ATTEMPTS = 4
+    BASE_DELAY = 2
+    MAX_DELAY = 120
+    RETRYABLE_STATUS = frozenset((408, 425, 429, 500, 502, 503, 504))
+    # Errors without a reply worth another try. Other request errors (i.e. TooManyRedirects) are not.
+    RETRYABLE_ERRORS = (ConnectionError, Timeout, ChunkedEncodingError, asyncio.TimeoutError)
+    if aiohttp is not None:
+        RETRYABLE_ERRORS += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, rand=random.random):
+        """Initialize the policy.
+
+        :param max_attempts: number of times a request is performed before giving up, including the first.
+        :param base_delay: seconds to wait (at most) before the first retry. Doubles with every retry.
+        :param max_delay: upper bound of the backoff, in seconds.
+        :param rand: function returning a float in [0, 1), replaceable for testing.
+        """
+
+        self.maxAttempts = max_attempts
+        self.baseDelay = base_delay
+        self.maxDelay = max_delay
+        self._rand = rand
+
+    @staticmethod
+    def status(error):
+        """Return the HTTP status of an error, or None if it did not come with a reply."""
+
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None) is not None:
+            return response.status_code
+        # aiohttp.ClientResponseError
+        return getattr(error, 'status', None)
+
+    def is_retryable(self, error):
+        """Return whether a request failing with `error` may succeed when tried again."""
+
+        status = self.status(error)
+        if status is not None:
+            return status in self.RETRYABLE_STATUS or status >= 500
+        if isinstance(error, ValueError):
+            # The reply could not be parsed, sending the same request again will not change that.
+            return False
+        return isinstance(error, self.RETRYABLE_ERRORS)
+
+    @staticmethod
+    def retry_after(error):
+        """Return the seconds to wait according to a `Retry-After` header, or None."""
+
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None) or getattr(error, 'headers', None)
+        value = headers.get('Retry-After') if headers else None
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt):
+        """Return a random delay for retry number `attempt`, between 0 and the exponential backoff."""
+
+        return self._rand() * min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1))
+
+    def next_delay(self, attempt, error):
+        """Return the seconds to wait before trying again, or None to give up.
+
+        A `Retry-After` is followed up to `maxDelay`; a request is not parked for longer than that.
+        :param attempt: the number of times the request has been performed.
+        :param error: the exception the last attempt failed with.
+        """
+
+        if attempt >= self.maxAttempts or not self.is_retryable(error):
+            return None
+
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.maxDelay)
+        return self.backoff(attempt)
@@ -0,0 +1,51 @@
+"""
+In-memory snapshot of the plugin preferences.
+
+Reading EDMC's config is a registry (Windows) or config file read, so the
+preferences are read once at startup and again when they are changed in the
+settings dialog. Everything else reads the snapshot without any I/O.
+"""
+
+
+class Settings(object):
+    """Plugin preferences, read from EDMC's config and exposed as attributes."""
+
+    def __init__(self, options, defaults):
+        """Initialize the snapshot with the default values.
+
+        :param options: dict mapping attribute names to config keys.
+        :param defaults: dict mapping config keys to their default value. The type of
+            the default decides how a stored value is read (bool, int or str).
+        """
+
+        self._options = dict(options)
+        self._defaults = dict(defaults)
+        for (name, key) in self._options.items():
+            setattr(self, name, self._defaults[key])
+
+    def key(self, name):
+        """Return the config key of a setting."""
+
+        return self._options[name]
+
+    def load(self, config):
+        """(Re)read all settings from the config.
+
+        :param config: EDMC's `config.config`.
+        :return: the set of attribute names whose value changed.
+        """
+
+        changed = set()
+        for (name, key) in self._options.items():
+            default = self._defaults[key]
+            if isinstance(default, bool):
+                value = config.get_bool(key, default=default)
+            elif isinstance(default, int):
+                value = config.get_int(key, default=default)
+            else:
+                value = config.get_str(key, default=default)
+
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed.add(name)
+        return changed
@@ -0,0 +1,257 @@
+"""
+Size bounded SQLite store, shared by the caches that survive a restart.
+
+`LRUStore` keeps JSON values in one table of a SQLite database and drops the
+least recently used rows beyond a maximum. Reads are done on the calling
+thread and never write. Writes (stored values, deletions and the access times
+of reads) are queued and done in batches by a writer thread, with a
+connection of its own, so callers on the Tk main loop never wait for a commit.
+"""
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+
+from logs import get_logger
+
+_MISSING = object()
+
+
+class LRUStore(object):
+    """Table of JSON values keyed by address or string, bounded to the most recently used rows."""
+
+    # Seconds queued writes are held back, so they go to disk in one transaction.
+    WRITE_DELAY = 1.0
+
+    def __init__(self, table, max_rows, columns=()):
+        """Initialize a closed store, see open().
+
+        :param table: name of the table.
+        :param max_rows: number of rows kept, the least recently used ones are dropped first.
+        :param columns: names of extra indexed columns rows can be found by, see find().
+        """
+
+        self.table = table
+        self.maxRows = max_rows
+        self.columns = tuple(columns)
+        self._reader = None
+        self._readLock = Lock()
+        self._writer = None
+        self._writeLock = Lock()
+        self._writerThread = None
+        self._wake = Event()
+        self._stop = Event()
+        self._lock = Lock()
+        # Queued writes by key: `(value, expires, columns)` rows, or None for a deletion.
+        self._pending = OrderedDict()
+        self._writing = dict()
+        # Access times of reads not written yet, by key.
+        self._touched = dict()
+        self.logger = get_logger('store')
+
+    @property
+    def is_open(self):
+        """Return whether the store has been opened."""
+
+        return self._reader is not None
+
+    def open(self, path):
+        """Open (or create) the store in the SQLite database at `path`.
+
+        A table of an earlier layout is dropped: the store only holds what can be fetched again.
+        """
+
+        self.close()
+        layout = ['key', 'value', 'expires', 'accessed'] + list(self.columns)
+        writer = sqlite3.connect(path, check_same_thread=False)
+        writer.execute("PRAGMA journal_mode=WAL")
+        found = [row[1] for row in writer.execute("PRAGMA table_info({table})".format(table=self.table))]
+        if found and found != layout:
+            writer.execute("DROP TABLE {table}".format(table=self.table))
+        writer.execute("CREATE TABLE IF NOT EXISTS {table} (key PRIMARY KEY, value TEXT NOT NULL, expires REAL,"
+                       " accessed REAL NOT NULL{columns})".format(
+                           table=self.table,
+                           columns=''.join(', {column}'.format(column=column) for column in self.columns),
+                       ))
+        for column in ['accessed'] + list(self.columns):
+            writer.execute("CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})".format(
+                table=self.table,
+                column=column,
+            ))
+        writer.commit()
+
+        self._writer = writer
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._stop.clear()
+        self._writerThread = Thread(target=self._run, name='EDSM-store-{table}'.format(table=self.table),
+                                    daemon=True)
+        self._writerThread.start()
+
+    def close(self):
+        """Write the queued writes and close the store, if open."""
+
+        if self._writerThread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._writerThread.join()
+            self._writerThread = None
+        self.flush()
+        with self._readLock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        with self._writeLock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def get(self, key):
+        """Return `(value, expires)` of a row, or None. The access time is written later."""
+
+        with self._lock:
+            row = self._queued(key)
+        if row is _MISSING:
+            with self._readLock:
+                if self._reader is None:
+                    return None
+                row = self._reader.execute(
+                    "SELECT value, expires FROM {table} WHERE key = ?".format(table=self.table), (key,),
+                ).fetchone()
+        if row is None:
+            return None
+
+        with self._lock:
+            self._touched[key] = time.time()
+        self._wake.set()
+        (value, expires) = row[:2]
+        return json.loads(value), expires
+
+    def find(self, column, value):
+        """Return the key of a row with `value` in one of the extra columns, or None."""
+
+        index = self.columns.index(column)
+        with self._lock:
+            for rows in (self._pending, self._writing):
+                for (key, row) in rows.items():
+                    if row is not None and row[2][index] == value:
+                        return key
+        with self._readLock:
+            if self._reader is None:
+                return None
+            row = self._reader.execute(
+                "SELECT key FROM {table} WHERE {column} = ? LIMIT 1".format(table=self.table, column=column),
+                (value,),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, key, value, expires=None, **columns):
+        """Queue storing a value, with the values of the extra columns as keyword arguments."""
+
+        if self._reader is None:
+            return
+        row = (json.dumps(value, separators=(',', ':')), expires,
+               tuple(columns.get(column) for column in self.columns))
+        with self._lock:
+            self._pending[key] = row
+            self._pending.move_to_end(key)
+        self._wake.set()
+
+    def delete(self, key):
+        """Queue dropping a row."""
+
+        if self._reader is None:
+            return
+        with self._lock:
+            self._pending[key] = None
+        self._wake.set()
+
+    def clear(self):
+        """Drop all rows, now."""
+
+        with self._writeLock:
+            with self._lock:
+                self._pending.clear()
+                self._touched.clear()
+            if self._writer is not None:
+                self._writer.execute("DELETE FROM {table}".format(table=self.table))
+                self._writer.commit()
+
+    def purge(self, expired_before):
+        """Drop the rows that expired before a time, now."""
+
+        self.flush()
+        with self._writeLock:
+            if self._writer is not None:
+                self._writer.execute("DELETE FROM {table} WHERE expires < ?".format(table=self.table),
+                                     (expired_before,))
+                self._writer.commit()
+
+    def flush(self):
+        """Do the queued writes in one transaction and drop the least recently used rows beyond the maximum."""
+
+        with self._writeLock:
+            with self._lock:
+                (self._writing, self._pending) = (self._pending, OrderedDict())
+                (touched, self._touched) = (self._touched, dict())
+            try:
+                if self._writer is None or not (self._writing or touched):
+                    return
+                self._write(self._writing, touched)
+            finally:
+                with self._lock:
+                    self._writing = dict()
+
+    def _queued(self, key):
+        """Return the queued row of a key, None if its deletion is queued or _MISSING. Hold self._lock."""
+
+        row = self._pending.get(key, _MISSING)
+        if row is _MISSING:
+            row = self._writing.get(key, _MISSING)
+        return row
+
+    def _write(self, rows, touched):
+        """Write rows and access times, in the writer connection. Hold self._writeLock."""
+
+        now = time.time()
+        columns = ''.join(', {column}'.format(column=column) for column in self.columns)
+        stored = []
+        for (key, row) in rows.items():
+            if row is not None:
+                (value, expires, values) = row
+                stored.append((key, value, expires, now) + values)
+        self._writer.executemany(
+            "UPDATE {table} SET accessed = ? WHERE key = ?".format(table=self.table),
+            [(accessed, key) for (key, accessed) in touched.items() if key not in rows],
+        )
+        self._writer.executemany(
+            "DELETE FROM {table} WHERE key = ?".format(table=self.table),
+            [(key,) for (key, row) in rows.items() if row is None],
+        )
+        self._writer.executemany(
+            "INSERT OR REPLACE INTO {table} (key, value, expires, accessed{columns}) VALUES (?, ?, ?, ?{marks})".format(
+                table=self.table,
+                columns=columns,
+                marks=', ?' * len(self.columns),
+            ),
+            stored,
+        )
+        self._writer.execute(
+            "DELETE FROM {table} WHERE key IN ("
+            " SELECT key FROM {table} ORDER BY accessed DESC LIMIT -1 OFFSET ?"
+            ")".format(table=self.table),
+            (self.maxRows,),
+        )
+        self._writer.commit()
+
+    def _run(self):
+        """Writer thread: do the queued writes a little after they have been queued."""
+
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._stop.wait(self.WRITE_DELAY)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as err:
+                self.logger.error("Unable to write to the %s store: %s", self.table, err)
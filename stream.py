@@ -0,0 +1,214 @@
+"""
+Incremental JSON parsing of large EDSM replies.
+
+Replies such as the bodies of a big system or a sphere search can be
+megabytes. Instead of parsing the whole body at once, the records of one array
+in the reply (i.e. `bodies`, or the reply itself when it is an array) are
+parsed and yielded one by one while the reply is being downloaded. Only the
+requested fields of each record are kept.
+
+ijson is used when it is installed. Without it, records are decoded with
+`json.JSONDecoder.raw_decode` from a rolling text buffer.
+"""
+import codecs
+import json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CHUNK_SIZE = 16 * 1024
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# Characters that may continue a number, i.e. '0' of '0.5' or '1' of '1e-3'.
+_NUMBER_TAIL = frozenset('0123456789.eE+-')
+
+
+def project(record, fields):
+    """Return a record with only `fields`, or the record itself when `fields` is None."""
+
+    if fields is None or not isinstance(record, dict):
+        return record
+    return dict((field, record[field]) for field in fields if field in record)
+
+
+def iter_records(chunks, path=None, fields=None, header=None):
+    """Yield the records of an array in a JSON document, parsing it as the chunks come in.
+
+    :param chunks: iterable of bytes, i.e. `response.iter_content(CHUNK_SIZE)`.
+    :param path: name of the top level member holding the array, i.e. 'bodies'. None if the document is the array.
+    :param fields: names of the record fields to keep, None keeps everything.
+    :param header: optional dict receiving the other top level members with a scalar value (i.e. `name` or
+        `bodyCount`), filled in while parsing.
+    """
+
+    if ijson is not None:
+        return _iter_ijson(chunks, path, fields, header)
+    return _iter_raw(chunks, path, fields, header)
+
+
+def _iter_raw(chunks, path, fields, header):
+    buffer = _TextBuffer(chunks)
+    first = buffer.peek()
+    if path is None or first == '[':
+        if path is not None:
+            # No object around the records, i.e. EDSM's `[]` for an unknown system.
+            buffer.value()
+            return
+        for record in buffer.array():
+            yield project(record, fields)
+        return
+
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        key = buffer.value()
+        buffer.expect(':')
+        if key == path and buffer.peek() == '[':
+            for record in buffer.array():
+                yield project(record, fields)
+        else:
+            value = buffer.value()
+            if header is not None and not isinstance(value, (dict, list)):
+                header[key] = value
+        if buffer.next() == '}':
+            return
+
+
+class _TextBuffer(object):
+    """Decoded text of a chunked byte stream, read from left to right."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next chunk, dropping what has been read already. Return False at the end of the stream."""
+
+        if self._eof:
+            return False
+
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._decoder.decode(b'', True)
+        else:
+            text = self._decoder.decode(chunk)
+        self._text = self._text[self._pos:] + text
+        self._pos = 0
+        return chunk is not None
+
+    def peek(self):
+        """Return the next non whitespace character without consuming it, '' at the end of the stream."""
+
+        while True:
+            while self._pos < len(self._text) and self._text[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._fill():
+                return ''
+
+    def next(self):
+        """Consume and return the next non whitespace character."""
+
+        character = self.peek()
+        if not character:
+            raise ValueError("Unexpected end of JSON document")
+        self._pos += 1
+        return character
+
+    def expect(self, character):
+        found = self.next()
+        if found != character:
+            raise ValueError("Expected {expected!r} in JSON document, found {found!r}".format(
+                expected=character,
+                found=found,
+            ))
+
+    def value(self):
+        """Decode and consume the next JSON value."""
+
+        self.peek()
+        while True:
+            try:
+                (value, end) = _DECODER.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if self._incomplete_number(value, end) and self._fill():
+                # The number could continue in the next chunk.
+                continue
+            self._pos = end
+            return value
+
+    def _incomplete_number(self, value, end):
+        """Return whether a decoded number may be cut short by the end of the buffer."""
+
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return all(character in _NUMBER_TAIL for character in self._text[end:])
+
+    def array(self):
+        """Yield the values of the array that starts at the current position."""
+
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.next()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError("Expected ',' or ']' in JSON array, found {found!r}".format(found=separator))
+
+
+class _ChunkReader(object):
+    """File-like `read()` over an iterable of bytes, for ijson."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def read(self, size=-1):
+        if size == 0:
+            # ijson probes the type of the stream with read(0).
+            return b''
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b''
+
+
+def _iter_ijson(chunks, path, fields, header):
+    prefix = 'item' if path is None else path + '.item'
+    builder = None
+    depth = 0
+    for (event_prefix, event, value) in ijson.parse(_ChunkReader(chunks), use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                yield project(builder.value, fields)
+                builder = None
+        elif event_prefix == prefix:
+            if event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                depth = 1
+            elif event not in ('end_map', 'end_array'):
+                yield value
+        elif header is not None and path is not None and event_prefix and '.' not in event_prefix \
+                and event in ('null', 'boolean', 'integer', 'double', 'number', 'string'):
+            header[event_prefix] = value
@@ -0,0 +1,90 @@
+"""
+Explicit subscriptions to EDSM replies.
+
+Instead of defining `edsm_querier_response_*` functions and filtering every
+reply themselves, consumers can subscribe a callback to an api/endpoint and
+narrow it down further with a filter on the request parameters.
+"""
+from threading import Lock
+
+
+class Subscription(object):
+    """A callback registered for replies of an api/endpoint."""
+
+    def __init__(self, api, endpoint, callback, request_filter=None, models=False):
+        """Initialize the subscription.
+
+        :param api: api to subscribe to, None for all apis.
+        :param endpoint: endpoint to subscribe to, None for all endpoints of the api.
+        :param callback: called with `(request, reply)`.
+        :param request_filter: None, a dict of request parameters that must match,
+            or a callable receiving the request parameters and returning a bool.
+        :param models: pass replies decoded into `models` instead of raw dicts.
+        """
+
+        self.api = api
+        self.endpoint = endpoint
+        self.callback = callback
+        self.filter = request_filter
+        self.models = models
+
+    def matches(self, request_params):
+        """Return whether the request parameters pass this subscription's filter."""
+
+        if self.filter is None:
+            return True
+        if callable(self.filter):
+            return bool(self.filter(request_params))
+
+        for name, value in self.filter.items():
+            if name not in request_params or str(request_params[name]) != str(value):
+                return False
+        return True
+
+
+class SubscriptionRegistry(object):
+    """Keeps subscriptions indexed by (api, endpoint)."""
+
+    def __init__(self):
+        """Initialize the registry."""
+
+        self._subscriptions = dict()
+        self._lock = Lock()
+
+    def add(self, subscription):
+        """Register a subscription."""
+
+        key = (subscription.api, subscription.endpoint)
+        with self._lock:
+            # Copy on write so dispatching never needs the lock.
+            self._subscriptions[key] = self._subscriptions.get(key, ()) + (subscription,)
+        return subscription
+
+    def remove(self, subscription):
+        """Unregister a subscription.
+
+        :return: False if the subscription was not registered.
+        """
+
+        key = (subscription.api, subscription.endpoint)
+        with self._lock:
+            subscriptions = self._subscriptions.get(key, ())
+            if subscription not in subscriptions:
+                return False
+            remaining = tuple(registered for registered in subscriptions if registered is not subscription)
+            if remaining:
+                self._subscriptions[key] = remaining
+            else:
+                del self._subscriptions[key]
+        return True
+
+    def matching(self, request):
+        """Return the subscriptions that want the reply to `request`, more specific first."""
+
+        (api, endpoint, _method, request_params) = request
+        matching = []
+        for key in ((api, endpoint), (api, None), (None, None)):
+            for subscription in self._subscriptions.get(key, ()):
+                if subscription.matches(request_params):
+                    matching.append(subscription)
+        return matching
@@ -0,0 +1,99 @@
+"""Test the body bookkeeping of star systems."""
+
+import os
+import tempfile
+import unittest
+
+from bodies import SystemBodies, SystemBodiesCache
+
+
+class SystemBodiesTest(unittest.TestCase):
+    """Test merging the bodies of the journal and EDSM."""
+
+    def test_merge(self):
+        """Bodies known from both sources are counted once, in the order they became known."""
+
+        system = SystemBodies('Sol', 10477373803)
+        self.assertTrue(system.add_journal_body('Earth'))
+        self.assertTrue(system.add_edsm_body('Mars'))
+        self.assertFalse(system.add_edsm_body('Earth'))
+        self.assertEqual(system.bodies, ['Earth', 'Mars'])
+        self.assertEqual(len(system), 2)
+        self.assertIn('Mars', system)
+        self.assertTrue(system.dirty)
+
+    def test_belt_clusters(self):
+        """Belt clusters are not bodies."""
+
+        system = SystemBodies('Sol')
+        self.assertFalse(system.add_journal_body('Sol A Belt Cluster 1'))
+        self.assertEqual(len(system), 0)
+
+    def test_progress(self):
+        """Progress is unknown until the body count is, and follows new bodies."""
+
+        system = SystemBodies('Sol')
+        system.add_journal_body('Earth')
+        self.assertIsNone(system.progress)
+        self.assertTrue(system.set_body_count(4))
+        self.assertFalse(system.set_body_count(4))
+        self.assertEqual(system.progress, 25)
+        system.add_edsm_body('Mars')
+        self.assertEqual(system.progress, 50)
+
+
+class SystemBodiesCacheTest(unittest.TestCase):
+    """Test keeping the state of visited systems in memory and on disk."""
+
+    def setUp(self):
+        """Create a cache of two systems on a temporary store."""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'bodies.sqlite')
+        self.cache = self.open()
+
+    def open(self):
+        """Return a newly opened cache on the test store."""
+
+        cache = SystemBodiesCache(max_systems=2)
+        cache.open(self.path)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get(self):
+        """Systems are remembered by address and by name."""
+
+        sol = self.cache.get(10477373803, 'Sol')
+        sol.add_journal_body('Earth')
+        self.assertIs(self.cache.get(10477373803), sol)
+        self.assertIs(self.cache.get(None, 'Sol'), sol)
+        self.assertEqual(self.cache.get(None, 'Unknown').address, None)
+
+    def test_evicted_to_disk(self):
+        """Changed systems evicted from memory are read back from the store."""
+
+        sol = self.cache.get(1, 'Sol')
+        sol.set_body_count(40)
+        sol.add_journal_body('Earth')
+        sol.add_edsm_body('Mars')
+        self.cache.get(2, 'Alpha Centauri')
+        self.cache.get(3, 'Barnard\'s Star')
+        self.assertEqual(len(self.cache), 2)
+
+        restored = self.cache.get(None, 'Sol')
+        self.assertIsNot(restored, sol)
+        self.assertEqual((restored.address, restored.bodyCount, restored.bodies), (1, 40, ['Earth', 'Mars']))
+        self.assertEqual(list(restored.edsmBodies), ['Mars'])
+        self.assertFalse(restored.dirty)
+
+    def test_close_saves(self):
+        """Closing the cache saves the systems still in memory."""
+
+        self.cache.get(1, 'Sol').add_journal_body('Earth')
+        self.cache.close()
+        self.assertEqual(self.open().get(1).bodies, ['Earth'])
+
+
+if __name__ == '__main__':
+    unittest.main()
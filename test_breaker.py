@@ -0,0 +1,103 @@
+"""Test CircuitBreaker."""
+
+import unittest
+from unittest import mock
+
+from requests import ConnectionError, HTTPError, TooManyRedirects
+
+from breaker import CircuitBreaker
+
+
+class FakeClock(object):
+    """Monotonic clock that only moves when told to."""
+
+    def __init__(self, now=1000.0):
+        """Initialize the clock."""
+
+        self.now = now
+
+    def __call__(self):
+        """Return the current time."""
+
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """Test the closed, open and half-open states."""
+
+    def setUp(self):
+        """Create a breaker opening after 3 failures, for 30 seconds."""
+
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('https://edsm.test', failure_threshold=3, reset_timeout=30, clock=self.clock)
+        self.changes = []
+        self.breaker.listeners.append(lambda breaker, previous, state: self.changes.append((previous, state)))
+
+    def fail(self, times):
+        """Report a number of failures."""
+
+        for _ in range(times):
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold(self):
+        """Consecutive failures open the breaker, which then refuses requests."""
+
+        self.fail(2)
+        self.assertTrue(self.breaker.allow())
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.changes, [(CircuitBreaker.CLOSED, CircuitBreaker.OPEN)])
+
+    def test_success_resets_failures(self):
+        """A success in between starts counting again."""
+
+        self.fail(2)
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_single_probe(self):
+        """After the reset timeout one probe is let through; a success closes the breaker."""
+
+        self.fail(3)
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        """A failing probe opens the breaker for another reset timeout."""
+
+        self.fail(3)
+        self.clock.now += 30
+        self.breaker.allow()
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow())
+
+    def test_lost_probe(self):
+        """A probe that never reports back is replaced after the reset timeout."""
+
+        self.fail(3)
+        self.clock.now += 30
+        self.breaker.allow()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+
+    def test_is_outage(self):
+        """Only server errors and connection problems count as an outage."""
+
+        self.assertTrue(CircuitBreaker.is_outage(ConnectionError()))
+        self.assertTrue(CircuitBreaker.is_outage(HTTPError(response=mock.Mock(status_code=502))))
+        self.assertFalse(CircuitBreaker.is_outage(HTTPError(response=mock.Mock(status_code=404))))
+        self.assertFalse(CircuitBreaker.is_outage(TooManyRedirects()))
+        self.assertFalse(CircuitBreaker.is_outage(ValueError()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Test the response cache."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cache import ResponseCache
+
+
+def key(name, **params):
+    """Return the cache key of an `api-v1/system` lookup."""
+
+    params['systemName'] = name
+    return ResponseCache.key('api-v1', 'system', 'GET', params)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Test expiry, eviction, the on-disk store and the counters."""
+
+    def setUp(self):
+        """Create a small cache with a fake clock."""
+
+        self.now = 1000.0
+        patcher = mock.patch('cache.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ResponseCache(max_entries=2, default_ttl=60, ttls={('api-v1', 'systems'): 0})
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cache.sqlite')
+
+    def test_key(self):
+        """Parameter order and value types do not matter."""
+
+        self.assertEqual(ResponseCache.key('api-v1', 'system', 'get', {'showId': 1, 'systemName': 'Sol'}),
+                         ResponseCache.key('api-v1', 'system', 'GET', {'systemName': 'Sol', 'showId': '1'}))
+
+    def test_ttl(self):
+        """Replies expire after their ttl, but are kept for stale lookups."""
+
+        self.cache.put(key('Sol'), {'name': 'Sol'})
+        self.now += 59
+        self.assertEqual(self.cache.get(key('Sol')), {'name': 'Sol'})
+        self.now += 2
+        self.assertIsNone(self.cache.get(key('Sol')))
+        self.assertEqual(self.cache.get(key('Sol'), stale=True), {'name': 'Sol'})
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+
+    def test_not_cacheable(self):
+        """A ttl of 0 and other methods than GET disable caching."""
+
+        systems = ResponseCache.key('api-v1', 'systems', 'GET', {'systemName': 'Sol'})
+        post = ResponseCache.key('api-v1', 'system', 'POST', {'systemName': 'Sol'})
+        self.cache.put(systems, [])
+        self.cache.put(post, {})
+        self.assertIsNone(self.cache.get(systems))
+        self.assertIsNone(self.cache.get(post))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_lru(self):
+        """The least recently used reply is evicted first."""
+
+        self.cache.put(key('A'), 'a')
+        self.cache.put(key('B'), 'b')
+        self.cache.get(key('A'))
+        self.cache.put(key('C'), 'c')
+        self.assertIsNone(self.cache.get(key('B')))
+        self.assertEqual(self.cache.get(key('A')), 'a')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_disk_store(self):
+        """Replies survive a restart in the on-disk store."""
+
+        self.cache.open(self.path)
+        self.cache.put(key('Sol'), {'name': 'Sol'})
+        self.cache.close()
+
+        cache = ResponseCache(default_ttl=60)
+        cache.open(self.path)
+        self.addCleanup(cache.close)
+        self.assertIsNone(cache.get(key('Sol'), disk=False))
+        self.assertEqual(cache.get(key('Sol')), {'name': 'Sol'})
+        self.assertEqual(cache.get(key('Sol'), disk=False), {'name': 'Sol'})
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_api_key_not_on_disk(self):
+        """Requests carrying an api key are only cached in memory."""
+
+        self.cache.open(self.path)
+        self.addCleanup(self.cache.close)
+        private = key('Sol', apiKey='secret')
+        self.assertFalse(self.cache.persistable(private))
+        self.cache.put(private, {'name': 'Sol'})
+        self.assertEqual(self.cache.get(private), {'name': 'Sol'})
+        self.cache.close()
+        with open(self.path, 'rb') as store:
+            self.assertNotIn(b'secret', store.read())
+
+    def test_hits_are_copies(self):
+        """Changing a returned reply does not change the cache."""
+
+        self.cache.put(key('Sol'), {'name': 'Sol', 'bodies': []})
+        self.cache.get(key('Sol'))['bodies'].append('Earth')
+        self.assertEqual(self.cache.get(key('Sol')), {'name': 'Sol', 'bodies': []})
+
+    def test_counters(self):
+        """Memory only misses and lookups with count=False are not counted."""
+
+        self.assertIsNone(self.cache.get(key('Sol'), disk=False))
+        self.assertIsNone(self.cache.get(key('Sol')))
+        self.assertIsNone(self.cache.get(key('Sol'), stale=True, count=False))
+        self.cache.put(key('Sol'), 'sol')
+        self.assertEqual(self.cache.get(key('Sol'), disk=False), 'sol')
+        self.assertEqual(self.cache.get(key('Sol'), count=False), 'sol')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Test ResultChannel."""
+
+import threading
+import unittest
+
+from channel import ResultChannel
+
+
+class ResultChannelTest(unittest.TestCase):
+    """Test the backpressure policies and signalling."""
+
+    def test_signal_once_until_drained(self):
+        """Only the first put asks for a signal, until the consumer takes something."""
+
+        channel = ResultChannel(4)
+        self.assertTrue(channel.put(1))
+        self.assertFalse(channel.put(2))
+        self.assertEqual(channel.drain(), [1, 2])
+        self.assertTrue(channel.put(3))
+
+    def test_drop_oldest(self):
+        """A full channel drops its oldest result."""
+
+        channel = ResultChannel(2, ResultChannel.POLICY_DROP_OLDEST)
+        for item in range(4):
+            channel.put(item)
+        self.assertEqual(channel.drain(), [2, 3])
+        self.assertEqual(channel.dropped, 2)
+
+    def test_spill_keeps_order(self):
+        """Spilled results are read back in order."""
+
+        channel = ResultChannel(2, ResultChannel.POLICY_SPILL)
+        for item in range(5):
+            channel.put(('request', item))
+        self.assertEqual(len(channel), 5)
+        self.assertEqual(channel.spilled, 3)
+        self.assertEqual(channel.get(), ('request', 0))
+        self.assertEqual(channel.drain(), [('request', item) for item in range(1, 5)])
+        channel.clear()
+
+    def test_block_waits_for_consumer(self):
+        """A blocking put waits until the consumer makes room."""
+
+        channel = ResultChannel(1, ResultChannel.POLICY_BLOCK)
+        channel.put(1)
+        producer = threading.Thread(target=channel.put, args=(2,))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual(channel.get(), 1)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(channel.drain(), [2])
+
+    def test_block_non_blocking_put(self):
+        """A put that may not block drops the oldest result instead."""
+
+        channel = ResultChannel(1, ResultChannel.POLICY_BLOCK)
+        channel.put(1)
+        channel.put(2, block=False)
+        self.assertEqual(channel.drain(), [2])
+        self.assertEqual(channel.dropped, 1)
+
+    def test_block_interrupted(self):
+        """An interrupt releases a blocked producer without queueing its result."""
+
+        interrupt = threading.Event()
+        interrupt.set()
+        channel = ResultChannel(1, ResultChannel.POLICY_BLOCK, interrupt)
+        channel.put(1)
+        self.assertFalse(channel.put(2))
+        self.assertEqual(channel.drain(), [1])
+
+    def test_unknown_policy(self):
+        """Unknown policies are refused."""
+
+        with self.assertRaises(ValueError):
+            ResultChannel(1, 'discard')
+
+
+if __name__ == '__main__':
+    unittest.main()
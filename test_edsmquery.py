@@ -0,0 +1,174 @@
+"""Test the queueing of EDSMQueries."""
+
+import unittest
+from unittest import mock
+
+from edsmquery import EDSMQueries, LaneQueue
+from futures import RequestError
+
+
+class LaneQueueTest(unittest.TestCase):
+    """Test the weighted round robin over the priority lanes."""
+
+    def setUp(self):
+        """Create a queue with three lanes."""
+
+        self.queue = LaneQueue((('interactive', 4), ('background', 2), ('bulk', 1)))
+
+    def fill(self, lane, count):
+        """Queue `count` items named after their lane."""
+
+        for index in range(count):
+            self.queue.put((lane, '{lane}{index}'.format(lane=lane, index=index)))
+
+    def test_weighted_round_robin(self):
+        """Busy urgent lanes do not starve the others."""
+
+        self.fill('interactive', 6)
+        self.fill('background', 3)
+        self.fill('bulk', 2)
+        served = [self.queue.get() for _ in range(7)]
+        self.assertEqual(served, ['interactive0', 'background0', 'bulk0', 'interactive1', 'background1',
+                                  'interactive2', 'interactive3'])
+        self.assertEqual(self.queue.depths(), {'interactive': 2, 'background': 1, 'bulk': 1})
+
+    def test_stop_marker_first(self):
+        """The worker stop marker skips the lanes."""
+
+        self.fill('bulk', 1)
+        self.queue.put(None)
+        self.assertIsNone(self.queue.get())
+        self.assertEqual(self.queue.get(), 'bulk0')
+
+    def test_take(self):
+        """take() removes matching items from any lane."""
+
+        self.fill('interactive', 2)
+        self.fill('bulk', 2)
+        self.assertEqual(self.queue.take(lambda item: item.endswith('1'), 5), ['interactive1', 'bulk1'])
+        self.assertEqual(self.queue.qsize(), 2)
+
+
+class SupersedeTest(unittest.TestCase):
+    """Test cancelling queued requests by supersession key."""
+
+    def setUp(self):
+        """Create queries without starting the workers."""
+
+        self.queries = EDSMQueries()
+        self.addCleanup(self.queries.transport.close)
+
+    def test_newer_request_cancels_older(self):
+        """A newer request with the same key cancels the queued one."""
+
+        older = self.queries.request_get('api-v1', 'system', supersede='k', systemName='A')
+        newer = self.queries.request_get('api-v1', 'system', supersede='k', systemName='B')
+        self.assertTrue(older.cancelled())
+        self.assertFalse(newer.cancelled())
+        self.assertEqual(self.queries.queue.qsize(), 1)
+
+    def test_coalesced_requesters_survive(self):
+        """Only the superseded requester is cancelled, not others sharing its request."""
+
+        keyed = self.queries.request_get('api-v1', 'system', supersede='k', systemName='A')
+        other = self.queries.request_get('api-v1', 'system', systemName='A')
+        newer = self.queries.request_get('api-v1', 'system', supersede='k', systemName='B')
+        self.assertTrue(keyed.cancelled())
+        self.assertFalse(other.cancelled())
+        self.assertFalse(newer.cancelled())
+        self.assertEqual(self.queries.queue.qsize(), 2)
+
+
+class CoalesceTest(unittest.TestCase):
+    """Test sharing one request between identical GET requests."""
+
+    def setUp(self):
+        """Create queries without starting the workers."""
+
+        self.queries = EDSMQueries()
+        self.addCleanup(self.queries.transport.close)
+
+    def test_identical_requests_share_a_reply(self):
+        """Identical requests are queued and performed once, then answered from the cache."""
+
+        first = self.queries.request_get('api-system-v1', 'bodies', systemName='Sol')
+        second = self.queries.request_get('api-system-v1', 'bodies', systemName='Sol')
+        other = self.queries.request_get('api-system-v1', 'bodies', systemName='Achenar')
+        self.assertEqual((self.queries.queue.qsize(), self.queries.coalesced), (2, 1))
+
+        reply = {'name': 'Sol', 'bodies': []}
+        with mock.patch.object(self.queries, '_perform', return_value=reply) as perform:
+            self.queries._process(self.queries.queue.get())
+        perform.assert_called_once_with('api-system-v1', 'bodies', 'GET', {'systemName': 'Sol'})
+        self.assertEqual(first.result(0), reply)
+        self.assertEqual(second.result(0), reply)
+        self.assertFalse(other.done())
+
+        third = self.queries.request_get('api-system-v1', 'bodies', systemName='Sol')
+        self.assertEqual(third.result(0), reply)
+        self.assertEqual(self.queries.queue.qsize(), 1)
+
+    def test_posts_not_coalesced(self):
+        """Requests other than GET are always sent."""
+
+        self.queries.request_post('api-journal-v1', 'discard')
+        self.queries.request_post('api-journal-v1', 'discard')
+        self.assertEqual((self.queries.queue.qsize(), self.queries.coalesced), (2, 0))
+
+
+class BatchTest(unittest.TestCase):
+    """Test merging system lookups into one `api-v1/systems` request."""
+
+    def setUp(self):
+        """Create queries without starting the workers."""
+
+        self.queries = EDSMQueries()
+        self.addCleanup(self.queries.transport.close)
+
+    def lookup(self, name, **flags):
+        """Queue a system lookup and return its future and job."""
+
+        future = self.queries.request_get('api-v1', 'system', systemName=name, **flags)
+        return future, future._job
+
+    def test_batch_group(self):
+        """Lookups with the same supported flags share a group."""
+
+        group = self.queries._batch_group
+        self.assertEqual(group(self.lookup('Sol', showId=1)[1]), group(self.lookup('Achenar', showId='1')[1]))
+        self.assertNotEqual(group(self.lookup('Sol')[1]), group(self.lookup('Sol', showId=1)[1]))
+        self.assertIsNone(group(self.lookup('Sol', radius=5)[1]))
+        self.assertIsNone(group(self.queries.request_get('api-v1', 'sphere-systems', systemName='Sol')._job))
+
+    def test_reply_split(self):
+        """One bulk request is sent and its reply is split per lookup, by case insensitive name."""
+
+        (sol, sol_job) = self.lookup('Sol', showId=1)
+        (achenar, achenar_job) = self.lookup('achenar', showId=1)
+        (unknown, unknown_job) = self.lookup('Unknown', showId=1)
+        reply = [{'name': 'Achenar', 'id': 2}, {'name': 'Sol', 'id': 1}]
+        with mock.patch.object(self.queries, '_perform', return_value=reply) as perform:
+            self.queries._process_batch([sol_job, achenar_job, unknown_job])
+
+        perform.assert_called_once_with('api-v1', 'systems', 'GET',
+                                        {'showId': 1, 'systemName[]': ['Sol', 'achenar', 'Unknown']})
+        self.assertEqual(sol.result(0), {'name': 'Sol', 'id': 1})
+        self.assertEqual(achenar.result(0), {'name': 'Achenar', 'id': 2})
+        self.assertIsInstance(unknown.exception(0), RequestError)
+
+    def test_cached_lookups_left_out(self):
+        """Lookups answered from the cache are not part of the bulk request."""
+
+        (sol, sol_job) = self.lookup('Sol')
+        (achenar, achenar_job) = self.lookup('Achenar')
+        self.queries.cache.put(sol_job.key, {'name': 'Sol'})
+        with mock.patch.object(self.queries, '_perform', return_value={'name': 'Achenar'}) as perform:
+            self.queries._process_batch([sol_job, achenar_job])
+
+        perform.assert_called_once_with('api-v1', 'system', 'GET', {'systemName': 'Achenar'})
+        self.assertEqual(sol.result(0), {'name': 'Sol'})
+        self.assertEqual(achenar.result(0), {'name': 'Achenar'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,8 @@ import json
 import Tkinter as tk
 import tkFont
 
-from edsmquery import EDSM_QUERIES, LOG_DEBUG
+from edsmquery import EDSM_QUERIES
+from fields import LOG_DEBUG
 
 this = sys.modules[__name__]  # For holding module globals
 
@@ -84,8 +85,8 @@ def callback(request, response):
 def eventfull_callback(_event=None):
     """Catch EDSMCallback callback."""
 
-    (request, reply) = APP.queries.get_response()
-    callback(request, reply)
+    for (request, reply) in APP.queries.get_responses():
+        callback(request, reply)
 
 
 def make_requests():
@@ -0,0 +1,96 @@
+"""Test the futures of queued EDSM requests."""
+
+import concurrent.futures
+import unittest
+
+from futures import EDSMFuture, RequestError
+
+REQUEST = ('api-v1', 'system', 'GET', {'systemName': 'Sol'})
+
+
+class EDSMFutureTest(unittest.TestCase):
+    """Test resolving, cancelling and chaining futures (without an owner, callbacks run right away)."""
+
+    def test_result(self):
+        """result() waits for the reply and raises the error of a failed request."""
+
+        future = EDSMFuture(REQUEST)
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            future.result(0)
+        future.set_result({'name': 'Sol'})
+        future.set_exception(RequestError())
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(0), {'name': 'Sol'})
+        self.assertIsNone(future.exception(0))
+
+        failed = EDSMFuture(REQUEST)
+        failed.set_exception(RequestError("failed"))
+        with self.assertRaises(RequestError):
+            failed.result(0)
+
+    def test_cancel(self):
+        """Cancelled futures raise CancelledError and ignore their reply."""
+
+        future = EDSMFuture(REQUEST)
+        called = []
+        future.add_done_callback(called.append)
+        self.assertTrue(future.cancel())
+        self.assertFalse(future.cancel())
+        future.set_result({'name': 'Sol'})
+        self.assertTrue(future.cancelled())
+        self.assertEqual(called, [future])
+        with self.assertRaises(concurrent.futures.CancelledError):
+            future.result(0)
+
+        done = EDSMFuture(REQUEST)
+        done.set_result({})
+        self.assertFalse(done.cancel())
+
+    def test_callback_after_done(self):
+        """Callbacks added to a done future are called too."""
+
+        future = EDSMFuture(REQUEST)
+        future.set_result({})
+        called = []
+        future.add_done_callback(called.append)
+        self.assertEqual(called, [future])
+
+    def test_then(self):
+        """then() chains on the value returned by the callback."""
+
+        future = EDSMFuture(REQUEST)
+        chained = future.then(lambda reply: reply['name'])
+        self.assertFalse(chained.done())
+        future.set_result({'name': 'Sol'})
+        self.assertEqual(chained.result(0), 'Sol')
+
+    def test_then_future(self):
+        """A future returned by the callback is waited for."""
+
+        future = EDSMFuture(REQUEST)
+        inner = EDSMFuture(REQUEST)
+        chained = future.then(lambda reply: inner)
+        future.set_result({})
+        self.assertFalse(chained.done())
+        inner.set_result({'bodies': []})
+        self.assertEqual(chained.result(0), {'bodies': []})
+
+    def test_then_errors(self):
+        """Errors of the callback, and cancellation, are passed down the chain."""
+
+        def fail(reply):
+            raise ValueError(reply)
+
+        future = EDSMFuture(REQUEST)
+        chained = future.then(fail)
+        future.set_result({})
+        self.assertIsInstance(chained.exception(0), ValueError)
+
+        cancelled = EDSMFuture(REQUEST)
+        chained = cancelled.then(print)
+        cancelled.cancel()
+        self.assertTrue(chained.cancelled())
+
+
+if __name__ == '__main__':
+    unittest.main()
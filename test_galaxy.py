@@ -0,0 +1,145 @@
+"""Test the local galaxy index."""
+
+import gzip
+import json
+import threading
+import time
+import unittest
+
+from galaxy import GalaxyIndex
+
+DAY = 24 * 3600
+SYSTEMS = [
+    {'id': 1, 'id64': 101, 'name': 'Sol', 'coords': {'x': 0, 'y': 0, 'z': 0}},
+    {'id': 2, 'id64': 102, 'name': 'Alpha Centauri', 'coords': {'x': 3.03, 'y': -0.09, 'z': 3.16}},
+    {'id': 3, 'id64': 103, 'name': 'Colonia', 'coords': {'x': -9530.5, 'y': -910.28, 'z': 19808.13}},
+    {'id': 4, 'name': 'No id64', 'coords': {'x': 1, 'y': 1, 'z': 1}},
+]
+BODIES = [
+    {'id': 11, 'bodyId': 1, 'name': 'Earth', 'systemId64': 101, 'systemName': 'Sol',
+     'updateTime': '2024-01-02 00:00:00'},
+    {'id': 10, 'bodyId': 0, 'name': 'Sol', 'systemId64': 101, 'systemName': 'Sol',
+     'updateTime': '2024-01-02 00:00:00'},
+]
+
+
+def dump(records):
+    """Return the chunks of a gzipped dump, in EDSM's one record per line layout."""
+
+    lines = ',\n'.join(json.dumps(record) for record in records)
+    data = gzip.compress('[\n{lines}\n]'.format(lines=lines).encode('utf-8'))
+    return [data[i:i + 100] for i in range(0, len(data), 100)]
+
+
+class GalaxyIndexTest(unittest.TestCase):
+    """Test importing dumps and answering requests from them."""
+
+    def setUp(self):
+        """Open an empty index in memory."""
+
+        self.index = GalaxyIndex()
+        self.index.open(':memory:')
+        self.addCleanup(self.index.close)
+
+    def import_systems(self, now=None):
+        """Import the systems as a full dump requested at `now`, by default just now."""
+
+        self.assertEqual(self.index.import_dump(GalaxyIndex.SYSTEMS, dump(SYSTEMS)), 4)
+        self.index._imported(GalaxyIndex.SYSTEMS, True, time.time() if now is None else now)
+
+    def test_import_dump(self):
+        """Records are imported in batches; records without an id64 or coordinates are skipped."""
+
+        self.index.BATCH_SIZE = 2
+        self.import_systems(now=0)
+        self.assertEqual(self.index.imported, 4)
+        self.assertEqual(self.index._db.execute("SELECT COUNT(*) FROM systems").fetchone()[0], 3)
+        self.assertEqual(self.index._db.execute("SELECT COUNT(*) FROM systems_coords").fetchone()[0], 3)
+
+    def test_import_interrupted(self):
+        """A set interrupt event stops the import."""
+
+        interrupt = threading.Event()
+        interrupt.set()
+        self.assertIsNone(self.index.import_dump(GalaxyIndex.SYSTEMS, dump(SYSTEMS), interrupt))
+
+    def test_is_current(self):
+        """Records are current after a full import, until the deltas fall DELTA_DAYS behind."""
+
+        self.assertFalse(self.index.is_current(GalaxyIndex.SYSTEMS, 0))
+        self.import_systems(now=1000)
+        self.assertTrue(self.index.is_current(GalaxyIndex.SYSTEMS, 1000 + DAY))
+        self.assertFalse(self.index.is_current(GalaxyIndex.SYSTEMS, 1000 + 8 * DAY))
+        self.index._imported(GalaxyIndex.SYSTEMS, False, 1000 + 6 * DAY)
+        self.assertTrue(self.index.is_current(GalaxyIndex.SYSTEMS, 1000 + 8 * DAY))
+        self.assertFalse(self.index.is_current(GalaxyIndex.BODIES, 1000))
+
+    def test_delta_without_full_dump(self):
+        """Deltas alone never make records current."""
+
+        self.index._imported(GalaxyIndex.SYSTEMS, False, 1000)
+        self.assertFalse(self.index.is_current(GalaxyIndex.SYSTEMS, 1000))
+
+    def test_needs_update(self):
+        """Dumps are due when never imported, then once every UPDATE_INTERVAL."""
+
+        self.assertTrue(self.index.needs_update(GalaxyIndex.SYSTEMS, 0))
+        self.import_systems(now=1000)
+        self.assertFalse(self.index.needs_update(GalaxyIndex.SYSTEMS, 1000 + DAY - 1))
+        self.assertTrue(self.index.needs_update(GalaxyIndex.SYSTEMS, 1000 + DAY))
+
+    def test_answer_system(self):
+        """System lookups by name or id64, with the supported flags."""
+
+        self.import_systems()
+        self.assertEqual(self.index.answer('api-v1', 'system', {'systemName': 'sol', 'showId': 1}),
+                         {'name': 'Sol', 'id': 1, 'id64': 101})
+        self.assertEqual(self.index.answer('api-v1', 'system', {'systemId64': '102', 'showCoordinates': 1}),
+                         {'name': 'Alpha Centauri', 'coords': {'x': 3.03, 'y': -0.09, 'z': 3.16}})
+        self.assertIsNone(self.index.answer('api-v1', 'system', {'systemName': 'Unknown'}))
+        self.assertIsNone(self.index.answer('api-v1', 'system', {'systemName': 'Sol', 'showInformation': 1}))
+        self.assertEqual((self.index.hits, self.index.misses), (2, 1))
+
+    def test_answer_sphere_systems(self):
+        """Sphere searches are sorted by distance and need a current index."""
+
+        self.assertIsNone(self.index.answer('api-v1', 'sphere-systems', {'systemName': 'Sol'}))
+        self.import_systems()
+        reply = self.index.answer('api-v1', 'sphere-systems', {'systemName': 'Alpha Centauri', 'radius': 10})
+        self.assertEqual([(system['name'], system['distance']) for system in reply],
+                         [('Alpha Centauri', 0), ('Sol', 4.38)])
+        reply = self.index.answer('api-v1', 'sphere-systems', {'x': 0, 'y': 0, 'z': 0, 'minRadius': 1})
+        self.assertEqual([system['name'] for system in reply], ['Alpha Centauri'])
+
+    def test_answer_bodies(self):
+        """Bodies are answered once the bodies dump is current and the bodyCount was learned."""
+
+        self.import_systems()
+        request = ('api-system-v1', 'bodies', 'GET', {'systemName': 'Sol'})
+        self.index.learn(request, {'id64': 101, 'name': 'Sol', 'bodyCount': 2, 'bodies': []})
+        self.assertIsNone(self.index.answer('api-system-v1', 'bodies', {'systemName': 'Sol'}))
+
+        self.assertEqual(self.index.import_dump(GalaxyIndex.BODIES, dump(BODIES)), 2)
+        self.index._imported(GalaxyIndex.BODIES, True, time.time())
+        self.assertIsNone(self.index.answer('api-system-v1', 'bodies', {'systemName': 'Sol'}))
+
+        self.index.learn(request, {'id64': 101, 'name': 'Sol', 'bodyCount': 2,
+                                   'bodies': [{'id': 11, 'bodyId': 1, 'name': 'Earth', 'updateTime': '2023-01-01'}]})
+        reply = self.index.answer('api-system-v1', 'bodies', {'systemName': 'Sol'})
+        self.assertEqual((reply['id64'], reply['bodyCount']), (101, 2))
+        self.assertEqual(reply['bodies'], [
+            {'id': 10, 'bodyId': 0, 'name': 'Sol', 'updateTime': '2024-01-02 00:00:00'},
+            {'id': 11, 'bodyId': 1, 'name': 'Earth', 'updateTime': '2024-01-02 00:00:00'},
+        ])
+
+    def test_closed(self):
+        """A closed index answers nothing and is never due."""
+
+        self.index.close()
+        self.assertIsNone(self.index.answer('api-v1', 'system', {'systemName': 'Sol'}))
+        self.assertFalse(self.index.needs_update(GalaxyIndex.SYSTEMS))
+        self.assertIsNone(self.index.import_dump(GalaxyIndex.SYSTEMS, dump(SYSTEMS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
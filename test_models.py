@@ -0,0 +1,83 @@
+"""Test the compact models of EDSM replies."""
+
+import unittest
+
+from models import Body, System, decode, decode_records
+
+BODIES_REPLY = {
+    'id': 27,
+    'id64': 10477373803,
+    'name': 'Sol',
+    'url': 'https://www.edsm.net/en/system/bodies/id/27/name/Sol',
+    'bodyCount': 40,
+    'coords': {'x': 0, 'y': 0, 'z': 0},
+    'bodies': [
+        {'id': 1, 'bodyId': 0, 'name': 'Sol', 'type': 'Star', 'distanceToArrival': 0, 'isMainStar': True},
+        {'id': 2, 'bodyId': 3, 'name': 'Earth', 'type': 'Planet', 'distanceToArrival': 499.0,
+         'materials': {'Iron': 18.5, 'Nickel': 14.0},
+         'rings': [{'name': 'Earth A Ring', 'type': 'Rocky', 'mass': 1}],
+         'unknownField': 'dropped'},
+    ],
+}
+
+
+def request(api, endpoint):
+    """Return a GET request tuple."""
+
+    return api, endpoint, 'GET', {}
+
+
+class ModelsTest(unittest.TestCase):
+    """Test decoding replies into models and back."""
+
+    def test_decode_system(self):
+        """Replies with a model are decoded, nested parts on first access."""
+
+        system = decode(request('api-system-v1', 'bodies'), BODIES_REPLY)
+        self.assertIsInstance(system, System)
+        self.assertEqual((system.name, system.bodyCount, system.coords), ('Sol', 40, (0, 0, 0)))
+        self.assertIsInstance(system._bodies, list)
+        earth = system.bodies[1]
+        self.assertIsInstance(system._bodies, tuple)
+        self.assertIsInstance(earth, Body)
+        self.assertEqual(earth.distanceToArrival, 499.0)
+        self.assertEqual(earth.materials['Iron'], 18.5)
+        self.assertIsNone(earth.materials.get('Gold'))
+        self.assertEqual(earth.rings[0].type, 'Rocky')
+        self.assertIsNone(earth.belts)
+        self.assertFalse(hasattr(earth, '__dict__'))
+
+    def test_to_dict(self):
+        """to_dict() returns the EDSM shape, without unknown and empty fields."""
+
+        system = decode(request('api-system-v1', 'bodies'), BODIES_REPLY)
+        data = system.to_dict()
+        self.assertEqual(data['coords'], {'x': 0, 'y': 0, 'z': 0})
+        expected = dict(BODIES_REPLY['bodies'][1])
+        del expected['unknownField']
+        self.assertEqual(data['bodies'][1], expected)
+
+    def test_decode_list(self):
+        """Array replies become a tuple of models."""
+
+        systems = decode(request('api-v1', 'systems'), [{'name': 'Sol'}, {'name': 'Achenar'}])
+        self.assertEqual([system.name for system in systems], ['Sol', 'Achenar'])
+
+    def test_no_model(self):
+        """Replies and records without a model are passed on unchanged."""
+
+        reply = {'lastUpdate': '2024-01-01', 'status': 2}
+        self.assertIs(decode(request('api-status-v1', 'elite-server'), reply), reply)
+        records = [{'name': 'A'}]
+        self.assertIs(decode_records(request('api-logs-v1', 'get-logs'), records), records)
+
+    def test_decode_records(self):
+        """Streamed records are decoded one by one."""
+
+        bodies = decode_records(request('api-system-v1', 'bodies'), BODIES_REPLY['bodies'])
+        self.assertEqual([body.name for body in bodies], ['Sol', 'Earth'])
+        self.assertTrue(bodies[0].isMainStar)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Test TokenBucket."""
+
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from ratelimit import TokenBucket
+
+
+class FakeClock(object):
+    """Monotonic clock that only moves when told to."""
+
+    def __init__(self, now=1000.0):
+        """Initialize the clock."""
+
+        self.now = now
+
+    def __call__(self):
+        """Return the current time."""
+
+        return self.now
+
+    def advance(self, seconds):
+        """Move the clock forward."""
+
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    """Test reserving tokens and adapting to the rate limit headers."""
+
+    def setUp(self):
+        """Create a bucket of 2 tokens refilling at one token per 5 seconds."""
+
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(0.2, 2, clock=self.clock)
+
+    def test_burst_then_wait(self):
+        """The capacity is spent without waiting, then callers wait in order."""
+
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.assertAlmostEqual(self.bucket.reserve(), 5)
+        self.assertAlmostEqual(self.bucket.reserve(), 10)
+
+    def test_refill(self):
+        """Tokens come back with time, up to the capacity."""
+
+        self.bucket.reserve()
+        self.bucket.reserve()
+        self.clock.advance(5)
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.clock.advance(3600)
+        self.bucket.reserve()
+        self.assertAlmostEqual(self.bucket.tokens, 1)
+
+    def test_update_spreads_remaining_budget(self):
+        """The remaining budget is spread evenly until the reset."""
+
+        headers = {'X-Rate-Limit-Limit': '360', 'X-Rate-Limit-Remaining': '100', 'X-Rate-Limit-Reset': '400'}
+        self.assertTrue(self.bucket.update(headers))
+        self.assertAlmostEqual(self.bucket.rate, 0.25)
+        self.assertEqual(self.bucket.capacity, TokenBucket.MAX_BURST)
+        self.assertEqual(self.bucket.limit, 360)
+        self.assertEqual(self.bucket.resetAt, self.clock.now + 400)
+
+    def test_update_caps_rate(self):
+        """A large budget does not exceed MAX_RATE."""
+
+        self.bucket.update({'X-Rate-Limit-Limit': '720', 'X-Rate-Limit-Remaining': '720', 'X-Rate-Limit-Reset': '1'})
+        self.assertEqual(self.bucket.rate, TokenBucket.MAX_RATE)
+
+    def test_update_exhausted_blocks_until_reset(self):
+        """No budget left blocks every reservation until the reset."""
+
+        self.bucket.update({'X-Rate-Limit-Limit': '360', 'X-Rate-Limit-Remaining': '0', 'X-Rate-Limit-Reset': '30'})
+        self.assertAlmostEqual(self.bucket.reserve(), 30)
+        self.clock.advance(20)
+        self.assertGreaterEqual(self.bucket.reserve(), 10)
+
+    def test_update_without_headers(self):
+        """Replies without (valid) rate limit headers leave the bucket alone."""
+
+        self.assertFalse(self.bucket.update({}))
+        self.assertFalse(self.bucket.update({'X-Rate-Limit-Limit': 'x', 'X-Rate-Limit-Remaining': '1',
+                                             'X-Rate-Limit-Reset': '1'}))
+        self.assertEqual(self.bucket.rate, 0.2)
+
+    def test_wait_interrupted(self):
+        """An interrupted wait returns False."""
+
+        interrupt = threading.Event()
+        interrupt.set()
+        self.assertFalse(self.bucket.wait(interrupt))
+
+
+class RateLimitHandler(BaseHTTPRequestHandler):
+    """Reply like EDSM, with rate limit headers."""
+
+    def do_GET(self):  # noqa: N802 pylint: disable=invalid-name
+        """Reply with an empty JSON object."""
+
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Rate-Limit-Limit', '360')
+        self.send_header('X-Rate-Limit-Remaining', '50')
+        self.send_header('X-Rate-Limit-Reset', '100')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Keep the test output clean."""
+
+
+class StubServerTest(unittest.TestCase):
+    """Test that replies of a (stub) EDSM server tune the bucket of EDSMQueries."""
+
+    def setUp(self):
+        """Start the stub server."""
+
+        self.server = HTTPServer(('127.0.0.1', 0), RateLimitHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the stub server."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_headers_adjust_rate(self):
+        """The X-Rate-Limit-* headers of a reply set the rate and burst."""
+
+        from edsmquery import EDSMQueries
+
+        class StubQueries(EDSMQueries):
+            API_BASE_URL = 'http://127.0.0.1:{port}'.format(port=self.server.server_port)
+
+        queries = StubQueries()
+        try:
+            reply = queries._http_request('api-status-v1', 'elite-server', 'GET', {})
+        finally:
+            queries.transport.close()
+
+        self.assertEqual(reply, {})
+        self.assertAlmostEqual(queries.rateLimiter.rate, 0.5)
+        self.assertEqual(queries.rateLimiter.capacity, TokenBucket.MAX_BURST)
+        self.assertEqual(queries.rateLimiter.remaining, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Test RetryPolicy."""
+
+import unittest
+from unittest import mock
+
+from requests import ConnectionError, HTTPError, Timeout, TooManyRedirects
+
+from retry import RetryPolicy
+
+
+def http_error(status, headers=None):
+    """Return a requests HTTPError for a reply with `status`."""
+
+    return HTTPError(response=mock.Mock(status_code=status, headers=headers or {}))
+
+
+class RetryPolicyTest(unittest.TestCase):
+    """Test classifying errors and spreading retries."""
+
+    def setUp(self):
+        """Create a policy whose jitter always picks the full backoff."""
+
+        self.policy = RetryPolicy(max_attempts=4, base_delay=2, max_delay=10, rand=lambda: 1.0)
+
+    def test_retryable(self):
+        """Connection problems, timeouts, 429 and 5xx replies are retried."""
+
+        for error in (ConnectionError(), Timeout(), http_error(429), http_error(503), http_error(599)):
+            self.assertTrue(self.policy.is_retryable(error), error)
+
+    def test_not_retryable(self):
+        """Client errors, unparsable replies and other request errors are not."""
+
+        for error in (http_error(400), http_error(404), ValueError(), TooManyRedirects(), KeyError()):
+            self.assertFalse(self.policy.is_retryable(error), error)
+
+    def test_backoff(self):
+        """The backoff doubles with every attempt, up to max_delay."""
+
+        self.assertEqual([self.policy.backoff(attempt) for attempt in range(1, 6)], [2, 4, 8, 10, 10])
+
+    def test_jitter(self):
+        """The delay is picked at random below the backoff."""
+
+        policy = RetryPolicy(base_delay=2, rand=lambda: 0.25)
+        self.assertEqual(policy.backoff(3), 2)
+
+    def test_gives_up(self):
+        """No delay after max_attempts, or for errors that are not retryable."""
+
+        self.assertIsNone(self.policy.next_delay(4, ConnectionError()))
+        self.assertIsNone(self.policy.next_delay(1, http_error(404)))
+
+    def test_retry_after(self):
+        """A Retry-After header is followed, up to max_delay."""
+
+        self.assertEqual(self.policy.next_delay(1, http_error(429, {'Retry-After': '7'})), 7)
+        self.assertEqual(self.policy.next_delay(1, http_error(429, {'Retry-After': '3600'})), 10)
+        self.assertIsNone(RetryPolicy.retry_after(http_error(429, {'Retry-After': 'soon'})))
+        self.assertEqual(RetryPolicy.retry_after(http_error(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Test the snapshot of the plugin preferences."""
+
+import unittest
+
+from settings import Settings
+
+OPTIONS = {
+    'disabled': 'edsmquery.disabled',
+    'workers': 'edsmquery.workers',
+    'name': 'edsmquery.name',
+}
+DEFAULTS = {
+    'edsmquery.disabled': False,
+    'edsmquery.workers': 2,
+    'edsmquery.name': 'default',
+}
+
+
+class FakeConfig(object):
+    """The typed getters of EDMC's config, over a dict, counting the reads."""
+
+    def __init__(self, values=None):
+        """Initialize with the stored values."""
+
+        self.values = dict(values or {})
+        self.reads = []
+
+    def _get(self, kind, key, default):
+        self.reads.append((kind, key))
+        return self.values.get(key, default)
+
+    def get_bool(self, key, default=None):
+        """Return a stored bool."""
+
+        return self._get(bool, key, default)
+
+    def get_int(self, key, default=0):
+        """Return a stored int."""
+
+        return self._get(int, key, default)
+
+    def get_str(self, key, default=None):
+        """Return a stored str."""
+
+        return self._get(str, key, default)
+
+
+class SettingsTest(unittest.TestCase):
+    """Test reading and refreshing the preferences."""
+
+    def test_defaults(self):
+        """Settings start with their defaults, without reading the config."""
+
+        settings = Settings(OPTIONS, DEFAULTS)
+        self.assertEqual((settings.disabled, settings.workers, settings.name), (False, 2, 'default'))
+        self.assertEqual(settings.key('workers'), 'edsmquery.workers')
+
+    def test_load(self):
+        """Values are read with the getter matching the type of their default."""
+
+        config = FakeConfig({'edsmquery.disabled': True, 'edsmquery.workers': 4})
+        settings = Settings(OPTIONS, DEFAULTS)
+        self.assertEqual(settings.load(config), {'disabled', 'workers'})
+        self.assertEqual((settings.disabled, settings.workers, settings.name), (True, 4, 'default'))
+        self.assertEqual(sorted(config.reads, key=lambda read: read[1]), [
+            (bool, 'edsmquery.disabled'),
+            (str, 'edsmquery.name'),
+            (int, 'edsmquery.workers'),
+        ])
+
+    def test_reload_reports_changes(self):
+        """load() returns only the settings that changed since the last load."""
+
+        config = FakeConfig()
+        settings = Settings(OPTIONS, DEFAULTS)
+        self.assertEqual(settings.load(config), set())
+        config.values['edsmquery.name'] = 'other'
+        self.assertEqual(settings.load(config), {'name'})
+        self.assertEqual(settings.load(config), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
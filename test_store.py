@@ -0,0 +1,98 @@
+"""Test the size bounded SQLite store."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from store import LRUStore
+
+
+class LRUStoreTest(unittest.TestCase):
+    """Test the queued writes and the eviction of the least recently used rows."""
+
+    def setUp(self):
+        """Open a store of three rows in a temporary directory."""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'store.sqlite')
+        self.store = self.open()
+
+    def open(self):
+        """Return a newly opened store on the test database, written only by flush()."""
+
+        store = LRUStore('things', 3, ('name',))
+        store.WRITE_DELAY = 3600
+        store.open(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def rows(self):
+        """Return the keys in the database."""
+
+        with sqlite3.connect(self.path) as db:
+            return sorted(key for (key,) in db.execute("SELECT key FROM things"))
+
+    def test_queued_writes(self):
+        """Queued values are read back before they are written."""
+
+        self.store.put(1, {'a': 1}, 10.0, name='One')
+        self.assertEqual(self.store.get(1), ({'a': 1}, 10.0))
+        self.assertEqual(self.store.find('name', 'One'), 1)
+        self.assertEqual(self.rows(), [])
+        self.store.flush()
+        self.assertEqual(self.rows(), [1])
+        self.assertEqual(self.store.get(1), ({'a': 1}, 10.0))
+        self.assertEqual(self.store.find('name', 'One'), 1)
+
+        self.store.delete(1)
+        self.assertIsNone(self.store.get(1))
+        self.store.flush()
+        self.assertEqual(self.rows(), [])
+
+    def test_least_recently_used_evicted(self):
+        """Rows beyond the maximum are dropped, the least recently read first."""
+
+        for key in range(3):
+            self.store.put(key, key)
+            self.store.flush()
+        self.store.get(0)
+        self.store.put(3, 3)
+        self.store.flush()
+        self.assertEqual(self.rows(), [0, 2, 3])
+
+    def test_reopen(self):
+        """Rows survive closing the store, and a table of another layout is replaced."""
+
+        self.store.put('key', 'value')
+        self.store.close()
+        self.assertEqual(self.open().get('key'), ('value', None))
+
+        with sqlite3.connect(self.path) as db:
+            db.execute("DROP TABLE things")
+            db.execute("CREATE TABLE things (key PRIMARY KEY, reply TEXT)")
+        self.assertIsNone(self.open().get('key'))
+
+    def test_clear_and_purge(self):
+        """clear() drops everything, purge() the expired rows."""
+
+        self.store.put('old', 1, 10.0)
+        self.store.put('new', 2, 20.0)
+        self.store.put('forever', 3)
+        self.store.purge(15.0)
+        self.assertEqual(self.rows(), ['forever', 'new'])
+        self.store.clear()
+        self.assertEqual(self.rows(), [])
+
+    def test_closed(self):
+        """A closed store ignores writes and finds nothing."""
+
+        self.store.close()
+        self.store.put('key', 'value')
+        self.assertIsNone(self.store.get('key'))
+        self.assertIsNone(self.store.find('name', 'One'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Test the incremental JSON parsing of stream.py."""
+
+import json
+import random
+import unittest
+from unittest import mock
+
+import stream
+from stream import iter_records
+
+
+def split(data, size):
+    """Return `data` in chunks of `size` bytes."""
+
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class IterRecordsTest(unittest.TestCase):
+    """Test iter_records() without ijson, whatever the chunk boundaries are."""
+
+    REPLY = {
+        'id': 27,
+        'name': 'Sol',
+        'bodyCount': 40,
+        'distance': -0.000123,
+        'bodies': [
+            {'name': 'Sol', 'distanceToArrival': 0, 'solarMasses': 1.0},
+            {'name': 'Mercury', 'distanceToArrival': 193.4, 'earthMasses': 5.5e-2},
+            {'name': 'Lüna', 'orbitalEccentricity': -25000000000.0, 'rings': [{'name': 'A'}]},
+        ],
+        'url': 'https://www.edsm.net/',
+    }
+
+    def setUp(self):
+        """Use the raw_decode parser, even when ijson is installed."""
+
+        patcher = mock.patch.object(stream, 'ijson', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_records_and_header(self):
+        """Records of `path` are yielded, scalar top level members end up in the header."""
+
+        data = json.dumps(self.REPLY, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 3, 7, 64, len(data)):
+            header = dict()
+            records = list(iter_records(split(data, size), 'bodies', header=header))
+            self.assertEqual(records, self.REPLY['bodies'], size)
+            self.assertEqual(header, dict((key, value) for (key, value) in self.REPLY.items() if key != 'bodies'))
+
+    def test_fields(self):
+        """Only the requested fields are kept."""
+
+        data = json.dumps(self.REPLY).encode('utf-8')
+        records = list(iter_records(split(data, 5), 'bodies', fields=['name', 'rings']))
+        self.assertEqual(records, [{'name': 'Sol'}, {'name': 'Mercury'}, {'name': 'Lüna', 'rings': [{'name': 'A'}]}])
+
+    def test_array_document(self):
+        """Without a path the document itself is the array."""
+
+        values = [0.000123, -25000000000.0, 1e-07, 12, True, None, 'x', {'a': -1.5e3}]
+        data = json.dumps(values).encode('utf-8')
+        for size in range(1, 8):
+            self.assertEqual(list(iter_records(split(data, size))), values, size)
+
+    def test_numbers_across_chunks(self):
+        """Numbers cut by a chunk boundary are not decoded early."""
+
+        rand = random.Random(42)
+        numbers = [0.000123, -25000000000.0, 1.5e-10, -7, 10, 3.25]
+        for _ in range(300):
+            values = [rand.choice(numbers) for _ in range(rand.randint(1, 5))]
+            data = json.dumps({'bodyCount': rand.choice(numbers), 'bodies': values}).encode('utf-8')
+            cuts = sorted(rand.sample(range(1, len(data)), rand.randint(1, min(8, len(data) - 1))))
+            chunks = [data[start:end] for (start, end) in zip([0] + cuts, cuts + [len(data)])]
+            self.assertEqual(list(iter_records(chunks, 'bodies')), values, chunks)
+
+    def test_unknown_system(self):
+        """EDSM replies `[]` for an unknown system."""
+
+        self.assertEqual(list(iter_records([b'[]'], 'bodies')), [])
+        self.assertEqual(list(iter_records([b'{}'], 'bodies')), [])
+
+    def test_invalid(self):
+        """Broken documents raise ValueError."""
+
+        with self.assertRaises(ValueError):
+            list(iter_records([b'{"bodies": [1, 2'], 'bodies'))
+        with self.assertRaises(ValueError):
+            list(iter_records([b'[1 2]']))
+
+
+@unittest.skipIf(stream.ijson is None, "ijson is not installed")
+class IterRecordsIjsonTest(unittest.TestCase):
+    """Test iter_records() with ijson."""
+
+    def test_records_and_header(self):
+        """The same records and header are found with ijson."""
+
+        data = json.dumps(IterRecordsTest.REPLY).encode('utf-8')
+        header = dict()
+        records = list(iter_records(split(data, 3), 'bodies', header=header))
+        self.assertEqual(records, IterRecordsTest.REPLY['bodies'])
+        self.assertEqual(header['name'], 'Sol')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Test the subscriptions to EDSM replies."""
+
+import unittest
+
+from subscriptions import Subscription, SubscriptionRegistry
+
+
+def request(api, endpoint, **request_params):
+    """Return a GET request tuple."""
+
+    return api, endpoint, 'GET', request_params
+
+
+class SubscriptionRegistryTest(unittest.TestCase):
+    """Test matching replies to subscriptions."""
+
+    def setUp(self):
+        """Create an empty registry."""
+
+        self.registry = SubscriptionRegistry()
+
+    def add(self, api, endpoint, request_filter=None):
+        """Register a subscription with a dummy callback."""
+
+        return self.registry.add(Subscription(api, endpoint, print, request_filter))
+
+    def test_more_specific_first(self):
+        """Endpoint subscriptions come before api and catch-all ones."""
+
+        everything = self.add(None, None)
+        api = self.add('api-v1', None)
+        endpoint = self.add('api-v1', 'system')
+        self.add('api-system-v1', 'bodies')
+        self.assertEqual(self.registry.matching(request('api-v1', 'system')), [endpoint, api, everything])
+        self.assertEqual(self.registry.matching(request('api-v1', 'systems')), [api, everything])
+
+    def test_dict_filter(self):
+        """Dict filters compare request parameters as strings."""
+
+        sol = self.add('api-v1', 'system', {'systemName': 'Sol', 'showId': 1})
+        self.assertEqual(self.registry.matching(request('api-v1', 'system', systemName='Sol', showId='1')), [sol])
+        self.assertEqual(self.registry.matching(request('api-v1', 'system', systemName='Sol')), [])
+        self.assertEqual(self.registry.matching(request('api-v1', 'system', systemName='Achenar', showId=1)), [])
+
+    def test_callable_filter(self):
+        """Callable filters receive the request parameters."""
+
+        named = self.add('api-v1', 'system', lambda params: params.get('systemName', '').startswith('S'))
+        self.assertEqual(self.registry.matching(request('api-v1', 'system', systemName='Sol')), [named])
+        self.assertEqual(self.registry.matching(request('api-v1', 'system', systemName='Achenar')), [])
+
+    def test_remove(self):
+        """Removed subscriptions no longer match, removing twice returns False."""
+
+        first = self.add('api-v1', 'system')
+        second = self.add('api-v1', 'system')
+        self.assertTrue(self.registry.remove(first))
+        self.assertFalse(self.registry.remove(first))
+        self.assertEqual(self.registry.matching(request('api-v1', 'system')), [second])
+        self.assertTrue(self.registry.remove(second))
+        self.assertEqual(self.registry.matching(request('api-v1', 'system')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
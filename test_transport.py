@@ -0,0 +1,86 @@
+"""Test the pooled HTTP transport."""
+
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from transport import Transport
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Reply `{}` over a connection kept alive."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        """Reply with an empty JSON object."""
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        """Keep the test output clean."""
+
+
+class TransportTest(unittest.TestCase):
+    """Test connection reuse and its metrics against a stub server."""
+
+    def setUp(self):
+        """Start the stub server and a transport to it."""
+
+        self.server = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{port}'.format(port=self.server.server_port)
+        self.transport = Transport(self.url, pool_size=1)
+        self.addCleanup(self.transport.close)
+
+    def get(self):
+        """Perform a request through the transport."""
+
+        response = self.transport.request('GET', self.url + '/api-status-v1/elite-server', timeout=5)
+        self.assertEqual(response.json(), {})
+
+    def test_connections_reused(self):
+        """Requests share one kept alive connection."""
+
+        for _ in range(3):
+            self.get()
+        stats = self.transport.stats()
+        self.assertEqual((stats['requests'], stats['connections'], stats['reused']), (3, 1, 2))
+        self.assertEqual((stats['idle_resets'], stats['pool_size']), (0, 1))
+
+    def test_idle_connections_dropped(self):
+        """A connection unused for longer than the idle timeout is replaced."""
+
+        self.transport.idleTimeout = 0
+        self.get()
+        self.transport._lastUsed -= 1
+        self.get()
+        stats = self.transport.stats()
+        self.assertEqual((stats['connections'], stats['reused'], stats['idle_resets']), (2, 0, 1))
+
+    def test_resize(self):
+        """Resizing keeps the counts of the replaced pool."""
+
+        self.get()
+        self.transport.resize(4)
+        self.get()
+        stats = self.transport.stats()
+        self.assertEqual((stats['requests'], stats['connections'], stats['pool_size']), (2, 2, 4))
+
+    def test_retry_counts(self):
+        """Only connection failures are retried, and redirects are not capped by a total."""
+
+        retry = self.transport.adapter.max_retries
+        self.assertIsNone(retry.total)
+        self.assertEqual((retry.connect, retry.read, retry.status, retry.redirect), (1, 0, 0, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+HTTP transport for EDSM queries.
+
+Wraps a `requests.Session` whose connection pool is sized to the number of
+workers, so every worker keeps its own TLS connection alive between requests.
+Connections that have been idle longer than EDSM's load balancer keeps them
+open are dropped before the next request instead of failing on it, and a
+connection that can not be (re)established is retried once by urllib3.
+
+Brotli compressed replies are accepted when the brotli (or brotlicffi)
+package is installed, gzip otherwise.
+"""
+import time
+from threading import Lock
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import brotli  # noqa: F401 pylint: disable=unused-import
+    ACCEPT_ENCODING = 'br, gzip, deflate'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401 pylint: disable=unused-import
+        ACCEPT_ENCODING = 'br, gzip, deflate'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class Transport(object):
+    """A pooled, keep-alive HTTP session for one API host."""
+
+    POOL_SIZE = 2
+    # Seconds after which an unused connection is assumed to be closed by the other side.
+    IDLE_TIMEOUT = 30
+
+    def __init__(self, base_url, pool_size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT, user_agent=None):
+        """Initialize the transport.
+
+        :param base_url: the scheme and host requests are sent to, i.e. 'https://www.edsm.net'.
+        :param pool_size: number of connections kept alive, best matched to the number of workers.
+        :param idle_timeout: seconds a connection may be unused before it is replaced by a new one.
+        :param user_agent: the User-Agent header to send.
+        """
+
+        self.baseUrl = base_url
+        self.poolSize = pool_size
+        self.idleTimeout = idle_timeout
+        self.requests = 0
+        self.connections = 0
+        self.idleResets = 0
+        self.session = Session()
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if user_agent is not None:
+            self.session.headers['User-Agent'] = user_agent
+        self.adapter = None
+        self._lastUsed = None
+        self._lock = Lock()
+        self.resize(pool_size)
+
+    def resize(self, pool_size):
+        """Replace the connection pool by one keeping `pool_size` connections alive."""
+
+        with self._lock:
+            self.poolSize = max(1, int(pool_size))
+            previous = self.adapter
+            self.adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.poolSize,
+                pool_block=False,
+                max_retries=self._retry(),
+            )
+            self.session.mount(self.baseUrl, self.adapter)
+            if previous is not None:
+                self._count_connections(previous)
+                previous.close()
+
+    @staticmethod
+    def _retry():
+        """Return the urllib3 retry settings for connections that turned out to be stale.
+
+        Only a failure to (re)connect is retried. Read timeouts and HTTP errors are left to the
+        caller's retry policy, so a slow EDSM does not cost two timeouts per attempt. There is no
+        total, which would also cap the redirects followed.
+        """
+
+        return Retry(total=None, connect=1, read=0, status=0, other=0, redirect=3, raise_on_status=False)
+
+    def request(self, method, url, **kwargs):
+        """Perform a request on the pooled session, see `requests.Session.request`."""
+
+        now = time.monotonic()
+        with self._lock:
+            if self._lastUsed is not None and now - self._lastUsed > self.idleTimeout:
+                self._clear_idle()
+            self._lastUsed = now
+            self.requests += 1
+
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            with self._lock:
+                self._lastUsed = time.monotonic()
+
+    def _clear_idle(self):
+        """Drop pooled connections the load balancer has most likely closed by now."""
+
+        self._count_connections(self.adapter)
+        self.adapter.poolmanager.clear()
+        self.idleResets += 1
+
+    def _count_connections(self, adapter):
+        """Add the connections opened by the pools of `adapter` before they are discarded."""
+
+        for pool in self._pools(adapter):
+            self.connections += pool.num_connections
+            pool.num_connections = 0
+
+    @staticmethod
+    def _pools(adapter):
+        pools = adapter.poolmanager.pools
+        with pools.lock:
+            return list(pools._container.values())  # pylint: disable=protected-access
+
+    def stats(self):
+        """Return connection reuse metrics.
+
+        `connections` is the number of connections (and TLS handshakes) made, `reused` the number of
+        requests that went over an already open connection.
+        """
+
+        with self._lock:
+            connections = self.connections + sum(pool.num_connections for pool in self._pools(self.adapter))
+            return {
+                'requests': self.requests,
+                'connections': connections,
+                'reused': max(0, self.requests - connections),
+                'idle_resets': self.idleResets,
+                'pool_size': self.poolSize,
+            }
+
+    def close(self):
+        """Close all pooled connections."""
+
+        with self._lock:
+            self._count_connections(self.adapter)
+            self.session.close()